@@ -10,7 +10,32 @@ import yaml
 import json
 import requests
 import re
-from datetime import datetime
+import sys
+import gzip
+import tempfile
+import stat
+import hashlib
+import concurrent.futures
+import random
+import zlib
+import contextlib
+import fcntl
+import hmac
+import base64
+import socket
+import urllib.parse
+import statistics
+import math
+import difflib
+import resource
+import collections
+import http.client
+import http.server
+import socketserver
+import sqlite3
+import mmap
+from xml.etree import ElementTree
+from datetime import datetime, timedelta
 
 def print_status(message, status, index=None, total=None):
     checkmark = '\u2714'
@@ -785,24 +810,166 @@ def install_common_services():
     if success:
         print_status("Servicios comunes instalados", 0)
 
-def configure_swap():
-    """Configura memoria swap"""
-    print("Configurando memoria swap...")
-    
-    # Verificar si ya existe swap
-    swap_check = subprocess.getoutput('swapon --show')
-    if swap_check:
-        print("Ya existe memoria swap configurada:")
-        print(swap_check)
-        choice = input("¿Quieres reconfigurar el swap? (si/no): ").strip().lower()
-        if choice not in ['si', 's']:
-            return
-    
-    # Obtener tamaño de RAM
-    ram_size = int(subprocess.getoutput("grep MemTotal /proc/meminfo | awk '{print $2}'")) // 1024  # MB
-    swap_size = min(ram_size * 2, 8192)  # 2x RAM o máximo 8GB
-    
-    print(f"RAM detectada: {ram_size} MB")
+def read_meminfo():
+    """Lee /proc/meminfo y devuelve los valores en kB"""
+    meminfo = {}
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            fields = value.split()
+            if fields:
+                meminfo[key] = int(fields[0])
+    return meminfo
+
+def get_cpu_count():
+    """Cuenta los procesadores listados en /proc/cpuinfo"""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            count = sum(1 for line in f if line.startswith('processor'))
+    except OSError:
+        count = 0
+    return count or os.cpu_count() or 1
+
+def read_pressure(resource='memory'):
+    """Lee /proc/pressure/<resource> (PSI); devuelve {} si el kernel no lo soporta"""
+    pressure = {}
+    try:
+        with open(f'/proc/pressure/{resource}', 'r') as f:
+            for line in f:
+                kind, *fields = line.split()
+                pressure[kind] = {k: float(v) for k, v in (field.split('=') for field in fields)}
+    except OSError:
+        pass
+    return pressure
+
+def memory_pressure_snapshot():
+    meminfo = read_meminfo()
+    return {'pressure': read_pressure('memory'), 'MemAvailable': meminfo.get('MemAvailable', 0),
+            'SwapTotal': meminfo.get('SwapTotal', 0), 'SwapFree': meminfo.get('SwapFree', 0)}
+
+def print_memory_pressure_report(before, after):
+    """Muestra un informe antes/después de memoria y presión (PSI)"""
+    print(f"{'':<22}{'Antes':>14}{'Después':>14}")
+    for key in ['MemAvailable', 'SwapTotal', 'SwapFree']:
+        print(f"{key + ' (MB)':<22}{before[key] // 1024:>14}{after[key] // 1024:>14}")
+    if not before['pressure'] or not after['pressure']:
+        print("PSI no disponible (/proc/pressure/memory); requiere kernel 4.20+")
+        return
+    for kind in ['some', 'full']:
+        for field in ['avg10', 'avg60', 'avg300']:
+            label = f"PSI {kind} {field} (%)"
+            print(f"{label:<22}{before['pressure'].get(kind, {}).get(field, 0):>14.2f}"
+                  f"{after['pressure'].get(kind, {}).get(field, 0):>14.2f}")
+
+def ensure_fstab_entry(device, line, fstab_path='/etc/fstab'):
+    """Agrega o reemplaza la línea de fstab de un dispositivo (sin duplicados)"""
+    with open(fstab_path, 'r') as f:
+        lines = f.read().splitlines()
+    new_lines = []
+    replaced = False
+    for existing in lines:
+        fields = existing.split()
+        if fields and not fields[0].startswith('#') and fields[0] == device:
+            if not replaced:
+                new_lines.append(line)
+                replaced = True
+            continue
+        new_lines.append(existing)
+    if not replaced:
+        new_lines.append(line)
+    if new_lines != lines:
+        with open(fstab_path, 'w') as f:
+            f.write('\n'.join(new_lines) + '\n')
+    return new_lines != lines
+
+def select_zram_algorithm():
+    """Elige el mejor algoritmo de compresión soportado por zram"""
+    available = []
+    try:
+        with open('/sys/block/zram0/comp_algorithm', 'r') as f:
+            available = f.read().replace('[', '').replace(']', '').split()
+    except OSError:
+        pass
+    for algorithm in ['zstd', 'lz4', 'lzo-rle', 'lzo']:
+        if algorithm in available:
+            return algorithm
+    return available[0] if available else 'lzo'
+
+def zram_swappiness(release=None):
+    """swappiness para zram: los kernels anteriores a 5.8 no aceptan valores por encima de 100"""
+    match = re.match(r'(\d+)\.(\d+)', release or os.uname().release)
+    return 150 if match and (int(match.group(1)), int(match.group(2))) >= (5, 8) else 100
+
+def configure_zram_swap(ram_mb, cpu_count):
+    """Configura swap comprimido en RAM con un dispositivo zram por CPU (máx. 8)"""
+    if not run_command('sudo modprobe zram'):
+        print_status("El kernel no tiene el módulo zram", 1)
+        return False
+
+    devices = min(cpu_count, 8)
+    total_mb = ram_mb // 2
+    custom_size = input(f"Tamaño total de zram en MB (Enter para {total_mb}, 50% de la RAM): ").strip()
+    if custom_size.isdigit() and int(custom_size) > 0:
+        total_mb = int(custom_size)
+    device_mb = max(total_mb // devices, 64)
+    algorithm = select_zram_algorithm()
+    print(f"zram: {devices} dispositivos x {device_mb} MB, compresión {algorithm}, prioridad 100")
+
+    zram_script = f"""#!/bin/sh
+# Generado por menu.py: swap comprimido en RAM (zram)
+DEVICES={devices}
+SIZE_MB={device_mb}
+ALGORITHM={algorithm}
+PRIORITY=100
+
+for dev in /dev/zram*; do
+    swapoff "$dev" 2>/dev/null
+done
+[ "$1" = "stop" ] && exec modprobe -r zram
+modprobe -r zram 2>/dev/null
+modprobe zram num_devices=$DEVICES || exit 1
+i=0
+while [ $i -lt $DEVICES ]; do
+    echo $ALGORITHM > /sys/block/zram$i/comp_algorithm
+    echo ${{SIZE_MB}}M > /sys/block/zram$i/disksize
+    mkswap /dev/zram$i > /dev/null
+    swapon -p $PRIORITY /dev/zram$i
+    i=$((i + 1))
+done
+"""
+    zram_unit = """[Unit]
+Description=Swap comprimido en RAM (zram)
+After=local-fs.target
+
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart=/usr/local/sbin/zram-swap.sh
+ExecStop=/usr/local/sbin/zram-swap.sh stop
+
+[Install]
+WantedBy=multi-user.target
+"""
+    # Con zram el swap es barato: se prefiere swapear antes que descartar caché
+    zram_sysctl = f"""# Generado por menu.py para swap en zram
+vm.swappiness = {zram_swappiness()}
+vm.page-cluster = 0
+"""
+    with open('/usr/local/sbin/zram-swap.sh', 'w') as f:
+        f.write(zram_script)
+    os.chmod('/usr/local/sbin/zram-swap.sh', 0o755)
+    with open('/etc/systemd/system/zram-swap.service', 'w') as f:
+        f.write(zram_unit)
+    with open('/etc/sysctl.d/99-zram.conf', 'w') as f:
+        f.write(zram_sysctl)
+
+    return (run_command('sudo systemctl daemon-reload') and run_command('sudo systemctl enable zram-swap')
+            and run_command('sudo systemctl restart zram-swap')
+            and run_command('sudo sysctl -p /etc/sysctl.d/99-zram.conf'))
+
+def configure_disk_swap(ram_mb):
+    """Crea /swapfile con prioridad menor que zram"""
+    swap_size = min(ram_mb * 2, 8192)  # 2x RAM o máximo 8GB
     print(f"Tamaño de swap recomendado: {swap_size} MB")
     
     custom_size = input(f"Ingrese el tamaño del swap en MB (Enter para {swap_size}): ").strip()
@@ -813,30 +980,79 @@ def configure_swap():
             print("Tamaño inválido, usando valor por defecto")
     
     commands = [
+        'sudo swapoff /swapfile 2>/dev/null; sudo rm -f /swapfile',
         f'sudo fallocate -l {swap_size}M /swapfile',
         'sudo chmod 600 /swapfile',
         'sudo mkswap /swapfile',
-        'sudo swapon /swapfile',
-        'echo "/swapfile none swap sw 0 0" | sudo tee -a /etc/fstab'
+        'sudo swapon -p 10 /swapfile'
     ]
     
-    success = True
     for command in commands:
         if not run_command(command):
-            success = False
-            break
+            return False
+    ensure_fstab_entry('/swapfile', '/swapfile none swap sw,pri=10 0 0')
+    print_status(f"Swap en disco configurado ({swap_size} MB)", 0)
+    return True
+
+def configure_swap():
+    """Configura memoria swap en disco o comprimida en RAM (zram)"""
+    print("Configurando memoria swap...")
+    
+    # Verificar si ya existe swap
+    swap_check = subprocess.getoutput('swapon --show')
+    if swap_check:
+        print("Ya existe memoria swap configurada:")
+        print(swap_check)
+        choice = input("¿Quieres reconfigurar el swap? (si/no): ").strip().lower()
+        if choice not in ['si', 's']:
+            return
+    
+    ram_mb = read_meminfo()['MemTotal'] // 1024
+    cpu_count = get_cpu_count()
+    print(f"RAM detectada: {ram_mb} MB, CPUs: {cpu_count}")
+    print("Modos disponibles:")
+    print("1. Swap en disco (/swapfile)")
+    print("2. Swap comprimido en RAM (zram), recomendado en VMs con disco lento")
+    print("3. Ambos (zram con prioridad sobre el disco)")
+    mode = input("Seleccione un modo [1-3]: ").strip()
+    
+    before = memory_pressure_snapshot()
+    success = True
+    if mode in ['2', '3']:
+        success = configure_zram_swap(ram_mb, cpu_count)
+        print_status("Swap zram configurado", 0 if success else 1)
+    if mode in ['1', '3'] and success:
+        success = configure_disk_swap(ram_mb)
+    elif mode not in ['1', '2', '3']:
+        print("Opción inválida.")
+        return
     
     if success:
-        print_status(f"Swap configurado ({swap_size} MB)", 0)
+        print(subprocess.getoutput('swapon --show'))
+        # Los promedios PSI son de 10/60/300 s: medir justo después del cambio no muestra su efecto
+        settle = input("Segundos de espera antes de medir la presión de memoria [60]: ").strip()
+        settle = int(settle) if settle.isdigit() else 60
+        while True:
+            print(f"Esperando {settle}s para que se estabilicen los promedios PSI...")
+            time.sleep(settle)
+            print_memory_pressure_report(before, memory_pressure_snapshot())
+            if input("¿Volver a medir (compara otra vez con el estado anterior al cambio)? (si/no): ").strip().lower() != 'si':
+                break
     else:
         print_status("Error al configurar swap", 1)
 
-def optimize_system():
-    """Optimiza el sistema"""
-    print("Optimizando sistema...")
-    
-    # Optimizar parámetros del kernel
-    sysctl_config = """# Optimizaciones del sistema
+TUNING_SYSCTL_DROPIN = "/etc/sysctl.d/90-menu-tuning.conf"
+TUNING_LIMITS_DROPIN = "/etc/security/limits.d/90-menu-tuning.conf"
+TUNING_STATE_DIR = "/var/lib/menu_scripts"
+TUNING_ROLLBACK_FILE = f"{TUNING_STATE_DIR}/tuning-rollback.json"
+TUNING_PROFILES = {
+    'web': "Servidor web / proxy (muchas conexiones cortas)",
+    'database': "Base de datos (MySQL/MariaDB/PostgreSQL)",
+    'docker': "Host de contenedores Docker",
+    'elasticsearch': "Nodo Elasticsearch"
+}
+# Bloques que optimize_system agregaba en cada ejecución antes de usar drop-ins
+LEGACY_SYSCTL_BLOCK = """# Optimizaciones del sistema
 vm.swappiness = 10
 vm.dirty_ratio = 15
 vm.dirty_background_ratio = 5
@@ -849,15 +1065,7 @@ net.ipv4.tcp_max_tw_buckets = 2000000
 net.ipv4.tcp_tw_reuse = 1
 net.ipv4.ip_local_port_range = 1024 65535
 """
-    
-    with open('/etc/sysctl.conf', 'a') as f:
-        f.write(sysctl_config)
-    
-    if run_command('sudo sysctl -p'):
-        print_status("Parámetros del kernel optimizados", 0)
-    
-    # Optimizar límites del sistema
-    limits_config = """# Límites del sistema optimizados
+LEGACY_LIMITS_BLOCK = """# Límites del sistema optimizados
 * soft nofile 65535
 * hard nofile 65535
 * soft nproc 65535
@@ -865,14 +1073,885 @@ net.ipv4.ip_local_port_range = 1024 65535
 root soft nofile 65535
 root hard nofile 65535
 """
+LEGACY_TUNING_FILES = [('/etc/sysctl.conf', LEGACY_SYSCTL_BLOCK), ('/etc/security/limits.conf', LEGACY_LIMITS_BLOCK)]
+
+def detect_storage_type():
+    """Devuelve 'hdd', 'ssd' o 'nvme' según los discos físicos (el peor caso)"""
+    types = []
+    for name in os.listdir('/sys/block') if os.path.isdir('/sys/block') else []:
+        if name.startswith(('loop', 'ram', 'zram', 'dm-', 'sr', 'md')):
+            continue
+        try:
+            with open(f'/sys/block/{name}/queue/rotational', 'r') as f:
+                rotational = f.read().strip() == '1'
+        except OSError:
+            continue
+        types.append('hdd' if rotational else 'nvme' if name.startswith('nvme') else 'ssd')
+    for storage in ['hdd', 'ssd', 'nvme']:
+        if storage in types:
+            return storage
+    return 'ssd'
+
+def detect_nic_speed():
+    """Velocidad en Mb/s de la interfaz física más rápida (None si no se informa)"""
+    speeds = []
+    for iface in list_interfaces():
+        if not os.path.exists(f'/sys/class/net/{iface}/device'):
+            continue
+        try:
+            with open(f'/sys/class/net/{iface}/speed', 'r') as f:
+                speed = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if speed > 0:
+            speeds.append(speed)
+    return max(speeds) if speeds else None
+
+def detect_hardware():
+    return {
+        'ram_mb': read_meminfo()['MemTotal'] // 1024,
+        'cpus': get_cpu_count(),
+        'nic_speed_mbps': detect_nic_speed(),
+        'storage': detect_storage_type()
+    }
+
+def compute_tuning_profile(profile, hardware):
+    """Calcula los valores de sysctl y límites para un perfil y el hardware detectado"""
+    ram_mb = hardware['ram_mb']
+    ram_bytes = ram_mb * 1024 * 1024
+    nic_speed = hardware['nic_speed_mbps'] or 1000
+    storage = hardware['storage']
+
+    # Buffers TCP para el producto ancho de banda x retardo (~50 ms), sin superar 1/64 de la RAM
+    socket_buffer = nic_speed * 125000 // 20
+    socket_buffer = max(16 * 1024 * 1024, min(socket_buffer, 128 * 1024 * 1024))
+    socket_buffer = max(4 * 1024 * 1024, min(socket_buffer, ram_bytes // 64))
+    backlog = 250000 if nic_speed >= 10000 else 16384 if nic_speed >= 1000 else 5000
+    somaxconn = 65535 if profile in ['web', 'docker'] else 4096
+
+    # Escritura diferida acotada en bytes: con mucha RAM un ratio produce ráfagas enormes
+    writeback = {'hdd': 64, 'ssd': 256, 'nvme': 512}[storage] * 1024 * 1024
+    dirty_background = min(writeback, ram_bytes // 20)
+
+    sysctl = {
+        'net.core.somaxconn': somaxconn,
+        'net.core.netdev_max_backlog': backlog,
+        'net.core.rmem_max': socket_buffer,
+        'net.core.wmem_max': socket_buffer,
+        'net.ipv4.tcp_rmem': f"4096 131072 {socket_buffer}",
+        'net.ipv4.tcp_wmem': f"4096 16384 {socket_buffer}",
+        'net.ipv4.tcp_max_syn_backlog': somaxconn,
+        'net.ipv4.tcp_slow_start_after_idle': 0,
+        'vm.dirty_background_bytes': dirty_background,
+        'vm.dirty_bytes': dirty_background * 4,
+        'vm.swappiness': 1 if profile in ['database', 'elasticsearch'] else 10,
+        'fs.file-max': max(2097152, ram_mb * 256),
+    }
+    if profile in ['web', 'docker']:
+        sysctl.update({
+            'net.ipv4.ip_local_port_range': "1024 65535",
+            'net.ipv4.tcp_tw_reuse': 1,
+            'net.ipv4.tcp_fin_timeout': 15,
+            'net.ipv4.tcp_max_tw_buckets': min(2000000, ram_mb * 256),
+        })
+        try:
+            with open('/proc/sys/net/ipv4/tcp_available_congestion_control', 'r') as f:
+                if 'bbr' in f.read().split():
+                    sysctl['net.core.default_qdisc'] = 'fq'
+                    sysctl['net.ipv4.tcp_congestion_control'] = 'bbr'
+        except OSError:
+            pass
+    if profile in ['database', 'elasticsearch']:
+        # Reserva de memoria libre para evitar bloqueos de asignación bajo carga (máx. 1 GB)
+        sysctl['vm.min_free_kbytes'] = max(65536, min(ram_mb * 1024 // 100, 1048576))
+        sysctl['vm.zone_reclaim_mode'] = 0
+    if profile == 'docker':
+        sysctl.update({
+            'net.ipv4.ip_forward': 1,
+            'fs.inotify.max_user_watches': 524288,
+            'fs.inotify.max_user_instances': 8192,
+            'kernel.pid_max': 4194304,
+            'vm.max_map_count': 262144,
+        })
+    if profile == 'elasticsearch':
+        sysctl['vm.max_map_count'] = 262144
+    # Límites superiores: nunca reducir un valor que el kernel ya tiene más alto
+    for key in ['fs.file-max', 'vm.min_free_kbytes', 'vm.max_map_count', 'kernel.pid_max',
+                'fs.inotify.max_user_watches', 'fs.inotify.max_user_instances']:
+        live = read_live_sysctl(key)
+        if key in sysctl and live and live.isdigit() and int(live) > sysctl[key]:
+            sysctl[key] = int(live)
+    # El swap en zram necesita una swappiness alta; su drop-in (99-zram) tiene prioridad
+    if os.path.exists('/etc/sysctl.d/99-zram.conf'):
+        sysctl.pop('vm.swappiness')
+
+    nofile = 1048576 if profile in ['docker', 'elasticsearch'] else 65535
+    limits = [
+        ('*', 'nofile', nofile), ('root', 'nofile', nofile),
+        ('*', 'nproc', 65535),
+    ]
+    if profile == 'elasticsearch':
+        # Solo para el usuario del servicio: con pocas CPUs 4096*cpus bajaría el límite de todos
+        limits.append(('elasticsearch', 'nproc', max(4096 * max(1, hardware['cpus']), 65535)))
+    if profile in ['database', 'elasticsearch']:
+        limits.append(('*', 'memlock', 'unlimited'))
+    return sysctl, limits
+
+def read_live_sysctl(key):
+    try:
+        with open(f"/proc/sys/{key.replace('.', '/')}", 'r') as f:
+            return ' '.join(f.read().split())
+    except OSError:
+        return None
+
+def write_live_sysctl(key, value):
+    with open(f"/proc/sys/{key.replace('.', '/')}", 'w') as f:
+        f.write(str(value))
+
+def render_tuning_dropins(profile, hardware, sysctl, limits):
+    nic = f"{hardware['nic_speed_mbps']} Mb/s" if hardware['nic_speed_mbps'] else "desconocida"
+    header = (f"# Generado por menu.py - perfil '{profile}'\n"
+              f"# RAM {hardware['ram_mb']} MB, {hardware['cpus']} CPUs, red {nic}, disco {hardware['storage']}\n")
+    sysctl_text = header + ''.join(f"{key} = {value}\n" for key, value in sysctl.items())
+    limits_text = header + ''.join(f"{domain} {kind} {item} {value}\n"
+                                   for domain, item, value in limits for kind in ['soft', 'hard'])
+    return sysctl_text, limits_text
+
+def print_tuning_diff(sysctl):
+    """Muestra los valores propuestos frente a los valores activos del kernel"""
+    changes = 0
+    print(f"{'Parámetro':<40}{'Actual':>22}  {'Propuesto':>22}")
+    for key, value in sysctl.items():
+        live = read_live_sysctl(key)
+        proposed = ' '.join(str(value).split())
+        mark = ' ' if live == proposed else '*'
+        if live != proposed:
+            changes += 1
+        print(f"{mark}{key:<39}{live if live is not None else 'n/d':>22}  {proposed:>22}")
+    print(f"{changes} parámetros cambiarían (marcados con *)")
+    return changes
+
+def remove_legacy_tuning_blocks():
+    """Elimina los bloques duplicados que agregaba la versión anterior"""
+    for path, block in LEGACY_TUNING_FILES:
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except OSError:
+            continue
+        if block in content:
+            shutil.copy2(path, f"{path}.menu-bak")
+            with open(path, 'w') as f:
+                f.write(content.replace(block, ''))
+            print_status(f"Bloques antiguos eliminados de {path} (copia en {path}.menu-bak)", 0)
+
+def apply_tuning_profile(profile, hardware=None):
+    """Escribe los drop-ins del perfil, guardando lo necesario para revertir"""
+    hardware = hardware or detect_hardware()
+    sysctl, limits = compute_tuning_profile(profile, hardware)
+    sysctl_text, limits_text = render_tuning_dropins(profile, hardware, sysctl, limits)
+
+    rollback = {'created': datetime.now().isoformat(timespec='seconds'), 'profile': profile,
+                'live': {key: read_live_sysctl(key) for key in sysctl}, 'files': {}}
+    for path in [TUNING_SYSCTL_DROPIN, TUNING_LIMITS_DROPIN]:
+        try:
+            with open(path, 'r') as f:
+                rollback['files'][path] = f.read()
+        except OSError:
+            rollback['files'][path] = None
+    # sysctl.conf y limits.conf se guardan si se les va a quitar el bloque antiguo
+    for path, block in LEGACY_TUNING_FILES:
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except OSError:
+            continue
+        if block in content:
+            rollback['files'][path] = content
+    os.makedirs(TUNING_STATE_DIR, exist_ok=True)
+    with open(TUNING_ROLLBACK_FILE, 'w') as f:
+        json.dump(rollback, f, indent=2)
+
+    remove_legacy_tuning_blocks()
+    with open(TUNING_SYSCTL_DROPIN, 'w') as f:
+        f.write(sysctl_text)
+    os.makedirs(os.path.dirname(TUNING_LIMITS_DROPIN), exist_ok=True)
+    with open(TUNING_LIMITS_DROPIN, 'w') as f:
+        f.write(limits_text)
+    return run_command(f'sudo sysctl -p {TUNING_SYSCTL_DROPIN}')
+
+def rollback_tuning_profile():
+    """Restaura los valores activos y los drop-ins previos a la última aplicación"""
+    try:
+        with open(TUNING_ROLLBACK_FILE, 'r') as f:
+            rollback = json.load(f)
+    except (OSError, ValueError):
+        print_status("No hay una optimización previa para revertir", 1)
+        return False
+
+    for path, content in rollback['files'].items():
+        if content is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            with open(path, 'w') as f:
+                f.write(content)
+    errors = 0
+    for key, value in rollback['live'].items():
+        if value is None:
+            continue
+        try:
+            write_live_sysctl(key, value)
+        except OSError:
+            errors += 1
+    os.remove(TUNING_ROLLBACK_FILE)
+    print_status(f"Perfil '{rollback['profile']}' revertido ({rollback['created']})", 1 if errors else 0)
+    return errors == 0
+
+BENCHMARK_DIR = f"{TUNING_STATE_DIR}/benchmarks"
+
+def bench_tcp_connect(duration=0.5):
+    """Conexiones TCP por segundo en loopback (el servidor cierra primero)"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(4096)
+    address = server.getsockname()
+    stop = threading.Event()
+
+    def accept_loop():
+        while not stop.is_set():
+            conn, _ = server.accept()
+            conn.close()
+
+    thread = threading.Thread(target=accept_loop, daemon=True)
+    thread.start()
+    count = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        with socket.create_connection(address) as client:
+            client.recv(1)
+        count += 1
+    elapsed = time.perf_counter() - started
+    stop.set()
+    socket.create_connection(address).close()
+    thread.join()
+    server.close()
+    return count / elapsed
+
+def bench_tcp_throughput(duration=0.5):
+    """Throughput TCP en loopback en MB/s"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    received = [0]
+
+    def receive():
+        conn, _ = server.accept()
+        buffer = bytearray(1024 * 1024)
+        with conn:
+            while True:
+                n = conn.recv_into(buffer)
+                if not n:
+                    break
+                received[0] += n
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+    payload = b'\0' * (1024 * 1024)
+    with socket.create_connection(server.getsockname()) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        while time.perf_counter() < deadline:
+            client.sendall(payload)
+        client.shutdown(socket.SHUT_WR)
+        thread.join()
+        elapsed = time.perf_counter() - started
+    server.close()
+    return received[0] / elapsed / (1024 * 1024)
+
+def bench_fsync(scratch_dir, writes=100):
+    """Latencia de write(4 KB) + fsync en un archivo temporal; devuelve (media, p99) en ms"""
+    latencies = []
+    fd, path = tempfile.mkstemp(dir=scratch_dir, prefix='bench_fsync_')
+    try:
+        block = b'\0' * 4096
+        for _ in range(writes):
+            started = time.perf_counter()
+            os.write(fd, block)
+            os.fsync(fd)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        os.close(fd)
+        os.remove(path)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+def bench_small_files(scratch_dir, count=2000):
+    """Archivos pequeños creados y consultados (stat) por segundo"""
+    work_dir = tempfile.mkdtemp(dir=scratch_dir, prefix='bench_files_')
+    data = b'x' * 1024
+    try:
+        started = time.perf_counter()
+        for i in range(count):
+            with open(os.path.join(work_dir, f"f{i}"), 'wb') as f:
+                f.write(data)
+        create_rate = count / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for i in range(count):
+            os.stat(os.path.join(work_dir, f"f{i}"))
+        stat_rate = count / (time.perf_counter() - started)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return create_rate, stat_rate
+
+def bench_memory_bandwidth(size_mb=64, rounds=4):
+    """Ancho de banda de copia en memoria en GB/s (lectura + escritura)"""
+    source = bytearray(size_mb * 1024 * 1024)
+    target = bytearray(size_mb * 1024 * 1024)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        target[:] = source
+    elapsed = time.perf_counter() - started
+    return 2 * rounds * len(source) / elapsed / (1024 ** 3)
+
+def run_benchmark_suite(label, repeats=5, scratch_dir='/var/tmp'):
+    """Ejecuta todas las pruebas varias veces y guarda media y desviación en JSON"""
+    # (nombre, unidad, mayor es mejor)
+    metrics = {
+        'tcp_connect_rate': ('conex/s', True),
+        'tcp_throughput': ('MB/s', True),
+        'fsync_latency_mean': ('ms', False),
+        'fsync_latency_p99': ('ms', False),
+        'file_create_rate': ('arch/s', True),
+        'file_stat_rate': ('stat/s', True),
+        'memory_bandwidth': ('GB/s', True),
+    }
+    samples = {name: [] for name in metrics}
+    for run in range(1, repeats + 1):
+        print(f"Benchmark '{label}': ronda {run}/{repeats}...", end='\r')
+        samples['tcp_connect_rate'].append(bench_tcp_connect())
+        samples['tcp_throughput'].append(bench_tcp_throughput())
+        fsync_mean, fsync_p99 = bench_fsync(scratch_dir)
+        samples['fsync_latency_mean'].append(fsync_mean)
+        samples['fsync_latency_p99'].append(fsync_p99)
+        create_rate, stat_rate = bench_small_files(scratch_dir)
+        samples['file_create_rate'].append(create_rate)
+        samples['file_stat_rate'].append(stat_rate)
+        samples['memory_bandwidth'].append(bench_memory_bandwidth())
+    print()
+
+    results = {
+        'label': label,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'hostname': socket.gethostname(),
+        'kernel': os.uname().release,
+        'hardware': detect_hardware(),
+        'metrics': {}
+    }
+    for name, (unit, higher_is_better) in metrics.items():
+        values = samples[name]
+        results['metrics'][name] = {
+            'unit': unit, 'higher_is_better': higher_is_better, 'samples': values,
+            'mean': statistics.mean(values), 'stdev': statistics.stdev(values) if len(values) > 1 else 0.0
+        }
+
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    path = os.path.join(BENCHMARK_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{label}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    results['path'] = path
+    return results
+
+def print_benchmark_comparison(before, after):
+    """Tabla antes/después; un cambio es significativo si supera la suma de desviaciones"""
+    print(f"{'Métrica':<22}{'Antes':>20}{'Después':>20}{'Cambio':>10}")
+    for name, old in before['metrics'].items():
+        new = after['metrics'].get(name)
+        if not new:
+            continue
+        change = (new['mean'] - old['mean']) / old['mean'] * 100 if old['mean'] else 0.0
+        improved = change > 0 if old['higher_is_better'] else change < 0
+        significant = abs(new['mean'] - old['mean']) > old['stdev'] + new['stdev']
+        verdict = ('mejor' if improved else 'peor') if significant else 'ruido'
+        print(f"{name:<22}{old['mean']:>11.2f} ±{old['stdev']:>7.2f}{new['mean']:>11.2f} ±{new['stdev']:>7.2f}"
+              f"{change:>+9.1f}%  {verdict} ({old['unit']})")
+
+def benchmark_menu():
+    """Ejecuta el benchmark o compara dos resultados guardados"""
+    print("1. Ejecutar benchmark y guardar resultados")
+    print("2. Comparar dos resultados guardados")
+    choice = input("Seleccione una opción [1-2]: ").strip()
+    if choice == '1':
+        label = input("Etiqueta del resultado [manual]: ").strip() or 'manual'
+        results = run_benchmark_suite(label)
+        for name, metric in results['metrics'].items():
+            print(f"{name:<22}{metric['mean']:>11.2f} ±{metric['stdev']:>7.2f} {metric['unit']}")
+        print_status(f"Resultados guardados en {results['path']}", 0)
+    elif choice == '2':
+        files = sorted(os.listdir(BENCHMARK_DIR)) if os.path.isdir(BENCHMARK_DIR) else []
+        if len(files) < 2:
+            print("Se necesitan al menos dos resultados guardados.")
+            return
+        for idx, name in enumerate(files, start=1):
+            print(f"{idx}. {name}")
+        first = input("Resultado 'antes' por número: ").strip()
+        second = input("Resultado 'después' por número: ").strip()
+        if not (first.isdigit() and second.isdigit() and 1 <= int(first) <= len(files) and 1 <= int(second) <= len(files)):
+            print("Selección inválida.")
+            return
+        with open(os.path.join(BENCHMARK_DIR, files[int(first) - 1]), 'r') as f:
+            before = json.load(f)
+        with open(os.path.join(BENCHMARK_DIR, files[int(second) - 1]), 'r') as f:
+            after = json.load(f)
+        print_benchmark_comparison(before, after)
+    else:
+        print("Opción inválida.")
+
+def optimize_system():
+    """Ajusta el kernel según el hardware detectado y un perfil de carga"""
+    print("Optimizando sistema...")
+    hardware = detect_hardware()
+    nic = f"{hardware['nic_speed_mbps']} Mb/s" if hardware['nic_speed_mbps'] else "desconocida"
+    print(f"Hardware detectado: RAM {hardware['ram_mb']} MB, {hardware['cpus']} CPUs, "
+          f"red {nic}, almacenamiento {hardware['storage']}")
     
-    with open('/etc/security/limits.conf', 'a') as f:
-        f.write(limits_config)
+    profiles = list(TUNING_PROFILES)
+    for idx, profile in enumerate(profiles, start=1):
+        print(f"{idx}. Perfil {profile}: {TUNING_PROFILES[profile]}")
+    print(f"{len(profiles) + 1}. Revertir la última optimización")
+    print(f"{len(profiles) + 2}. Benchmark del sistema (ejecutar o comparar)")
+    choice = input(f"Seleccione una opción [1-{len(profiles) + 2}]: ").strip()
+    if choice == str(len(profiles) + 1):
+        rollback_tuning_profile()
+        return
+    if choice == str(len(profiles) + 2):
+        benchmark_menu()
+        return
+    if not choice.isdigit() or not 1 <= int(choice) <= len(profiles):
+        print("Opción inválida.")
+        return
+    profile = profiles[int(choice) - 1]
+    
+    sysctl, limits = compute_tuning_profile(profile, hardware)
+    changes = print_tuning_diff(sysctl)
+    print("Límites (limits.d): " + ', '.join(f"{domain} {item}={value}" for domain, item, value in limits))
+    if not changes:
+        print("Los valores activos ya coinciden con el perfil.")
+    if input("¿Aplicar el perfil? (si/no): ").strip().lower() not in ['si', 's']:
+        return
+    benchmark = input("¿Medir con el benchmark antes y después? (si/no): ").strip().lower() in ['si', 's']
     
-    print_status("Límites del sistema optimizados", 0)
+    before = run_benchmark_suite(f"antes-{profile}") if benchmark else None
+    if apply_tuning_profile(profile, hardware):
+        print_status(f"Perfil '{profile}' aplicado en {TUNING_SYSCTL_DROPIN}", 0)
+        print_status(f"Límites del sistema escritos en {TUNING_LIMITS_DROPIN}", 0)
+    else:
+        print_status("Error al aplicar parámetros del kernel", 1)
+    if before:
+        after = run_benchmark_suite(f"despues-{profile}")
+        print_benchmark_comparison(before, after)
+        print(f"Resultados guardados en {before['path']} y {after['path']}")
+
+METRICS_INTERVAL = 1.0
+METRICS_HISTORY_SIZE = 600  # Muestras retenidas en el buffer circular (10 minutos a 1 s)
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+
+def read_cpu_counters():
+    """Lee los jiffies agregados de /proc/stat: (ocupados, iowait, total)"""
+    with open('/proc/stat', 'r') as f:
+        fields = [int(value) for value in f.readline().split()[1:9]]
+    # user nice system idle iowait irq softirq steal
+    return sum(fields) - fields[3] - fields[4], fields[4], sum(fields)
+
+def read_disk_counters():
+    """Lee /proc/diskstats de los discos completos: (sectores leídos, sectores escritos, ms de E/S)"""
+    whole_disks = set(os.listdir('/sys/block'))
+    counters = {}
+    with open('/proc/diskstats', 'r') as f:
+        for line in f:
+            fields = line.split()
+            name = fields[2]
+            if name in whole_disks and not name.startswith(('loop', 'ram')):
+                counters[name] = (int(fields[5]), int(fields[9]), int(fields[12]))
+    return counters
+
+def read_net_counters():
+    """Lee /proc/net/dev: (bytes recibidos, bytes enviados) por interfaz, sin loopback"""
+    counters = {}
+    with open('/proc/net/dev', 'r') as f:
+        for line in itertools.islice(f, 2, None):
+            name, _, data = line.partition(':')
+            name = name.strip()
+            fields = data.split()
+            if name != 'lo' and len(fields) >= 9:
+                counters[name] = (int(fields[0]), int(fields[8]))
+    return counters
+
+def read_host_counters():
+    """Toma una lectura de los contadores acumulados del host"""
+    return {'time': time.monotonic(), 'cpu': read_cpu_counters(), 'disks': read_disk_counters(),
+            'net': read_net_counters(), 'meminfo': read_meminfo()}
+
+def compute_host_rates(prev, cur):
+    """Calcula las tasas entre dos lecturas consecutivas de contadores"""
+    elapsed = max(cur['time'] - prev['time'], 1e-6)
+    busy, iowait, total = (max(c - p, 0) for c, p in zip(cur['cpu'], prev['cpu']))
+    total = total or 1
+    disks = {}
+    for name, (read, written, io_ms) in cur['disks'].items():
+        if name in prev['disks']:
+            prev_read, prev_written, prev_io_ms = prev['disks'][name]
+            disks[name] = {'read_bps': max(read - prev_read, 0) * 512 / elapsed,
+                           'write_bps': max(written - prev_written, 0) * 512 / elapsed,
+                           'util': min(max(io_ms - prev_io_ms, 0) / (elapsed * 10), 100.0)}
+    net = {}
+    for name, (rx, tx) in cur['net'].items():
+        if name in prev['net']:
+            prev_rx, prev_tx = prev['net'][name]
+            net[name] = {'rx_bps': max(rx - prev_rx, 0) / elapsed, 'tx_bps': max(tx - prev_tx, 0) / elapsed}
+    meminfo = cur['meminfo']
+    return {'timestamp': time.time(), 'cpu': busy * 100.0 / total, 'iowait': iowait * 100.0 / total,
+            'mem_total_kb': meminfo.get('MemTotal', 0), 'mem_available_kb': meminfo.get('MemAvailable', 0),
+            'swap_used_kb': meminfo.get('SwapTotal', 0) - meminfo.get('SwapFree', 0),
+            'disks': disks, 'net': net}
+
+def run_metrics_collector(history, stop_event, interval=METRICS_INTERVAL):
+    """Muestrea los contadores a intervalo fijo y agrega las tasas al buffer circular"""
+    # thread_time (Python 3.7+) mide solo este hilo; process_time es una cota superior
+    cpu_clock = getattr(time, 'thread_time', time.process_time)
+    prev = read_host_counters()
+    next_tick = time.monotonic()
+    while True:
+        next_tick += interval
+        if next_tick < time.monotonic() - interval:
+            next_tick = time.monotonic()
+        if stop_event.wait(max(next_tick - time.monotonic(), 0)):
+            break
+        cpu_start = cpu_clock()
+        cur = read_host_counters()
+        sample = compute_host_rates(prev, cur)
+        sample['collector_cpu'] = cpu_clock() - cpu_start
+        history.append(sample)
+        prev = cur
+
+def start_metrics_collector(interval=METRICS_INTERVAL, history_size=METRICS_HISTORY_SIZE):
+    """Arranca el colector en un hilo; devuelve (historial, evento de parada)"""
+    history = collections.deque(maxlen=history_size)
+    stop_event = threading.Event()
+    threading.Thread(target=run_metrics_collector, args=(history, stop_event, interval), daemon=True).start()
+    return history, stop_event
+
+def collector_overhead(samples, interval=METRICS_INTERVAL):
+    """Porcentaje de una CPU consumido por el colector en las muestras dadas"""
+    if not samples:
+        return 0.0
+    return sum(sample['collector_cpu'] for sample in samples) * 100.0 / (len(samples) * interval)
+
+def sparkline(values, maximum=None, width=60):
+    """Dibuja una serie como una línea de bloques Unicode"""
+    values = list(values)[-width:]
+    if not values:
+        return ''
+    top = maximum or max(values) or 1
+    steps = len(SPARKLINE_CHARS) - 1
+    return ''.join(SPARKLINE_CHARS[min(int(value * steps / top), steps)] for value in values)
+
+def render_metrics_dashboard(samples, interval=METRICS_INTERVAL):
+    """Genera el texto de la vista combinada a partir del historial"""
+    sample = samples[-1]
+    mem_total = sample['mem_total_kb'] or 1
+    mem_used = mem_total - sample['mem_available_kb']
+    lines = [
+        f"Monitoreo del host - {datetime.fromtimestamp(sample['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}"
+        f" (intervalo {interval:g}s, {len(samples)} muestras, Ctrl+C para salir)",
+        "",
+        f"CPU     {sample['cpu']:5.1f}%  iowait {sample['iowait']:5.1f}%",
+        f"        {sparkline((s['cpu'] for s in samples), 100)}",
+        f"Memoria {mem_used * 100.0 / mem_total:5.1f}%  usada {format_bytes(mem_used * 1024)} de "
+        f"{format_bytes(mem_total * 1024)}, swap usada {format_bytes(sample['swap_used_kb'] * 1024)}",
+        f"        {sparkline(((mem_total - s['mem_available_kb']) * 100.0 / mem_total for s in samples), 100)}",
+        "",
+        f"{'Disco':<14}{'Lectura/s':>14}{'Escritura/s':>14}{'Uso':>8}",
+    ]
+    for name, disk in sorted(sample['disks'].items()):
+        lines.append(f"{name:<14}{format_bytes(disk['read_bps']):>14}{format_bytes(disk['write_bps']):>14}"
+                     f"{disk['util']:>7.1f}%")
+    lines += ["", f"{'Interfaz':<14}{'Recibido/s':>14}{'Enviado/s':>14}"]
+    for name, net in sorted(sample['net'].items()):
+        lines.append(f"{name:<14}{format_bytes(net['rx_bps']):>14}{format_bytes(net['tx_bps']):>14}")
+    lines += ["", f"Overhead del colector: {collector_overhead(samples, interval):.3f}% de una CPU"]
+    return '\n'.join(lines)
+
+def metrics_dashboard(interval=METRICS_INTERVAL):
+    """Muestra la vista en vivo hasta que se pulse Ctrl+C"""
+    history, stop_event = start_metrics_collector(interval)
+    try:
+        while True:
+            time.sleep(interval)
+            samples = list(history)
+            if samples:
+                sys.stdout.write('\033[H\033[J' + render_metrics_dashboard(samples, interval) + '\n')
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        stop_event.set()
+
+def measure_metrics_collector_overhead(duration=30, interval=METRICS_INTERVAL):
+    """Ejecuta el colector sin vista durante `duration` segundos e informa su consumo de CPU"""
+    print(f"Midiendo el colector durante {duration}s a intervalo {interval:g}s...")
+    history, stop_event = start_metrics_collector(interval)
+    time.sleep(duration)
+    stop_event.set()
+    samples = list(history)
+    if not samples:
+        print_status("El colector no obtuvo muestras", 1)
+        return None
+    overhead = collector_overhead(samples, interval)
+    per_sample_ms = sum(sample['collector_cpu'] for sample in samples) * 1000 / len(samples)
+    print(f"Muestras: {len(samples)}, CPU por muestra: {per_sample_ms:.3f} ms")
+    print_status(f"Overhead del colector: {overhead:.3f}% de una CPU (objetivo < 1%)", 0 if overhead < 1 else 1)
+    return overhead
+
+EXPORTER_CONFIG = "/etc/menu_scripts/metrics-exporter.json"
+EXPORTER_DEFAULTS = {
+    'address': '127.0.0.1',  # Solo local por defecto; 0.0.0.0 para que lo lea un Prometheus remoto
+    'port': 9105,
+    'interval': 5.0,  # Segundos entre muestras del hilo de fondo
+}
+# Servicio -> (unidades systemd, nombres de proceso en /proc/<pid>/comm)
+EXPORTER_SERVICES = {
+    'docker': (['docker'], ['dockerd']),
+    'nginx': (['nginx'], ['nginx']),
+    'mysql': (['mysql', 'mariadb', 'mysqld'], ['mysqld', 'mariadbd']),
+    'fail2ban': (['fail2ban'], ['fail2ban-server']),
+    'smbd': (['smbd'], ['smbd']),
+    'nfs-kernel-server': (['nfs-kernel-server', 'nfs-server'], ['nfsd']),
+}
+SYSTEMD_UNIT_DIRS = ['/etc/systemd/system', '/lib/systemd/system', '/usr/lib/systemd/system']
+
+def running_process_names():
+    """Devuelve los nombres (comm) de todos los procesos leyendo /proc"""
+    names = set()
+    for pid in os.listdir('/proc'):
+        if pid.isdigit():
+            try:
+                with open(f'/proc/{pid}/comm', 'r') as f:
+                    names.add(f.read().strip())
+            except OSError:
+                pass
+    return names
+
+def read_service_health():
+    """Estado de los servicios conocidos sin invocar systemctl: {servicio: (instalado, activo)}"""
+    processes = running_process_names()
+    health = {}
+    for service, (units, names) in EXPORTER_SERVICES.items():
+        installed = any(os.path.exists(os.path.join(unit_dir, f'{unit}.service'))
+                        for unit_dir in SYSTEMD_UNIT_DIRS for unit in units)
+        health[service] = (installed, any(name in processes for name in names))
+    return health
+
+def prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_family(lines, name, kind, help_text, samples):
+    """Agrega una familia de métricas en formato de texto de Prometheus"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{key}="{prometheus_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+
+def build_prometheus_metrics():
+    """Toma una muestra del host y los servicios y la devuelve en formato Prometheus"""
+    started = time.monotonic()
+    counters = read_host_counters()
+    health = read_service_health()
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    busy, iowait, total = counters['cpu']
+    meminfo = counters['meminfo']
+    lines = []
+    prometheus_family(lines, 'menu_cpu_seconds_total', 'counter', 'Tiempo de CPU acumulado por modo',
+                      [({'mode': mode}, value / clock_ticks)
+                       for mode, value in [('busy', busy), ('iowait', iowait), ('idle', total - busy - iowait)]])
+    prometheus_family(lines, 'menu_cpu_count', 'gauge', 'Número de CPUs', [({}, get_cpu_count())])
+    prometheus_family(lines, 'menu_load_average', 'gauge', 'Carga media del sistema',
+                      [({'period': period}, value) for period, value in zip(['1m', '5m', '15m'], os.getloadavg())])
+    prometheus_family(lines, 'menu_memory_bytes', 'gauge', 'Memoria según /proc/meminfo',
+                      [({'type': key}, meminfo.get(key, 0) * 1024)
+                       for key in ['MemTotal', 'MemAvailable', 'Cached', 'SReclaimable', 'SwapTotal', 'SwapFree']])
+    pressure = {resource: read_pressure(resource) for resource in ['cpu', 'memory', 'io']}
+    prometheus_family(lines, 'menu_pressure_stall_seconds_total', 'counter', 'Tiempo acumulado de espera por recurso (PSI)',
+                      [({'resource': resource, 'kind': kind}, values['total'] / 1e6)
+                       for resource, data in pressure.items() for kind, values in sorted(data.items())])
+    prometheus_family(lines, 'menu_disk_read_bytes_total', 'counter', 'Bytes leídos por disco',
+                      [({'device': name}, read * 512) for name, (read, _, _) in sorted(counters['disks'].items())])
+    prometheus_family(lines, 'menu_disk_written_bytes_total', 'counter', 'Bytes escritos por disco',
+                      [({'device': name}, written * 512) for name, (_, written, _) in sorted(counters['disks'].items())])
+    prometheus_family(lines, 'menu_disk_io_time_seconds_total', 'counter', 'Tiempo con E/S en curso por disco',
+                      [({'device': name}, io_ms / 1000) for name, (_, _, io_ms) in sorted(counters['disks'].items())])
+    prometheus_family(lines, 'menu_network_receive_bytes_total', 'counter', 'Bytes recibidos por interfaz',
+                      [({'interface': name}, rx) for name, (rx, _) in sorted(counters['net'].items())])
+    prometheus_family(lines, 'menu_network_transmit_bytes_total', 'counter', 'Bytes enviados por interfaz',
+                      [({'interface': name}, tx) for name, (_, tx) in sorted(counters['net'].items())])
+    prometheus_family(lines, 'menu_service_installed', 'gauge', 'Unidad systemd del servicio presente',
+                      [({'service': service}, int(installed)) for service, (installed, _) in health.items()])
+    prometheus_family(lines, 'menu_service_up', 'gauge', 'Proceso del servicio en ejecución',
+                      [({'service': service}, int(running)) for service, (_, running) in health.items()])
+    prometheus_family(lines, 'menu_exporter_sample_timestamp_seconds', 'gauge', 'Momento de la última muestra',
+                      [({}, round(time.time(), 3))])
+    prometheus_family(lines, 'menu_exporter_sample_duration_seconds', 'gauge', 'Duración de la última muestra',
+                      [({}, round(time.monotonic() - started, 6))])
+    return '\n'.join(lines) + '\n'
+
+def exporter_status_metrics(status):
+    """Estado del muestreador: permite alertar si las métricas servidas dejan de actualizarse"""
+    lines = []
+    prometheus_family(lines, 'menu_exporter_last_success_timestamp_seconds', 'gauge',
+                      'Momento de la última muestra correcta', [({}, status['last_success'])])
+    prometheus_family(lines, 'menu_exporter_sample_errors_total', 'counter',
+                      'Muestras fallidas desde el arranque', [({}, status['errors'])])
+    prometheus_family(lines, 'menu_exporter_last_sample_ok', 'gauge',
+                      '1 si la última muestra fue correcta', [({}, int(status['ok']))])
+    return '\n'.join(lines) + '\n'
+
+def run_metrics_exporter_sampler(cache, stop_event, interval):
+    """Refresca en segundo plano el cuerpo que se sirve en cada scrape"""
+    status = {'last_success': 0, 'errors': 0, 'ok': False}
+    metrics = ''
+    while True:
+        started = time.monotonic()
+        try:
+            metrics = build_prometheus_metrics()
+            status.update(last_success=round(time.time(), 3), ok=True)
+        except Exception as e:
+            # Cualquier fallo se registra y se sigue sirviendo la última muestra con el error a la vista;
+            # si el hilo muriera, /metrics respondería para siempre con datos congelados
+            print(f"Error al muestrear métricas: {e!r}")
+            status['errors'] += 1
+            status['ok'] = False
+        body = (metrics + exporter_status_metrics(status)).encode('utf-8')
+        # Se publica un dict nuevo para que los lectores vean cuerpo y gzip consistentes
+        cache['current'] = {'plain': body, 'gzip': gzip.compress(body, 6)}
+        if stop_event.wait(max(interval - (time.monotonic() - started), 0)):
+            break
 
-def install_monitoring_tools():
-    """Instala herramientas de monitoreo"""
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Sirve /metrics desde la caché; nunca lanza procesos ni lee /proc en el scrape"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        current = self.server.metrics_cache.get('current')
+        if current is None:
+            self.send_error(503, 'Sin muestras todavía')
+            return
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = current['gzip'] if use_gzip else current['plain']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def load_metrics_exporter_config(config_path=EXPORTER_CONFIG):
+    config = dict(EXPORTER_DEFAULTS)
+    try:
+        with open(config_path, 'r') as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return config
+
+def start_metrics_exporter(address, port, interval):
+    """Arranca el muestreador y el servidor HTTP en hilos; devuelve (servidor, evento de parada)"""
+    server = MetricsHTTPServer((address, port), MetricsRequestHandler)
+    server.metrics_cache = {}
+    stop_event = threading.Event()
+    threading.Thread(target=run_metrics_exporter_sampler, args=(server.metrics_cache, stop_event, interval),
+                     daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stop_event
+
+def metrics_exporter(config_path=EXPORTER_CONFIG):
+    """Ejecuta el exportador en primer plano (modo servicio)"""
+    config = load_metrics_exporter_config(config_path)
+    server, stop_event = start_metrics_exporter(config['address'], int(config['port']), float(config['interval']))
+    print(f"Exportador de métricas escuchando en {config['address']}:{config['port']}/metrics")
+    try:
+        while True:
+            time.sleep(3600)
+    finally:
+        stop_event.set()
+        server.shutdown()
+
+def install_metrics_exporter():
+    """Instala el exportador Prometheus como servicio systemd"""
+    config = load_metrics_exporter_config()
+    print("Configuración del exportador (Enter para mantener el valor actual):")
+    for key, value in config.items():
+        new_value = input(f"  {key} [{value}]: ").strip()
+        if new_value:
+            try:
+                config[key] = type(EXPORTER_DEFAULTS[key])(new_value)
+            except (ValueError, KeyError):
+                print(f"  Valor inválido para {key}, se mantiene {value}")
+    os.makedirs(os.path.dirname(EXPORTER_CONFIG), exist_ok=True)
+    with open(EXPORTER_CONFIG, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    service = f"""[Unit]
+Description=Exportador de métricas Prometheus de menu_scripts
+After=network-online.target
+
+[Service]
+ExecStart=/usr/bin/python3 {os.path.abspath(__file__)} --metrics-exporter
+Restart=on-failure
+Nice=10
+
+[Install]
+WantedBy=multi-user.target
+"""
+    with open('/etc/systemd/system/menu-metrics-exporter.service', 'w') as f:
+        f.write(service)
+
+    if not (run_command('sudo systemctl daemon-reload') and run_command('sudo systemctl enable --now menu-metrics-exporter')
+            and run_command('sudo systemctl restart menu-metrics-exporter')):
+        print_status("Error al activar el exportador de métricas", 1)
+        return
+    host = '127.0.0.1' if config['address'] in ['0.0.0.0', ''] else config['address']
+    url = f"http://{host}:{config['port']}/metrics"
+    for _ in range(10):
+        time.sleep(1)
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                print_status(f"Exportador activo en {url}", 0)
+                if config['address'] in ['0.0.0.0', '']:
+                    print(f"Recuerde permitir el puerto {config['port']} solo desde el servidor Prometheus (ufw).")
+                return
+        except requests.RequestException:
+            pass
+    print_status(f"El exportador no responde en {url}; revise 'journalctl -u menu-metrics-exporter'", 1)
+
+def install_monitoring_packages():
+    """Instala herramientas de monitoreo externas"""
     print("Instalando herramientas de monitoreo...")
     
     tools = [
@@ -890,134 +1969,2000 @@ def install_monitoring_tools():
     if success:
         print_status("Herramientas de monitoreo instaladas", 0)
 
-def create_docker_compose_template():
-    """Crea plantillas de Docker Compose comunes"""
-    print("Creando plantillas de Docker Compose...")
-    
-    templates = {
-        'nginx': """version: '3.8'
-services:
-  nginx:
-    image: nginx:latest
-    container_name: nginx
-    ports:
-      - "80:80"
-      - "443:443"
-    volumes:
-      - ./nginx.conf:/etc/nginx/nginx.conf
-      - ./ssl:/etc/nginx/ssl
-    restart: unless-stopped
-""",
-        'wordpress': """version: '3.8'
-services:
-  wordpress:
-    image: wordpress:latest
-    container_name: wordpress
-    ports:
-      - "8080:80"
-    environment:
-      WORDPRESS_DB_HOST: db
-      WORDPRESS_DB_USER: wordpress
-      WORDPRESS_DB_PASSWORD: wordpress_password
-      WORDPRESS_DB_NAME: wordpress
-    volumes:
-      - wordpress_data:/var/www/html
-    depends_on:
-      - db
-    restart: unless-stopped
-
-  db:
-    image: mysql:5.7
-    container_name: wordpress_db
-    environment:
-      MYSQL_DATABASE: wordpress
-      MYSQL_USER: wordpress
-      MYSQL_PASSWORD: wordpress_password
-      MYSQL_ROOT_PASSWORD: somewordpress
-    volumes:
-      - db_data:/var/lib/mysql
-    restart: unless-stopped
-
-volumes:
-  wordpress_data:
-  db_data:
-""",
-        'nextcloud': """version: '3.8'
-services:
-  nextcloud:
-    image: nextcloud:latest
-    container_name: nextcloud
-    ports:
-      - "8080:80"
-    environment:
-      MYSQL_HOST: db
-      MYSQL_DATABASE: nextcloud
-      MYSQL_USER: nextcloud
-      MYSQL_PASSWORD: nextcloud_password
-    volumes:
-      - nextcloud_data:/var/www/html
-    depends_on:
-      - db
-    restart: unless-stopped
-
-  db:
-    image: mariadb:10.6
-    container_name: nextcloud_db
-    environment:
-      MYSQL_DATABASE: nextcloud
-      MYSQL_USER: nextcloud
-      MYSQL_PASSWORD: nextcloud_password
-      MYSQL_ROOT_PASSWORD: somewordpress
-    volumes:
-      - db_data:/var/lib/mysql
-    restart: unless-stopped
-
-volumes:
-  nextcloud_data:
-  db_data:
+def install_monitoring_tools():
+    """Monitoreo del sistema: vista en vivo nativa o herramientas externas"""
+    print("1. Vista en vivo de CPU, memoria, disco y red")
+    print("2. Medir el consumo del colector de métricas")
+    print("3. Instalar herramientas de monitoreo (htop, iotop, glances...)")
+    print("4. Instalar exportador de métricas Prometheus")
+    choice = input("Seleccione una opción [1-4]: ").strip()
+    if choice == '1':
+        interval = input(f"Intervalo de muestreo en segundos [{METRICS_INTERVAL:g}]: ").strip()
+        if not re.match(r'^\d+(\.\d+)?$', interval) or float(interval) <= 0:
+            interval = METRICS_INTERVAL
+        metrics_dashboard(float(interval))
+    elif choice == '2':
+        measure_metrics_collector_overhead()
+    elif choice == '3':
+        install_monitoring_packages()
+    elif choice == '4':
+        install_metrics_exporter()
+    else:
+        print("Opción inválida.")
+
+COMPOSE_STACKS = {
+    'nginx': "Nginx como proxy/servidor estático",
+    'wordpress': "WordPress (Apache + mod_php) con MySQL 8.0",
+    'nextcloud': "Nextcloud (Apache + mod_php) con MariaDB 10.11",
+}
+# Peso de cada stack al repartir el presupuesto del host entre los stacks elegidos
+COMPOSE_STACK_WEIGHTS = {'nginx': 1, 'wordpress': 3, 'nextcloud': 4}
+# Puerto HTTP publicado por defecto: distinto por stack para poder desplegarlos juntos
+COMPOSE_HTTP_PORTS = {'wordpress': 8080, 'nextcloud': 8081}
+# Reparto del presupuesto de memoria/CPU del stack entre sus servicios
+COMPOSE_SHARES = {
+    'nginx': {'nginx': 1.0},
+    'wordpress': {'app': 0.55, 'db': 0.45},
+    'nextcloud': {'app': 0.55, 'db': 0.45},
+}
+COMPOSE_REDIS_SHARE = 0.10
+PHP_WORKER_RSS_MB = {'wordpress': 64, 'nextcloud': 96}  # RSS típico de un worker Apache prefork + mod_php
+PHP_MEMORY_LIMIT = {'wordpress': '256M', 'nextcloud': '512M'}
+
+def size_mysql_memory(memory_mb, min_connections=0, pool_ratio=0.6):
+    """Buffer pool (por defecto ~60% de la memoria) y max_connections que caben en el resto"""
+    buffer_pool_mb = max(int(memory_mb * pool_ratio) // 128 * 128, 128)
+    # ~3 MB por conexión (buffers de sort/join/read y pila del hilo) dentro del 90% de la memoria
+    fitting = max(int((memory_mb * 0.9 - buffer_pool_mb) / 3), 30)
+    return {'innodb_buffer_pool_size_mb': buffer_pool_mb,
+            'max_connections': min(max(min_connections + 20, 50), fitting)}
+
+def size_compose_stack(stack, ram_mb, cpus, share=0.75, redis=False):
+    """Límites de memoria (MB) y CPU por servicio a partir del hardware y la fracción asignada"""
+    shares = dict(COMPOSE_SHARES[stack])
+    if redis:
+        shares = {name: value * (1 - COMPOSE_REDIS_SHARE) for name, value in shares.items()}
+        shares['redis'] = COMPOSE_REDIS_SHARE
+    budget_mb, budget_cpus = ram_mb * share, cpus * share
+    sizing = {name: {'memory_mb': max(int(budget_mb * value), 128), 'cpus': max(round(budget_cpus * value, 2), 0.25)}
+              for name, value in shares.items()}
+    if stack == 'nginx':
+        sizing['nginx']['memory_mb'] = min(sizing['nginx']['memory_mb'], 1024)
+    if 'app' in sizing:
+        workers = sizing['app']['memory_mb'] // PHP_WORKER_RSS_MB[stack]
+        sizing['app']['workers'] = min(max(workers, 4), 400)
+    if 'db' in sizing:
+        sizing['db'].update(size_mysql_memory(sizing['db']['memory_mb'], sizing['app']['workers']))
+    return sizing
+
+def split_compose_share(stacks, share):
+    """Reparte la fracción del host entre los stacks elegidos según su peso (la suma no pasa de share)"""
+    total = sum(COMPOSE_STACK_WEIGHTS[stack] for stack in stacks)
+    return {stack: share * COMPOSE_STACK_WEIGHTS[stack] / total for stack in stacks}
+
+def compose_limits(resources):
+    return {'resources': {
+        'limits': {'cpus': str(resources['cpus']), 'memory': f"{resources['memory_mb']}M"},
+        'reservations': {'memory': f"{resources['memory_mb'] // 2}M"},
+    }}
+
+def compose_healthcheck(test, interval='30s', start_period='30s'):
+    return {'test': test, 'interval': interval, 'timeout': '5s', 'retries': 5, 'start_period': start_period}
+
+def apache_prefork_conf(workers):
+    """mpm_prefork dimensionado para que los workers quepan en el límite de memoria"""
+    spare = max(workers // 10, 2)
+    return f"""# Generado por menu.py: MaxRequestWorkers calculado con el límite de memoria del contenedor
+<IfModule mpm_prefork_module>
+    StartServers             {spare}
+    MinSpareServers          {spare}
+    MaxSpareServers          {spare * 2}
+    ServerLimit              {workers}
+    MaxRequestWorkers        {workers}
+    MaxConnectionsPerChild   1000
+</IfModule>
 """
+
+def php_tuning_ini(stack):
+    return f"""; Generado por menu.py
+memory_limit = {PHP_MEMORY_LIMIT[stack]}
+upload_max_filesize = 512M
+post_max_size = 512M
+opcache.enable = 1
+opcache.memory_consumption = 128
+opcache.interned_strings_buffer = 16
+opcache.max_accelerated_files = 20000
+opcache.validate_timestamps = 1
+opcache.revalidate_freq = 60
+"""
+
+def build_compose_stack(stack, sizing, http_port=None, redis=False):
+    """Devuelve (compose, archivos auxiliares, variables .env) para el stack"""
+    if stack == 'nginx':
+        compose = {'services': {'nginx': {
+            'image': 'nginx:stable',
+            'container_name': 'nginx',
+            'ports': ['80:80', '443:443'],
+            'volumes': ['./nginx.conf:/etc/nginx/nginx.conf:ro', './ssl:/etc/nginx/ssl:ro'],
+            'ulimits': {'nofile': {'soft': 65535, 'hard': 65535}},
+            'healthcheck': compose_healthcheck(['CMD', 'nginx', '-t', '-q']),
+            'deploy': compose_limits(sizing['nginx']),
+            'restart': 'unless-stopped',
+        }}}
+        return compose, {}, {}
+
+    network = f"{stack}_network"
+    db = sizing['db']
+    env = {'DB_PASSWORD': base64.urlsafe_b64encode(os.urandom(18)).decode(),
+           'DB_ROOT_PASSWORD': base64.urlsafe_b64encode(os.urandom(18)).decode()}
+    db_command = [f"--innodb-buffer-pool-size={db['innodb_buffer_pool_size_mb']}M",
+                  f"--max-connections={db['max_connections']}",
+                  '--innodb-flush-method=O_DIRECT',
+                  '--tmp-table-size=32M', '--max-heap-table-size=32M']
+    if stack == 'wordpress':
+        db_service = {
+            'image': 'mysql:8.0',
+            'command': db_command + ['--skip-name-resolve'],
+            'environment': {'MYSQL_DATABASE': 'wordpress', 'MYSQL_USER': 'wordpress',
+                            'MYSQL_PASSWORD': '${DB_PASSWORD}', 'MYSQL_ROOT_PASSWORD': '${DB_ROOT_PASSWORD}'},
+            'healthcheck': compose_healthcheck(
+                ['CMD-SHELL', 'mysqladmin ping -h 127.0.0.1 -uroot -p"$$MYSQL_ROOT_PASSWORD" --silent']),
+        }
+        app_service = {
+            'image': 'wordpress:apache',
+            'environment': {'WORDPRESS_DB_HOST': 'db', 'WORDPRESS_DB_USER': 'wordpress',
+                            'WORDPRESS_DB_PASSWORD': '${DB_PASSWORD}', 'WORDPRESS_DB_NAME': 'wordpress'},
+            'volumes': ['wordpress_data:/var/www/html'],
+            'healthcheck': compose_healthcheck(['CMD', 'curl', '-fsS', '-o', '/dev/null', 'http://localhost/']),
+        }
+        if redis:
+            # Requiere el plugin "Redis Object Cache" para activarse dentro de WordPress
+            app_service['environment']['WORDPRESS_CONFIG_EXTRA'] = "define('WP_REDIS_HOST', 'redis');"
+    else:
+        db_service = {
+            'image': 'mariadb:10.11',
+            'command': db_command + ['--transaction-isolation=READ-COMMITTED', '--binlog-format=ROW'],
+            'environment': {'MARIADB_DATABASE': 'nextcloud', 'MARIADB_USER': 'nextcloud',
+                            'MARIADB_PASSWORD': '${DB_PASSWORD}', 'MARIADB_ROOT_PASSWORD': '${DB_ROOT_PASSWORD}'},
+            'healthcheck': compose_healthcheck(['CMD', 'healthcheck.sh', '--connect', '--innodb_initialized']),
+        }
+        app_service = {
+            'image': 'nextcloud:apache',
+            'environment': {'MYSQL_HOST': 'db', 'MYSQL_DATABASE': 'nextcloud', 'MYSQL_USER': 'nextcloud',
+                            'MYSQL_PASSWORD': '${DB_PASSWORD}', 'PHP_MEMORY_LIMIT': PHP_MEMORY_LIMIT[stack],
+                            'PHP_UPLOAD_LIMIT': '512M'},
+            'volumes': ['nextcloud_data:/var/www/html'],
+            'healthcheck': compose_healthcheck(['CMD', 'curl', '-fsS', '-o', '/dev/null', 'http://localhost/status.php'],
+                                               start_period='120s'),
+        }
+        if redis:
+            app_service['environment']['REDIS_HOST'] = 'redis'
+
+    db_service.update({'container_name': f"{stack}_db", 'volumes': ['db_data:/var/lib/mysql'],
+                       'deploy': compose_limits(db), 'restart': 'unless-stopped', 'networks': [network]})
+    app_service['volumes'] += ['./mpm_prefork.conf:/etc/apache2/mods-available/mpm_prefork.conf:ro',
+                               './php-tuning.ini:/usr/local/etc/php/conf.d/zz-tuning.ini:ro']
+    depends_on = {'db': {'condition': 'service_healthy'}}
+    services = {stack: None, 'db': db_service}
+    if redis:
+        redis_mb = sizing['redis']['memory_mb']
+        services['redis'] = {
+            'image': 'redis:7-alpine',
+            'container_name': f"{stack}_redis",
+            # Caché pura: sin persistencia y con expulsión LRU al 80% del límite del contenedor
+            'command': ['redis-server', '--maxmemory', f"{int(redis_mb * 0.8)}mb",
+                        '--maxmemory-policy', 'allkeys-lru', '--save', '', '--appendonly', 'no'],
+            'healthcheck': compose_healthcheck(['CMD', 'redis-cli', 'ping'], '10s', '5s'),
+            'deploy': compose_limits(sizing['redis']),
+            'restart': 'unless-stopped',
+            'networks': [network],
+        }
+        depends_on['redis'] = {'condition': 'service_healthy'}
+    app_service.update({'container_name': stack, 'ports': [f"{http_port or COMPOSE_HTTP_PORTS[stack]}:80"], 'depends_on': depends_on,
+                        'deploy': compose_limits(sizing['app']), 'restart': 'unless-stopped', 'networks': [network]})
+    services[stack] = app_service
+    compose = {
+        'services': services,
+        'volumes': {f"{stack}_data": None, 'db_data': None},
+        'networks': {network: {'driver': 'bridge'}},
     }
-    
-    for name, template in templates.items():
-        filename = f"docker-compose-{name}.yml"
-        with open(filename, 'w') as f:
-            f.write(template)
-        print_status(f"Plantilla {filename} creada", 0)
-    
-    print("Plantillas creadas en el directorio actual")
+    files = {'mpm_prefork.conf': apache_prefork_conf(sizing['app']['workers']), 'php-tuning.ini': php_tuning_ini(stack)}
+    return compose, files, env
+
+def write_compose_stack(stack, output_dir, sizing, http_port=None, redis=False):
+    """Escribe docker-compose.yml, los archivos de ajuste y .env en output_dir/<stack>"""
+    compose, files, env = build_compose_stack(stack, sizing, http_port, redis)
+    stack_dir = os.path.join(output_dir, stack)
+    os.makedirs(stack_dir, exist_ok=True)
+    with open(os.path.join(stack_dir, 'docker-compose.yml'), 'w') as f:
+        f.write(f"# Generado por menu.py el {datetime.now():%Y-%m-%d %H:%M} para este host\n")
+        yaml.safe_dump(compose, f, default_flow_style=False, sort_keys=False)
+    for name, content in files.items():
+        with open(os.path.join(stack_dir, name), 'w') as f:
+            f.write(content)
+    env_path = os.path.join(stack_dir, '.env')
+    if env and not os.path.exists(env_path):
+        # No se sobrescriben contraseñas de un stack ya desplegado
+        with open(os.path.join(stack_dir, '.env'), 'w') as f:
+            f.writelines(f"{key}={value}\n" for key, value in env.items())
+        os.chmod(env_path, 0o600)
+    return stack_dir
+
+def port_in_use(port, host='0.0.0.0'):
+    """True si algún proceso ya escucha en el puerto TCP del host"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return True
+    return False
+
+def prompt_compose_port(stack, taken):
+    """Pide el puerto HTTP del stack; rechaza puertos ocupados en el host o por otro stack"""
+    default = COMPOSE_HTTP_PORTS[stack]
+    while default in taken or port_in_use(default):
+        default += 1
+    while True:
+        port = input(f"Puerto HTTP publicado para {stack} [{default}]: ").strip() or str(default)
+        if not port.isdigit() or not 1 <= int(port) <= 65535:
+            print("Puerto inválido.")
+        elif int(port) in taken:
+            print(f"El puerto {port} ya está asignado a otro stack.")
+        elif port_in_use(int(port)):
+            print(f"El puerto {port} ya está en uso en este host.")
+        else:
+            return int(port)
+
+def create_docker_compose_template():
+    """Genera stacks de Docker Compose dimensionados para este host"""
+    stacks = list(COMPOSE_STACKS)
+    for idx, stack in enumerate(stacks, start=1):
+        print(f"{idx}. {stack}: {COMPOSE_STACKS[stack]}")
+    indexes = parse_selection(input("Stacks a generar (ej. 1,3 o 'todos') [todos]: ").strip() or 'todos', len(stacks))
+    if indexes is None:
+        print("Selección inválida.")
+        return
+    output_dir = input("Directorio destino [.]: ").strip() or '.'
+    share = input("Porcentaje de RAM y CPU del host para el conjunto de stacks [75]: ").strip()
+    share = int(share) / 100 if share.isdigit() and 10 <= int(share) <= 100 else 0.75
+    redis = input("¿Agregar Redis como caché de objetos? (si/no): ").strip().lower() == 'si'
+    selected = [stacks[index] for index in indexes]
+    ports = {}
+    for stack in selected:
+        if stack in COMPOSE_HTTP_PORTS:
+            ports[stack] = prompt_compose_port(stack, set(ports.values()))
+
+    ram_mb = read_meminfo().get('MemTotal', 0) // 1024
+    cpus = get_cpu_count()
+    shares = split_compose_share(selected, share)
+    print(f"Host: {ram_mb} MB de RAM, {cpus} CPUs; los stacks usan en total el {int(share * 100)}%: "
+          + ', '.join(f"{stack} {shares[stack] * 100:.0f}%" for stack in selected))
+    for stack in selected:
+        sizing = size_compose_stack(stack, ram_mb, cpus, shares[stack], redis and stack != 'nginx')
+        stack_dir = write_compose_stack(stack, output_dir, sizing, ports.get(stack), redis and stack != 'nginx')
+        print_status(f"Stack {stack} creado en {stack_dir}/docker-compose.yml", 0)
+        for service, resources in sizing.items():
+            details = f"  {service:<8} {resources['memory_mb']:>6} MB, {resources['cpus']} CPUs"
+            if 'workers' in resources:
+                details += f", {resources['workers']} workers Apache"
+            if 'innodb_buffer_pool_size_mb' in resources:
+                details += f", buffer pool {resources['innodb_buffer_pool_size_mb']} MB, " \
+                           f"max_connections {resources['max_connections']}"
+            print(details)
+    print("Despliegue con: docker compose up -d (las contraseñas generadas están en .env)")
+
+BACKUP_ROOT = "/backup"
+BACKUP_SOURCES = [
+    '/etc/nginx',
+    '/etc/mysql',
+    '/etc/ssh',
+    '/etc/fail2ban',
+    '/etc/ufw',
+    '/var/www'
+]
+BACKUP_MANIFEST = ".manifest.json"
+
+def format_bytes(size):
+    """Formatea un tamaño en bytes con la unidad más adecuada"""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(size) < 1024 or unit == 'TB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} B"
+        size /= 1024
+
+def file_digest(path, algorithm='sha256'):
+    """Calcula el hash de un archivo leyendo en bloques"""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def latest_backup_snapshot(backup_root=BACKUP_ROOT, exclude=None):
+    """Devuelve el snapshot system-* más reciente (excluyendo el actual)"""
+    if not os.path.isdir(backup_root):
+        return None
+    snapshots = sorted(name for name in os.listdir(backup_root)
+                       if name.startswith('system-') and os.path.isdir(os.path.join(backup_root, name)))
+    snapshots = [os.path.join(backup_root, name) for name in snapshots]
+    snapshots = [path for path in snapshots if path != exclude]
+    return snapshots[-1] if snapshots else None
+
+def load_backup_manifest(snapshot_dir):
+    if not snapshot_dir:
+        return {}
+    try:
+        with open(os.path.join(snapshot_dir, BACKUP_MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def snapshot_tree(source, backup_dir, previous_dir=None, previous_manifest=None, check='mtime'):
+    """Copia un árbol al snapshot enlazando (hard link) los archivos sin cambios.
+
+    Un archivo se considera sin cambios si coinciden tamaño, permisos y dueño
+    con el snapshot anterior y además su mtime ('mtime') o su hash ('hash').
+    """
+    stats = {'source': source, 'copied': 0, 'linked': 0, 'bytes_copied': 0,
+             'bytes_linked': 0, 'errors': 0, 'manifest': {}}
+    previous_manifest = previous_manifest or {}
+    directories = []
+
+    for root, dirs, files in os.walk(source):
+        dest_root = f"{backup_dir}{root}"
+        os.makedirs(dest_root, exist_ok=True)
+        directories.append((root, dest_root))
+
+        # os.walk no entra en enlaces simbólicos a directorios: se copian como enlaces
+        for name in [d for d in dirs if os.path.islink(os.path.join(root, d))] + files:
+            src = os.path.join(root, name)
+            dst = os.path.join(dest_root, name)
+            try:
+                st = os.lstat(src)
+                if stat.S_ISLNK(st.st_mode):
+                    os.symlink(os.readlink(src), dst)
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+
+                digest = file_digest(src) if check == 'hash' else None
+                prev = f"{previous_dir}{src}" if previous_dir else None
+                unchanged = False
+                if prev and os.path.isfile(prev) and not os.path.islink(prev):
+                    pst = os.stat(prev)
+                    unchanged = (pst.st_size == st.st_size and pst.st_mode == st.st_mode
+                                 and pst.st_uid == st.st_uid and pst.st_gid == st.st_gid)
+                    if unchanged and check == 'hash':
+                        prev_digest = previous_manifest.get(src, {}).get('sha256') or file_digest(prev)
+                        unchanged = prev_digest == digest
+                    elif unchanged:
+                        unchanged = pst.st_mtime_ns == st.st_mtime_ns
+
+                if unchanged:
+                    os.link(prev, dst)
+                    stats['linked'] += 1
+                    stats['bytes_linked'] += st.st_size
+                else:
+                    shutil.copy2(src, dst, follow_symlinks=False)
+                    os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+                    stats['copied'] += 1
+                    stats['bytes_copied'] += st.st_size
+
+                entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                if digest:
+                    entry['sha256'] = digest
+                stats['manifest'][src] = entry
+            except OSError as e:
+                print(f"Error al respaldar {src}: {e}")
+                stats['errors'] += 1
+
+    # Restaurar permisos y fechas de los directorios después de llenarlos
+    for root, dest_root in reversed(directories):
+        try:
+            shutil.copystat(root, dest_root)
+            st = os.stat(root)
+            os.chown(dest_root, st.st_uid, st.st_gid)
+        except OSError:
+            pass
+    return stats
+
+def snapshot_directories(backup_dir, sources=BACKUP_SOURCES, check='mtime', max_workers=None, backup_root=BACKUP_ROOT):
+    """Crea un snapshot incremental de varios árboles en paralelo"""
+    previous_dir = latest_backup_snapshot(backup_root, exclude=backup_dir)
+    previous_manifest = load_backup_manifest(previous_dir)
+    sources = [path for path in sources if os.path.exists(path)]
+    if previous_dir:
+        print(f"Snapshot anterior: {previous_dir} (comparación por {check})")
+
+    results = []
+    max_workers = max_workers or min(len(sources), os.cpu_count() or 2) or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(snapshot_tree, path, backup_dir, previous_dir, previous_manifest, check): path
+                   for path in sources}
+        for future in concurrent.futures.as_completed(futures):
+            stats = future.result()
+            results.append(stats)
+            print_status(f"Backup de {stats['source']}: {stats['copied']} copiados, "
+                         f"{stats['linked']} enlazados", 1 if stats['errors'] else 0)
+
+    manifest = {}
+    for stats in results:
+        manifest.update(stats.pop('manifest'))
+    with open(os.path.join(backup_dir, BACKUP_MANIFEST), 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    return results
+
+MYSQL_SYSTEM_SCHEMAS = {'information_schema', 'performance_schema', 'sys'}
+# Snapshot consistente (InnoDB) sin bloquear tablas y sin cargar tablas enteras en memoria
+MYSQLDUMP_OPTIONS = ['--single-transaction', '--quick', '--skip-lock-tables',
+                     '--routines', '--triggers', '--events', '--hex-blob']
+# Esquemas con tablas MyISAM/Aria (usuarios, permisos): --single-transaction no los
+# protege, así que se vuelcan aparte con bloqueo de tablas
+MYSQL_LOCKED_SCHEMAS = {'mysql'}
+MYSQLDUMP_LOCKED_OPTIONS = ['--lock-tables', '--quick', '--routines', '--triggers', '--events', '--hex-blob']
+
+def mysqldump_command(database, *extra):
+    options = MYSQLDUMP_LOCKED_OPTIONS if database in MYSQL_LOCKED_SCHEMAS else MYSQLDUMP_OPTIONS
+    return ['mysqldump', *options, *extra, database]
+
+def list_mysql_databases():
+    """Lista las bases de datos de usuario del servidor MySQL/MariaDB local"""
+    result = subprocess.run(['mysql', '-N', '-B', '-e', 'SHOW DATABASES'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        return []
+    return [db for db in result.stdout.split() if db not in MYSQL_SYSTEM_SCHEMAS]
+
+def dump_mysql_database(database, output_dir):
+    """Vuelca una base de datos comprimiendo la salida de mysqldump en streaming"""
+    path = os.path.join(output_dir, f"{database}.sql.gz")
+    tmp_path = f"{path}.tmp"
+    started = time.monotonic()
+    raw_bytes = 0
+    # Se escribe con nombre temporal: un dump a medias nunca queda como <base>.sql.gz
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(mysqldump_command(database), stdout=subprocess.PIPE, stderr=errors)
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as out:
+            for chunk in iter(lambda: process.stdout.read(1024 * 1024), b''):
+                raw_bytes += len(chunk)
+                out.write(chunk)
+        returncode = process.wait()
+        errors.seek(0)
+        error = errors.read().decode(errors='replace').strip()
+    compressed_bytes = os.path.getsize(tmp_path)
+    if returncode == 0:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+    return {
+        'database': database,
+        'ok': returncode == 0,
+        'seconds': round(time.monotonic() - started, 3),
+        'raw_bytes': raw_bytes,
+        'compressed_bytes': compressed_bytes,
+        'file': os.path.basename(path) if returncode == 0 else '',
+        'error': error if returncode != 0 else ''
+    }
+
+def dump_mysql_databases(output_dir, workers=2):
+    """Vuelca cada base de datos por separado y en paralelo"""
+    databases = list_mysql_databases()
+    if not databases:
+        print_status("No se pudieron listar las bases de datos MySQL", 1)
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for result in executor.map(lambda db: dump_mysql_database(db, output_dir), databases):
+            results.append(result)
+            print_status(f"Dump de {result['database']}: {format_bytes(result['raw_bytes'])} -> "
+                         f"{format_bytes(result['compressed_bytes'])} en {result['seconds']:.1f}s",
+                         0 if result['ok'] else 1)
+            if result['error']:
+                print(f"  {result['error']}")
+
+    with open(os.path.join(output_dir, 'dump_report.json'), 'w') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'workers': workers,
+                   'options': MYSQLDUMP_OPTIONS, 'locked_options': MYSQLDUMP_LOCKED_OPTIONS,
+                   'databases': results}, f, indent=2)
+    return results
+
+def restore_mysql_database(dump_path, database):
+    """Restaura una base de datos desde su dump .sql.gz en streaming"""
+    if not run_command(f'mysql -e "CREATE DATABASE IF NOT EXISTS \\`{database}\\`"'):
+        return False
+    process = subprocess.Popen(['mysql', database], stdin=subprocess.PIPE)
+    try:
+        with gzip.open(dump_path, 'rb') as f:
+            shutil.copyfileobj(f, process.stdin, 1024 * 1024)
+    except BrokenPipeError:
+        pass
+    finally:
+        process.stdin.close()
+    return process.wait() == 0
+
+def restore_mysql_database_menu():
+    """Selecciona un snapshot y restaura una sola base de datos"""
+    snapshots = []
+    if os.path.isdir(BACKUP_ROOT):
+        snapshots = sorted(name for name in os.listdir(BACKUP_ROOT)
+                           if os.path.isdir(os.path.join(BACKUP_ROOT, name, 'mysql')))
+    if not snapshots:
+        print("No hay backups con dumps MySQL por base de datos.")
+        return
+    print("Backups disponibles:")
+    for idx, name in enumerate(snapshots, start=1):
+        print(f"{idx}. {name}")
+    choice = input("Seleccione un backup por número: ").strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(snapshots):
+        print("Selección inválida.")
+        return
+    mysql_dir = os.path.join(BACKUP_ROOT, snapshots[int(choice) - 1], 'mysql')
+
+    dumps = sorted(name for name in os.listdir(mysql_dir) if name.endswith('.sql.gz'))
+    print("Bases de datos en el backup:")
+    for idx, name in enumerate(dumps, start=1):
+        size = os.path.getsize(os.path.join(mysql_dir, name))
+        print(f"{idx}. {name[:-len('.sql.gz')]} ({format_bytes(size)})")
+    choice = input("Seleccione una base de datos por número: ").strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(dumps):
+        print("Selección inválida.")
+        return
+    source = dumps[int(choice) - 1][:-len('.sql.gz')]
+    target = input(f"Nombre de la base de datos destino [{source}]: ").strip() or source
+
+    if restore_mysql_database(os.path.join(mysql_dir, dumps[int(choice) - 1]), target):
+        print_status(f"Base de datos {source} restaurada en {target}", 0)
+    else:
+        print_status(f"Error al restaurar {source}", 1)
 
 def backup_system():
-    """Crea un backup del sistema"""
+    """Crea un backup incremental del sistema"""
     print("Creando backup del sistema...")
     
-    backup_dir = f"/backup/system-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-    
-    if run_command(f'sudo mkdir -p {backup_dir}'):
-        # Backup de configuraciones importantes
-        important_dirs = [
-            '/etc/nginx',
-            '/etc/mysql',
-            '/etc/ssh',
-            '/etc/fail2ban',
-            '/etc/ufw',
-            '/var/www'
-        ]
-        
-        for dir_path in important_dirs:
-            if os.path.exists(dir_path):
-                backup_path = f"{backup_dir}{dir_path}"
-                if run_command(f'sudo mkdir -p {os.path.dirname(backup_path)}'):
-                    if run_command(f'sudo cp -r {dir_path} {backup_path}'):
-                        print_status(f"Backup de {dir_path}", 0)
-        
-        # Backup de bases de datos
-        if run_command('which mysql'):
-            if run_command(f'sudo mysqldump --all-databases > {backup_dir}/all_databases.sql'):
-                print_status("Backup de bases de datos MySQL", 0)
-        
-        print_status(f"Backup completado en {backup_dir}", 0)
-    else:
+    backup_dir = f"{BACKUP_ROOT}/system-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    while True:
+        mode = input("Tipo de backup (snapshot con hard links / dedup en almacén por chunks) [snapshot]: ").strip().lower() or 'snapshot'
+        if mode in ['snapshot', 'dedup']:
+            break
+        print("Opción inválida, escriba 'snapshot' o 'dedup'.")
+    workers = input("Número de dumps MySQL en paralelo [2]: ").strip()
+    workers = int(workers) if workers.isdigit() and int(workers) > 0 else 2
+    if mode == 'dedup':
+        create_dedup_snapshot(mysql_workers=workers)
+        return
+
+    check = input("Comparar archivos con el snapshot anterior por (mtime/hash) [mtime]: ").strip().lower() or 'mtime'
+    if check not in ['mtime', 'hash']:
+        print("Opción inválida, usando 'mtime'.")
+        check = 'mtime'
+    
+    try:
+        os.makedirs(backup_dir, exist_ok=True)
+    except OSError:
         print_status("Error al crear directorio de backup", 1)
+        return
+
+    # Backup de configuraciones importantes
+    started = time.monotonic()
+    results = snapshot_directories(backup_dir, check=check)
+    bytes_copied = sum(stats['bytes_copied'] for stats in results)
+    bytes_linked = sum(stats['bytes_linked'] for stats in results)
+    print(f"Archivos: {format_bytes(bytes_copied)} copiados, {format_bytes(bytes_linked)} enlazados "
+          f"sin copiar ({time.monotonic() - started:.1f}s)")
+    
+    # Backup de bases de datos: un dump comprimido por base, en paralelo
+    if run_command('which mysqldump'):
+        results = dump_mysql_databases(os.path.join(backup_dir, 'mysql'), workers)
+        if results and all(result['ok'] for result in results):
+            print_status(f"Backup de {len(results)} bases de datos MySQL", 0)
+    
+    print_status(f"Backup completado en {backup_dir}", 0)
+
+DEDUP_STORE = f"{BACKUP_ROOT}/store"
+# Chunking por contenido (gear hash): mínimo 256 KB, promedio ~1 MB, máximo 4 MB
+CDC_MIN_SIZE = 256 * 1024
+CDC_MAX_SIZE = 4 * 1024 * 1024
+CDC_MASK = ((1 << 20) - 1) << 44
+CDC_GEAR = [random.Random(0x6d656e75 + i).getrandbits(64) for i in range(256)]
+
+def find_cdc_boundary(data, start, end):
+    """Busca el siguiente punto de corte en data[start:end] con un gear hash"""
+    if end - start <= CDC_MIN_SIZE:
+        return end
+    limit = min(end, start + CDC_MAX_SIZE)
+    gear = CDC_GEAR
+    mask = CDC_MASK
+    h = 0
+    # Los primeros CDC_MIN_SIZE bytes no pueden ser corte y no se procesan
+    for offset, byte in enumerate(data[start + CDC_MIN_SIZE:limit], start + CDC_MIN_SIZE):
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+        if not h & mask:
+            return offset + 1
+    return limit
+
+def iter_cdc_chunks(fileobj):
+    """Divide un stream en chunks definidos por su contenido"""
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < CDC_MAX_SIZE:
+            data = fileobj.read(CDC_MAX_SIZE)
+            if not data:
+                eof = True
+            buffer += data
+        if not buffer:
+            return
+        cut = find_cdc_boundary(buffer, 0, len(buffer))
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+def store_chunk(store_dir, chunk):
+    """Guarda un chunk comprimido bajo su sha256; devuelve (hash, bytes nuevos)"""
+    digest = hashlib.sha256(chunk).hexdigest()
+    path = os.path.join(store_dir, 'chunks', digest[:2], digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = zlib.compress(chunk, 6)
+    tmp_path = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest, len(data)
+
+def store_stream(store_dir, fileobj):
+    """Guarda un stream en el almacén; devuelve (chunks, tamaño, bytes nuevos)"""
+    chunks = []
+    size = new_bytes = 0
+    for chunk in iter_cdc_chunks(fileobj):
+        digest, written = store_chunk(store_dir, chunk)
+        chunks.append(digest)
+        size += len(chunk)
+        new_bytes += written
+    return chunks, size, new_bytes
+
+def dedup_store_tree(store_dir, source, previous_files):
+    """Agrega un árbol al almacén; reutiliza los chunks de archivos sin cambios"""
+    files = {}
+    stats = {'source': source, 'files': 0, 'reused': 0, 'bytes_read': 0, 'bytes_new': 0, 'errors': 0}
+    for root, dirs, names in os.walk(source):
+        st = os.lstat(root)
+        files[root] = {'type': 'dir', 'mode': st.st_mode, 'uid': st.st_uid, 'gid': st.st_gid,
+                       'mtime_ns': st.st_mtime_ns}
+        for name in [d for d in dirs if os.path.islink(os.path.join(root, d))] + names:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+                entry = {'mode': st.st_mode, 'uid': st.st_uid, 'gid': st.st_gid, 'mtime_ns': st.st_mtime_ns}
+                if stat.S_ISLNK(st.st_mode):
+                    files[path] = dict(entry, type='symlink', target=os.readlink(path))
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                previous = previous_files.get(path)
+                if (previous and previous.get('type') == 'file' and previous['size'] == st.st_size
+                        and previous['mtime_ns'] == st.st_mtime_ns):
+                    files[path] = dict(entry, type='file', size=st.st_size, chunks=previous['chunks'])
+                    stats['reused'] += 1
+                else:
+                    with open(path, 'rb') as f:
+                        chunks, size, new_bytes = store_stream(store_dir, f)
+                    files[path] = dict(entry, type='file', size=size, chunks=chunks)
+                    stats['bytes_read'] += size
+                    stats['bytes_new'] += new_bytes
+                stats['files'] += 1
+            except OSError as e:
+                print(f"Error al respaldar {path}: {e}")
+                stats['errors'] += 1
+    return files, stats
+
+class HashingReader:
+    """Envuelve un stream y calcula su sha256 a medida que se lee"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+def dedup_store_mysql_dump(store_dir, database, previous=None):
+    """Guarda el dump sin comprimir de una base en el almacén (deduplica entre backups)"""
+    started = time.monotonic()
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(mysqldump_command(database, '--skip-dump-date'),
+                                   stdout=subprocess.PIPE, stderr=errors)
+        # El hash se calcula mientras se trocea: sin copia intermedia del dump en disco
+        reader = HashingReader(process.stdout)
+        chunks, size, new_bytes = store_stream(store_dir, reader)
+        returncode = process.wait()
+        errors.seek(0)
+        error = errors.read().decode(errors='replace').strip()
+    digest = reader.digest.hexdigest()
+    unchanged = bool(returncode == 0 and previous and previous.get('sha256') == digest)
+    entry = {'type': 'file', 'mode': stat.S_IFREG | 0o600, 'uid': 0, 'gid': 0,
+             'mtime_ns': previous['mtime_ns'] if unchanged else int(time.time() * 1e9),
+             'size': size, 'sha256': digest, 'chunks': chunks}
+    return entry, {'database': database, 'ok': returncode == 0, 'seconds': round(time.monotonic() - started, 3),
+                   'raw_bytes': size, 'bytes_new': new_bytes, 'unchanged': unchanged,
+                   'error': error if returncode != 0 else ''}
+
+def list_dedup_snapshots(store_dir=DEDUP_STORE):
+    snapshots_dir = os.path.join(store_dir, 'snapshots')
+    if not os.path.isdir(snapshots_dir):
+        return []
+    return sorted(name[:-len('.json.gz')] for name in os.listdir(snapshots_dir) if name.endswith('.json.gz'))
+
+def load_dedup_manifest(store_dir, snapshot_id):
+    with gzip.open(os.path.join(store_dir, 'snapshots', f"{snapshot_id}.json.gz"), 'rt') as f:
+        return json.load(f)
+
+@contextlib.contextmanager
+def dedup_store_lock(store_dir):
+    """Evita que un backup y la recolección de basura se ejecuten a la vez"""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def create_dedup_snapshot(sources=BACKUP_SOURCES, store_dir=DEDUP_STORE, mysql_workers=0):
+    """Crea un snapshot en el almacén deduplicado y guarda su manifiesto"""
+    snapshot_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    with dedup_store_lock(store_dir):
+        snapshots = list_dedup_snapshots(store_dir)
+        previous_files = load_dedup_manifest(store_dir, snapshots[-1])['files'] if snapshots else {}
+        sources = [path for path in sources if os.path.exists(path)]
+        manifest = {'id': snapshot_id, 'created': datetime.now().isoformat(timespec='seconds'),
+                    'sources': sources, 'files': {}, 'mysql': []}
+        results = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(sources), os.cpu_count() or 2))) as executor:
+            for files, stats in executor.map(lambda path: dedup_store_tree(store_dir, path, previous_files), sources):
+                manifest['files'].update(files)
+                results.append(stats)
+                print_status(f"Backup de {stats['source']}: {stats['files']} archivos "
+                             f"({stats['reused']} sin cambios), {format_bytes(stats['bytes_new'])} nuevos",
+                             1 if stats['errors'] else 0)
+
+        if mysql_workers and shutil.which('mysqldump'):
+            databases = list_mysql_databases()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=mysql_workers) as executor:
+                dumps = executor.map(lambda db: dedup_store_mysql_dump(store_dir, db, previous_files.get(f"/mysql/{db}.sql")),
+                                     databases)
+                for entry, result in dumps:
+                    path = f"/mysql/{result['database']}.sql"
+                    manifest['mysql'].append(result)
+                    if not result['ok']:
+                        # Un dump cortado no entra al manifiesto: se conserva el del snapshot anterior
+                        if path in previous_files:
+                            manifest['files'][path] = previous_files[path]
+                        print_status(f"Dump de {result['database']} fallido; se conserva el anterior"
+                                     if path in previous_files else f"Dump de {result['database']} fallido", 1)
+                        if result['error']:
+                            print(f"  {result['error']}")
+                        continue
+                    manifest['files'][path] = entry
+                    print_status(f"Dump de {result['database']}: {format_bytes(result['raw_bytes'])}, "
+                                 + ("sin cambios" if result['unchanged'] else f"{format_bytes(result['bytes_new'])} nuevos")
+                                 + f" en {result['seconds']:.1f}s", 0)
+
+        os.makedirs(os.path.join(store_dir, 'snapshots'), exist_ok=True)
+        manifest_path = os.path.join(store_dir, 'snapshots', f"{snapshot_id}.json.gz")
+        with gzip.open(f"{manifest_path}.tmp", 'wt') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    total_size = sum(entry.get('size', 0) for entry in manifest['files'].values())
+    bytes_new = sum(stats['bytes_new'] for stats in results) + sum(r['bytes_new'] for r in manifest['mysql'])
+    print(f"Snapshot {snapshot_id}: {format_bytes(total_size)} respaldados, "
+          f"{format_bytes(bytes_new)} nuevos en el almacén")
+    return snapshot_id
+
+def read_dedup_chunk(store_dir, digest):
+    """Lee un chunk del almacén y comprueba que su contenido coincide con su sha256"""
+    with open(os.path.join(store_dir, 'chunks', digest[:2], digest), 'rb') as f:
+        chunk = zlib.decompress(f.read())
+    if hashlib.sha256(chunk).hexdigest() != digest:
+        raise ValueError(f"chunk {digest} corrupto")
+    return chunk
+
+def restore_dedup_snapshot(snapshot_id, target_dir, path=None, store_dir=DEDUP_STORE):
+    """Reconstruye un snapshot completo o una sola ruta en target_dir, chunk a chunk"""
+    files = load_dedup_manifest(store_dir, snapshot_id)['files']
+    path = path.rstrip('/') if path else None
+    selected = sorted(p for p in files if not path or p == path or p.startswith(f"{path}/"))
+    restored = errors = 0
+    for file_path in selected:
+        entry = files[file_path]
+        dest = f"{target_dir.rstrip('/')}{file_path}"
+        try:
+            if entry['type'] == 'dir':
+                if os.path.lexists(dest) and not os.path.isdir(dest):
+                    os.remove(dest)
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            # Se reconstruye en un temporal: un chunk dañado no destruye lo que ya hay en dest
+            tmp_dest = f"{dest}.restore-tmp"
+            if entry['type'] == 'symlink':
+                if os.path.lexists(tmp_dest):
+                    os.remove(tmp_dest)
+                os.symlink(entry['target'], tmp_dest)
+            else:
+                try:
+                    with open(tmp_dest, 'wb') as out:
+                        for digest in entry['chunks']:
+                            out.write(read_dedup_chunk(store_dir, digest))
+                except (OSError, ValueError, zlib.error):
+                    os.remove(tmp_dest)
+                    raise
+            if os.path.isdir(dest) and not os.path.islink(dest):
+                shutil.rmtree(dest)
+            os.replace(tmp_dest, dest)
+            if entry['type'] == 'file':
+                restored += entry['size']
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Error al restaurar {file_path}: {e}")
+            errors += 1
+            continue
+        try:
+            os.chown(dest, entry['uid'], entry['gid'], follow_symlinks=False)
+            if entry['type'] != 'symlink':
+                os.chmod(dest, stat.S_IMODE(entry['mode']))
+                os.utime(dest, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        except OSError:
+            pass
+
+    # Permisos de directorios al final, de más profundo a menos profundo
+    for file_path in reversed(selected):
+        entry = files[file_path]
+        if entry['type'] == 'dir':
+            dest = f"{target_dir.rstrip('/')}{file_path}"
+            try:
+                os.chown(dest, entry['uid'], entry['gid'])
+                os.chmod(dest, stat.S_IMODE(entry['mode']))
+                os.utime(dest, ns=(entry['mtime_ns'], entry['mtime_ns']))
+            except OSError:
+                pass
+    return len(selected) - errors, restored, errors
+
+def gc_dedup_store(keep_last=7, max_age_days=30, store_dir=DEDUP_STORE):
+    """Elimina snapshots expirados y los chunks que ya no referencia ningún manifiesto"""
+    with dedup_store_lock(store_dir):
+        snapshots = list_dedup_snapshots(store_dir)
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y%m%d-%H%M%S')
+        candidates = snapshots[:-keep_last] if keep_last else snapshots
+        expired = [snapshot_id for snapshot_id in candidates if snapshot_id < cutoff]
+        for snapshot_id in expired:
+            os.remove(os.path.join(store_dir, 'snapshots', f"{snapshot_id}.json.gz"))
+
+        referenced = set()
+        for snapshot_id in list_dedup_snapshots(store_dir):
+            for entry in load_dedup_manifest(store_dir, snapshot_id)['files'].values():
+                referenced.update(entry.get('chunks', ()))
+
+        removed = freed = 0
+        chunks_dir = os.path.join(store_dir, 'chunks')
+        for prefix in os.listdir(chunks_dir) if os.path.isdir(chunks_dir) else []:
+            for name in os.listdir(os.path.join(chunks_dir, prefix)):
+                if name not in referenced:
+                    chunk_path = os.path.join(chunks_dir, prefix, name)
+                    freed += os.path.getsize(chunk_path)
+                    os.remove(chunk_path)
+                    removed += 1
+    return expired, removed, freed
+
+def select_dedup_snapshot():
+    snapshots = list_dedup_snapshots()
+    if not snapshots:
+        print("No hay snapshots en el almacén deduplicado.")
+        return None
+    print("Snapshots disponibles:")
+    for idx, snapshot_id in enumerate(snapshots, start=1):
+        print(f"{idx}. {snapshot_id}")
+    choice = input("Seleccione un snapshot por número: ").strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(snapshots):
+        print("Selección inválida.")
+        return None
+    return snapshots[int(choice) - 1]
+
+def restore_dedup_snapshot_menu():
+    """Restaura un snapshot del almacén deduplicado o una sola ruta"""
+    snapshot_id = select_dedup_snapshot()
+    if not snapshot_id:
+        return
+    path = input("Ruta a restaurar (ej. /etc/nginx, Enter para todo el snapshot): ").strip() or None
+    target_dir = input(f"Directorio destino [/tmp/restore-{snapshot_id}] (use / para restaurar en sitio): ").strip() \
+        or f"/tmp/restore-{snapshot_id}"
+    count, restored, errors = restore_dedup_snapshot(snapshot_id, target_dir, path)
+    print_status(f"{count} entradas restauradas ({format_bytes(restored)}) en {target_dir}"
+                 + (f", {errors} con errores" if errors else ""), 0 if count and not errors else 1)
+
+def gc_dedup_store_menu():
+    keep_last = input("Snapshots recientes a conservar siempre [7]: ").strip()
+    max_age = input("Eliminar snapshots con más de N días [30]: ").strip()
+    expired, removed, freed = gc_dedup_store(int(keep_last) if keep_last.isdigit() else 7,
+                                             int(max_age) if max_age.isdigit() else 30)
+    print_status(f"{len(expired)} snapshots eliminados, {removed} chunks liberados ({format_bytes(freed)})", 0)
+
+S3_STATE_DIR = f"{BACKUP_ROOT}/.s3-uploads"
+S3_HASH_CACHE = f"{BACKUP_ROOT}/.s3-hash-cache.json"
+
+def s3_quote(value, safe='-_.~'):
+    return urllib.parse.quote(value, safe=safe)
+
+def s3_request(s3, method, key, params=None, headers=None, data=b'', payload_hash=None):
+    """Envía una petición firmada con AWS Signature V4 (direccionamiento por ruta)"""
+    endpoint = urllib.parse.urlparse(s3['endpoint'])
+    now = datetime.utcnow()
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    scope = f"{now:%Y%m%d}/{s3['region']}/s3/aws4_request"
+    payload_hash = payload_hash or hashlib.sha256(data).hexdigest()
+
+    uri = f"/{s3['bucket']}/{s3_quote(key, safe='/-_.~')}" if key else f"/{s3['bucket']}"
+    query = '&'.join(f"{s3_quote(k)}={s3_quote(str(v))}" for k, v in sorted((params or {}).items()))
+    headers = {k.lower(): str(v) for k, v in (headers or {}).items()}
+    headers.update({'host': endpoint.netloc, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+    signed_headers = ';'.join(sorted(headers))
+    canonical_request = '\n'.join([
+        method, uri, query,
+        ''.join(f"{k}:{headers[k].strip()}\n" for k in sorted(headers)),
+        signed_headers, payload_hash
+    ])
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+    signing_key = f"AWS4{s3['secret_key']}".encode()
+    for part in (f"{now:%Y%m%d}", s3['region'], 's3', 'aws4_request'):
+        signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers['authorization'] = (f"AWS4-HMAC-SHA256 Credential={s3['access_key']}/{scope}, "
+                                f"SignedHeaders={signed_headers}, Signature={signature}")
+
+    url = f"{endpoint.scheme}://{endpoint.netloc}{uri}" + (f"?{query}" if query else '')
+    return s3['session'].request(method, url, headers=headers, data=data, timeout=300)
+
+def s3_xml_elements(element, tag):
+    """Busca elementos por nombre en una respuesta XML de S3 ignorando el namespace"""
+    return [child for child in element.iter() if child.tag.rsplit('}', 1)[-1] == tag]
+
+def s3_xml_values(text, tag):
+    return [element.text for element in s3_xml_elements(ElementTree.fromstring(text), tag)]
+
+def cached_file_digest(path, cache):
+    """sha256 de un archivo, reutilizando el valor si el inodo no cambió"""
+    st = os.stat(path)
+    cache_key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    if cache_key not in cache:
+        cache[cache_key] = file_digest(path)
+    return cache[cache_key]
+
+def s3_put_object(s3, key, path, digest):
+    with open(path, 'rb') as f:
+        data = f.read()
+    response = s3_request(s3, 'PUT', key, data=data, payload_hash='UNSIGNED-PAYLOAD', headers={
+        'content-md5': base64.b64encode(hashlib.md5(data).digest()).decode(),
+        'x-amz-meta-sha256': digest
+    })
+    response.raise_for_status()
+    return len(data)
+
+def s3_upload_part(s3, key, path, upload_id, part_number, part_size, uploaded_etag=None):
+    """Sube una parte; si ya existe con el mismo MD5 (reanudación) no la reenvía"""
+    with open(path, 'rb') as f:
+        f.seek((part_number - 1) * part_size)
+        data = f.read(part_size)
+    md5 = hashlib.md5(data)
+    if uploaded_etag and uploaded_etag.strip('"') == md5.hexdigest():
+        return part_number, uploaded_etag, 0
+    response = s3_request(s3, 'PUT', key, params={'partNumber': part_number, 'uploadId': upload_id},
+                          data=data, payload_hash='UNSIGNED-PAYLOAD',
+                          headers={'content-md5': base64.b64encode(md5.digest()).decode()})
+    response.raise_for_status()
+    return part_number, response.headers['ETag'], len(data)
+
+def s3_list_parts(s3, key, upload_id):
+    """Partes ya subidas {número: ETag}, siguiendo la paginación de ListParts (1000 por página); None si la subida no existe"""
+    parts = {}
+    params = {'uploadId': upload_id}
+    while True:
+        response = s3_request(s3, 'GET', key, params=params)
+        if response.status_code != 200:
+            return None
+        root = ElementTree.fromstring(response.content)
+        for part in s3_xml_elements(root, 'Part'):
+            number = s3_xml_elements(part, 'PartNumber')[0].text
+            parts[int(number)] = s3_xml_elements(part, 'ETag')[0].text
+        truncated = s3_xml_elements(root, 'IsTruncated')
+        marker = s3_xml_elements(root, 'NextPartNumberMarker')
+        if not truncated or truncated[0].text != 'true' or not marker or not marker[0].text:
+            return parts
+        params = {'uploadId': upload_id, 'part-number-marker': marker[0].text}
+
+def s3_abort_multipart(s3, key, upload_id):
+    """AbortMultipartUpload: libera las partes de una subida que no se va a completar (S3 las cobra)"""
+    try:
+        response = s3_request(s3, 'DELETE', key, params={'uploadId': upload_id})
+    except requests.RequestException as e:
+        print(f"No se pudo cancelar la subida {upload_id} de {key}: {e}")
+        return False
+    # 404 NoSuchUpload: la subida ya no existe, no queda nada que liberar
+    if response.status_code not in (204, 404):
+        print(f"No se pudo cancelar la subida {upload_id} de {key}: HTTP {response.status_code}")
+        return False
+    return True
+
+def s3_multipart_upload(s3, key, path, digest, executor):
+    """Subida multipart con partes en paralelo que se puede reanudar tras una interrupción"""
+    size = os.path.getsize(path)
+    part_size = s3['part_size']
+    state_path = os.path.join(S3_STATE_DIR, hashlib.sha1(f"{s3['bucket']}/{key}".encode()).hexdigest() + '.json')
+    state = None
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    uploaded = None
+    if state and state['sha256'] == digest and state['part_size'] == part_size:
+        uploaded = s3_list_parts(s3, key, state['upload_id'])
+    if uploaded is None:
+        if state and state.get('upload_id'):
+            # El archivo cambió o la subida ya no es reanudable: se cancela antes de empezar otra
+            s3_abort_multipart(s3, key, state['upload_id'])
+        state = None
+        uploaded = {}
+
+    if state is None:
+        response = s3_request(s3, 'POST', key, params={'uploads': ''}, headers={'x-amz-meta-sha256': digest})
+        response.raise_for_status()
+        state = {'upload_id': s3_xml_values(response.content, 'UploadId')[0], 'sha256': digest, 'part_size': part_size}
+        os.makedirs(S3_STATE_DIR, exist_ok=True)
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+
+    part_count = max(1, -(-size // part_size))
+    futures = [executor.submit(s3_upload_part, s3, key, path, state['upload_id'], number, part_size, uploaded.get(number))
+               for number in range(1, part_count + 1)]
+    parts = sorted(future.result() for future in futures)
+
+    body = '<CompleteMultipartUpload>' + ''.join(
+        f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag, _ in parts
+    ) + '</CompleteMultipartUpload>'
+    response = s3_request(s3, 'POST', key, params={'uploadId': state['upload_id']}, data=body.encode())
+    response.raise_for_status()
+    if b'<Error>' in response.content:
+        raise requests.HTTPError(f"Error al completar la subida de {key}: {response.text}")
+    os.remove(state_path)
+    return sum(sent for _, _, sent in parts), len(uploaded)
+
+def s3_remote_digest(s3, key):
+    response = s3_request(s3, 'HEAD', key)
+    if response.status_code == 200:
+        return response.headers.get('x-amz-meta-sha256')
+    return None
+
+def offload_to_s3(s3, local_path, prefix=''):
+    """Sube un árbol de backup a un bucket S3 compatible omitiendo objetos ya presentes"""
+    base = os.path.dirname(local_path.rstrip('/'))
+    files = []
+    for root, _, names in os.walk(local_path):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                key = '/'.join(part for part in (prefix.strip('/'), os.path.relpath(path, base)) if part)
+                files.append((key, path))
+
+    try:
+        with open(S3_HASH_CACHE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    stats = {'uploaded': 0, 'skipped': 0, 'vanished': 0, 'resumed_parts': 0, 'errors': 0, 'bytes_sent': 0}
+    started = time.monotonic()
+
+    def upload_small(key, path, digest):
+        if s3_remote_digest(s3, key) == digest:
+            return 'skipped', 0
+        return 'uploaded', s3_put_object(s3, key, path, digest)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=s3['concurrency']) as executor:
+        small = []
+        for key, path in files:
+            try:
+                digest = cached_file_digest(path, cache)
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                # Temporales y dumps rotados pueden desaparecer entre el recorrido y la lectura
+                print_status(f"{key}: ya no existe, se omite", 1)
+                stats['vanished'] += 1
+                continue
+            except OSError as e:
+                print_status(f"Error al leer {key}: {e}", 1)
+                stats['errors'] += 1
+                continue
+            if size <= s3['part_size']:
+                small.append(executor.submit(upload_small, key, path, digest))
+                continue
+            # Archivos grandes de uno en uno: la concurrencia se usa en sus partes
+            try:
+                if s3_remote_digest(s3, key) == digest:
+                    stats['skipped'] += 1
+                    continue
+                file_started = time.monotonic()
+                sent, resumed = s3_multipart_upload(s3, key, path, digest, executor)
+                elapsed = max(time.monotonic() - file_started, 1e-6)
+                print_status(f"{key}: {format_bytes(sent)} en {elapsed:.1f}s ({format_bytes(sent / elapsed)}/s)", 0)
+                stats['uploaded'] += 1
+                stats['bytes_sent'] += sent
+                stats['resumed_parts'] += resumed
+            except (requests.RequestException, OSError) as e:
+                print_status(f"Error al subir {key}: {e}", 1)
+                stats['errors'] += 1
+
+        for future in small:
+            try:
+                result, sent = future.result()
+                stats[result] += 1
+                stats['bytes_sent'] += sent
+            except (requests.RequestException, OSError) as e:
+                print_status(f"Error al subir objeto: {e}", 1)
+                stats['errors'] += 1
+
+    try:
+        with open(S3_HASH_CACHE, 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    stats['seconds'] = round(elapsed, 2)
+    print(f"Subidos: {stats['uploaded']}, omitidos (ya en remoto): {stats['skipped']}, "
+          f"desaparecidos: {stats['vanished']}, partes reanudadas: {stats['resumed_parts']}, errores: {stats['errors']}")
+    print(f"Enviados {format_bytes(stats['bytes_sent'])} en {elapsed:.1f}s "
+          f"({format_bytes(stats['bytes_sent'] / elapsed)}/s)")
+    return stats
+
+def offload_backups_menu():
+    """Envía un backup a un almacenamiento compatible con S3"""
+    latest = latest_backup_snapshot()
+    print("Qué desea enviar:")
+    print(f"1. Último snapshot ({latest or 'no hay'})")
+    print(f"2. Almacén deduplicado ({DEDUP_STORE})")
+    print("3. Otra ruta")
+    choice = input("Seleccione una opción [1-3]: ").strip()
+    local_path = {'1': latest, '2': DEDUP_STORE}.get(choice) or (input("Ruta local: ").strip() if choice == '3' else None)
+    if not local_path or not os.path.isdir(local_path):
+        print("Ruta inválida.")
+        return
+
+    s3 = {
+        'endpoint': input("Endpoint S3 (ej. https://s3.amazonaws.com o http://minio:9000): ").strip().rstrip('/'),
+        'region': input("Región [us-east-1]: ").strip() or 'us-east-1',
+        'bucket': input("Bucket: ").strip(),
+        'access_key': input("Access key [$AWS_ACCESS_KEY_ID]: ").strip() or os.getenv('AWS_ACCESS_KEY_ID', ''),
+        'secret_key': getpass.getpass("Secret key [$AWS_SECRET_ACCESS_KEY]: ") or os.getenv('AWS_SECRET_ACCESS_KEY', ''),
+    }
+    prefix = input(f"Prefijo en el bucket [{socket.gethostname()}]: ").strip() or socket.gethostname()
+    concurrency = input("Subidas en paralelo [4]: ").strip()
+    part_size = input("Tamaño de parte en MB [32]: ").strip()
+    s3['concurrency'] = int(concurrency) if concurrency.isdigit() and int(concurrency) > 0 else 4
+    # S3 exige partes de al menos 5 MB salvo la última
+    s3['part_size'] = max(5, int(part_size) if part_size.isdigit() else 32) * 1024 * 1024
+    s3['session'] = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=s3['concurrency'])
+    s3['session'].mount('http://', adapter)
+    s3['session'].mount('https://', adapter)
+
+    offload_to_s3(s3, local_path, prefix)
+
+def backup_submenu():
+    while True:
+        os.system('clear')
+        print("--------------------------------------------------")
+        print("        Submenú de Backups del Sistema")
+        print("--------------------------------------------------")
+        print("1. Crear backup del sistema")
+        print("2. Restaurar una base de datos MySQL")
+        print("3. Restaurar desde el almacén deduplicado (snapshot o ruta)")
+        print("4. Eliminar snapshots expirados del almacén deduplicado")
+        print("5. Enviar backups a almacenamiento S3 compatible")
+        print("6. Volver al menú principal")
+        print("--------------------------------------------------")
+        backup_choice = input("Seleccione una opción [1-6]: ").strip()
+        if backup_choice == '1':
+            backup_system()
+        elif backup_choice == '2':
+            restore_mysql_database_menu()
+        elif backup_choice == '3':
+            restore_dedup_snapshot_menu()
+        elif backup_choice == '4':
+            gc_dedup_store_menu()
+        elif backup_choice == '5':
+            offload_backups_menu()
+        elif backup_choice == '6':
+            break
+        else:
+            print("Opción inválida! Por favor seleccione una opción válida.")
+        input("Presione [Enter] para continuar...")
+
+ES_CONFIG = "/etc/menu_scripts/elasticsearch.json"
+ES_TARGET_SHARD_GB = 30  # Tamaño objetivo de shard primario (recomendación 10-50 GB)
+ES_SMALL_SHARD_GB = 1
+ES_SHARDS_PER_HEAP_GB = 20  # Regla clásica: como máximo ~20 shards por GB de heap
+ES_HOT_NODE_FACTOR = 1.5
+ES_DATA_ROLES = 'dhwcfs'  # data, data_hot/warm/cold/frozen y data_content en _cat/nodes
+ES_DATE_SUFFIX_RE = re.compile(r'[-_.]?\d{4}(?:[-_.]?\d{2}){1,2}(?:[-_.]\d{2,6})?$|[-_.]?\d{6}$')
+
+def es_connection(interactive=True, config_path=ES_CONFIG):
+    """Conexión a Elasticsearch desde el archivo guardado o preguntando los datos"""
+    config = None
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if interactive and not (config and input(f"¿Usar la conexión guardada a {config['url']}? (si/no): ").strip().lower() == 'si'):
+        use_ssl = input("¿Está utilizando SSL para conectarse a Elasticsearch? (si/no): ").strip().lower()
+        protocol = "https" if use_ssl in ['si', 's'] else "http"
+        es_host = input("Ingrese el host de Elasticsearch (ej. localhost:9200): ").strip()
+        es_user = input("Ingrese el nombre de usuario de Elasticsearch: ").strip()
+        es_password = getpass.getpass("Ingrese la contraseña de Elasticsearch: ")
+        config = {'url': f"{protocol}://{es_host}", 'user': es_user, 'password': es_password, 'verify': False}
+        if input("¿Guardar la conexión para tareas programadas? (si/no): ").strip().lower() == 'si':
+            os.makedirs(os.path.dirname(config_path), exist_ok=True)
+            with open(config_path, 'w') as f:
+                json.dump(config, f, indent=2)
+            os.chmod(config_path, 0o600)
+    if not config:
+        raise OSError(f"No hay conexión a Elasticsearch configurada ({config_path})")
+    session = requests.Session()
+    if config.get('user'):
+        session.auth = (config['user'], config['password'])
+    session.verify = config.get('verify', False)
+    if not session.verify:
+        requests.packages.urllib3.disable_warnings()
+    return {'url': config['url'].rstrip('/'), 'session': session}
+
+def es_request(es, method, path, params=None, body=None, timeout=120):
+    """Petición JSON a Elasticsearch; lanza requests.RequestException si falla"""
+    response = es['session'].request(method, es['url'] + path, params=params, json=body, timeout=timeout)
+    response.raise_for_status()
+    return response.json() if response.content else None
+
+def es_cat(es, endpoint, columns):
+    """_cat/<endpoint> en JSON con tamaños en bytes"""
+    return es_request(es, 'GET', f"/_cat/{endpoint}", {'format': 'json', 'bytes': 'b', 'h': ','.join(columns)})
+
+def index_family(name):
+    """Patrón de un índice sin sufijo de fecha ni de rollover (logs-2024.05.01 -> logs-*)"""
+    family = ES_DATE_SUFFIX_RE.sub('', name)
+    family = re.sub(r'-\d{6}$', '', family)
+    return f"{family}-*" if family != name else name
+
+def es_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def fetch_es_cluster_state(es):
+    """Descarga shards, nodos, asignación e índices como JSON"""
+    return {
+        'shards': es_cat(es, 'shards', ['index', 'prirep', 'state', 'store', 'node']),
+        'nodes': es_cat(es, 'nodes', ['name', 'node.role', 'heap.max', 'heap.percent', 'cpu', 'disk.used_percent']),
+        'allocation': es_cat(es, 'allocation', ['node', 'shards', 'disk.used', 'disk.avail', 'disk.total', 'disk.percent']),
+        'indices': es_cat(es, 'indices', ['index', 'pri', 'rep', 'docs.count', 'store.size', 'pri.store.size', 'status']),
+    }
+
+def shrink_target(primaries, primary_bytes):
+    """Menor número de primarios (divisor del actual, requisito de _shrink) con shards <= objetivo"""
+    for count in range(1, primaries + 1):
+        if primaries % count == 0 and primary_bytes / count <= ES_TARGET_SHARD_GB * 1024 ** 3:
+            return count
+    return primaries
+
+def analyze_es_cluster(state):
+    """Genera recomendaciones de shards, réplicas y nodos a partir del estado descargado"""
+    data_nodes = [node for node in state['nodes'] if set(node.get('node.role') or 'd') & set(ES_DATA_ROLES)]
+    data_node_count = max(len(data_nodes), 1)
+    heap_gb = sum(es_int(node.get('heap.max')) for node in data_nodes) / 1024 ** 3
+    shard_count = len(state['shards'])
+    report = {'summary': {
+        'indices': len(state['indices']), 'shards': shard_count, 'data_nodes': len(data_nodes),
+        'heap_gb': heap_gb, 'shard_budget': int(heap_gb * ES_SHARDS_PER_HEAP_GB),
+        'unassigned': sum(1 for shard in state['shards'] if shard.get('state') == 'UNASSIGNED'),
+    }, 'shrink': [], 'merge': [], 'replicas': [], 'hot_nodes': []}
+
+    families = {}
+    for index in state['indices']:
+        name, primaries, replicas = index['index'], es_int(index.get('pri')), es_int(index.get('rep'))
+        primary_bytes = es_int(index.get('pri.store.size'))
+        if primaries > 1 and primary_bytes / primaries < ES_SMALL_SHARD_GB * 1024 ** 3:
+            target = shrink_target(primaries, primary_bytes)
+            if target < primaries:
+                saved = (primaries - target) * (1 + replicas)
+                report['shrink'].append({'index': name, 'from': primaries, 'to': target, 'shards_saved': saved,
+                                         'temp_disk': primary_bytes})
+        if replicas >= data_node_count:
+            target = data_node_count - 1
+            report['replicas'].append({'index': name, 'from': replicas, 'to': target,
+                                       'shards_saved': (replicas - target) * primaries, 'disk_delta': 0,
+                                       'reason': f"{replicas} réplicas con {data_node_count} nodos de datos: "
+                                                 "las sobrantes nunca se asignan"})
+        elif replicas == 0 and data_node_count > 1 and index.get('status') == 'open':
+            report['replicas'].append({'index': name, 'from': 0, 'to': 1, 'shards_saved': -primaries,
+                                       'disk_delta': primary_bytes, 'reason': "sin réplica: la caída de un nodo pierde datos"})
+        family = index_family(name)
+        if family != name:
+            entry = families.setdefault(family, {'indices': 0, 'shards': 0, 'bytes': 0})
+            entry['indices'] += 1
+            entry['shards'] += primaries * (1 + replicas)
+            entry['bytes'] += primary_bytes
+    for family, entry in families.items():
+        if entry['indices'] >= 5 and entry['bytes'] / entry['indices'] < ES_SMALL_SHARD_GB * 1024 ** 3:
+            target_indices = max(math.ceil(entry['bytes'] / (ES_TARGET_SHARD_GB * 1024 ** 3)), 1)
+            report['merge'].append({'family': family, 'indices': entry['indices'], 'bytes': entry['bytes'],
+                                    'shards_saved': entry['shards'] - target_indices * entry['shards'] // entry['indices'],
+                                    'target_indices': target_indices})
+
+    shards_per_node = {}
+    for shard in state['shards']:
+        if shard.get('node'):
+            shards_per_node[shard['node']] = shards_per_node.get(shard['node'], 0) + 1
+    average = shard_count / data_node_count
+    allocation = {entry.get('node'): entry for entry in state['allocation']}
+    for node in data_nodes:
+        reasons = []
+        shards = shards_per_node.get(node['name'], 0)
+        if len(data_nodes) > 1 and shards > average * ES_HOT_NODE_FACTOR:
+            reasons.append(f"{shards} shards (media {average:.0f})")
+        disk = es_int(allocation.get(node['name'], {}).get('disk.percent') or node.get('disk.used_percent'))
+        if disk >= 85:
+            reasons.append(f"disco {disk}% (watermark bajo 85%)")
+        if es_int(node.get('heap.percent')) >= 85:
+            reasons.append(f"heap {node['heap.percent']}%")
+        if es_int(node.get('cpu')) >= 90:
+            reasons.append(f"CPU {node['cpu']}%")
+        if reasons:
+            report['hot_nodes'].append({'node': node['name'], 'reasons': reasons})
+
+    for key in ['shrink', 'merge', 'replicas']:
+        report[key].sort(key=lambda item: item['shards_saved'], reverse=True)
+    return report
+
+def print_es_advice(report, top=15):
+    summary = report['summary']
+    heap_per_shard_gb = 1 / ES_SHARDS_PER_HEAP_GB
+    print(f"{summary['indices']} índices, {summary['shards']} shards ({summary['unassigned']} sin asignar), "
+          f"{summary['data_nodes']} nodos de datos, heap total {summary['heap_gb']:.1f} GB "
+          f"(presupuesto ~{summary['shard_budget']} shards)")
+    if summary['shards'] > summary['shard_budget'] > 0:
+        print_status("El clúster supera el presupuesto de shards por GB de heap", 1)
+
+    sections = [
+        ('shrink', "Índices sobre-fragmentados (shards primarios < 1 GB): _shrink",
+         lambda item: f"{item['index']}: {item['from']} -> {item['to']} primarios, "
+                      f"espacio temporal {format_bytes(item['temp_disk'])} en un nodo"),
+        ('merge', "Familias de índices pequeños: reindexar/rollover por tamaño",
+         lambda item: f"{item['family']}: {item['indices']} índices, {format_bytes(item['bytes'])} -> "
+                      f"{item['target_indices']} índice(s), espacio temporal {format_bytes(item['bytes'])}"),
+        ('replicas', "Réplicas",
+         lambda item: f"{item['index']}: {item['from']} -> {item['to']} réplicas ({item['reason']}); "
+                      f"disco {'+' + format_bytes(item['disk_delta']) if item['disk_delta'] else 'sin cambio'}"),
+    ]
+    for key, title, describe in sections:
+        items = report[key]
+        if not items:
+            continue
+        saved = sum(item['shards_saved'] for item in items)
+        print(f"\n== {title}: {len(items)} ({'-' if saved >= 0 else '+'}{abs(saved)} shards, "
+              f"heap ≈ {'-' if saved >= 0 else '+'}{abs(saved) * heap_per_shard_gb:.1f} GB) ==")
+        for item in items[:top]:
+            print(f"  {describe(item)}")
+        if len(items) > top:
+            print(f"  ... y {len(items) - top} más")
+    if report['hot_nodes']:
+        print("\n== Nodos calientes ==")
+        for node in report['hot_nodes']:
+            print(f"  {node['node']}: {', '.join(node['reasons'])}")
+    if not any(report[key] for key in ['shrink', 'merge', 'replicas', 'hot_nodes']):
+        print_status("No se encontraron problemas de shards ni réplicas", 0)
+
+def es_shard_advisor():
+    """Analiza shards, nodos y réplicas del clúster y sugiere cambios"""
+    es = es_connection()
+    try:
+        started = time.monotonic()
+        state = fetch_es_cluster_state(es)
+        fetched = time.monotonic()
+        report = analyze_es_cluster(state)
+    except requests.RequestException as e:
+        print_status(f"Error al consultar Elasticsearch: {e}", 1)
+        return
+    print(f"Datos descargados en {fetched - started:.1f}s, analizados en {time.monotonic() - fetched:.2f}s")
+    print_es_advice(report)
+
+ES_SNAPSHOT_DB = "/var/lib/menu_scripts/es-index-snapshots.db"
+ES_SNAPSHOT_RETENTION_DAYS = 180
+ES_DISK_WATERMARKS = [('low', 85), ('high', 90), ('flood_stage', 95)]
+ES_SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY, taken_at INTEGER NOT NULL,
+    disk_used INTEGER, disk_total INTEGER, node_used INTEGER, node_total INTEGER);
+CREATE TABLE IF NOT EXISTS index_names (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, family TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS index_stats (
+    snapshot_id INTEGER NOT NULL, index_id INTEGER NOT NULL, docs INTEGER, bytes INTEGER,
+    PRIMARY KEY (snapshot_id, index_id)) WITHOUT ROWID;
+"""
+
+def open_es_snapshot_db(path=ES_SNAPSHOT_DB):
+    """Abre (y crea si hace falta) la base SQLite de snapshots de índices"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript(ES_SNAPSHOT_SCHEMA)
+    return db
+
+def store_es_index_snapshot(db, indices, allocation, taken_at=None):
+    """Guarda un snapshot: los nombres se guardan una sola vez y cada fila son cuatro enteros"""
+    taken_at = int(taken_at or time.time())
+    disks = [(es_int(entry.get('disk.used')), es_int(entry.get('disk.total')))
+             for entry in allocation if entry.get('node') and entry.get('node') != 'UNASSIGNED']
+    fullest = max(disks, key=lambda disk: disk[0] / disk[1] if disk[1] else 0, default=(0, 0))
+    with db:
+        cursor = db.execute("INSERT INTO snapshots (taken_at, disk_used, disk_total, node_used, node_total) "
+                            "VALUES (?, ?, ?, ?, ?)", (taken_at, sum(disk[0] for disk in disks),
+                                                        sum(disk[1] for disk in disks), fullest[0], fullest[1]))
+        snapshot_id = cursor.lastrowid
+        db.executemany("INSERT OR IGNORE INTO index_names (name, family) VALUES (?, ?)",
+                       ((index['index'], index_family(index['index'])) for index in indices))
+        ids = dict(db.execute("SELECT name, id FROM index_names"))
+        db.executemany("INSERT INTO index_stats (snapshot_id, index_id, docs, bytes) VALUES (?, ?, ?, ?)",
+                       ((snapshot_id, ids[index['index']], es_int(index.get('docs.count')),
+                         es_int(index.get('store.size'))) for index in indices))
+        cutoff = taken_at - ES_SNAPSHOT_RETENTION_DAYS * 86400
+        db.execute("DELETE FROM index_stats WHERE snapshot_id IN (SELECT id FROM snapshots WHERE taken_at < ?)", (cutoff,))
+        db.execute("DELETE FROM snapshots WHERE taken_at < ?", (cutoff,))
+    return snapshot_id
+
+def es_index_snapshot(interactive=False):
+    """Toma un snapshot de _cat/indices y _cat/allocation (acción para cron)"""
+    try:
+        es = es_connection(interactive=interactive)
+        indices = es_cat(es, 'indices', ['index', 'docs.count', 'store.size'])
+        allocation = es_cat(es, 'allocation', ['node', 'disk.used', 'disk.total'])
+    except (OSError, requests.RequestException) as e:
+        print_status(f"Error al consultar Elasticsearch: {e}", 1)
+        if not interactive:
+            sys.exit(1)
+        return
+    db = open_es_snapshot_db()
+    try:
+        store_es_index_snapshot(db, indices, allocation)
+    finally:
+        db.close()
+    print_status(f"Snapshot de {len(indices)} índices guardado en {ES_SNAPSHOT_DB}", 0)
+
+def linear_slope(points):
+    """Pendiente por mínimos cuadrados de una lista de (x, y)"""
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def es_growth_report(db, days=7):
+    """Crecimiento por familia de índices y proyección de watermarks en la ventana indicada"""
+    since = int(time.time()) - days * 86400
+    series = {}
+    for taken_at, family, docs, size in db.execute(
+            "SELECT s.taken_at, n.family, SUM(i.docs), SUM(i.bytes) FROM index_stats i "
+            "JOIN snapshots s ON s.id = i.snapshot_id JOIN index_names n ON n.id = i.index_id "
+            "WHERE s.taken_at >= ? GROUP BY s.id, n.family", (since,)):
+        series.setdefault(family, []).append((taken_at, docs, size))
+    families = []
+    for family, points in series.items():
+        if len(points) < 2:
+            continue
+        families.append({
+            'family': family, 'bytes': points[-1][2], 'docs': points[-1][1],
+            'bytes_per_day': linear_slope([(t, size) for t, _, size in points]) * 86400,
+            'docs_per_day': linear_slope([(t, docs) for t, docs, _ in points]) * 86400,
+        })
+    families.sort(key=lambda family: family['bytes_per_day'], reverse=True)
+
+    disk = db.execute("SELECT taken_at, disk_used, disk_total, node_used, node_total FROM snapshots "
+                      "WHERE taken_at >= ? ORDER BY taken_at", (since,)).fetchall()
+    projection = None
+    if len(disk) >= 2 and disk[-1][2]:
+        rate = linear_slope([(row[0], row[1]) for row in disk]) * 86400
+        _, used, total, node_used, node_total = disk[-1]
+        # El nodo más lleno crece en proporción a su disco si los shards están repartidos
+        node_rate = rate * node_total / total if total else 0
+        projection = {'rate': rate, 'used': used, 'total': total, 'watermarks': []}
+        for name, percent in ES_DISK_WATERMARKS:
+            cluster_days = (total * percent / 100 - used) / rate if rate > 0 else None
+            node_days = (node_total * percent / 100 - node_used) / node_rate if node_rate > 0 and node_total else None
+            projection['watermarks'].append((name, percent, cluster_days, node_days))
+    return {'snapshots': len(disk), 'families': families, 'projection': projection}
+
+def format_days(days):
+    if days is None:
+        return "no se alcanza (sin crecimiento)"
+    if days <= 0:
+        return "ya superado"
+    return (datetime.now() + timedelta(days=days)).strftime(f"en {days:.1f} días (%Y-%m-%d)")
+
+def print_es_growth_report(report, days, top=20):
+    print(f"Ventana de {days} días, {report['snapshots']} snapshots")
+    if report['snapshots'] < 2:
+        print_status("Se necesitan al menos dos snapshots en la ventana para calcular crecimiento", 1)
+        return
+    print(f"\n{'Familia':<40} {'Tamaño':>10} {'Crec./día':>11} {'Docs/día':>12}")
+    for family in report['families'][:top]:
+        sign = '-' if family['bytes_per_day'] < 0 else '+'
+        print(f"{family['family'][:40]:<40} {format_bytes(family['bytes']):>10} "
+              f"{sign + format_bytes(abs(family['bytes_per_day'])):>11} {family['docs_per_day']:>+12.0f}")
+    projection = report['projection']
+    if projection:
+        print(f"\nDisco del clúster: {format_bytes(projection['used'])} de {format_bytes(projection['total'])} "
+              f"({projection['used'] * 100 / projection['total']:.1f}%), crecimiento {format_bytes(max(projection['rate'], 0))}/día")
+        for name, percent, cluster_days, node_days in projection['watermarks']:
+            print(f"  Watermark {name} ({percent}%): clúster {format_days(cluster_days)}; "
+                  f"nodo más lleno {format_days(node_days)}")
+
+def install_es_snapshot_cron(hours=1):
+    """Programa un snapshot de índices cada `hours` horas usando la conexión guardada"""
+    script_path = os.path.abspath(__file__)
+    with open("/etc/cron.d/es_index_snapshots", "w") as cron_file:
+        cron_file.write(f"0 */{hours} * * * root /usr/bin/python3 {script_path} --es-index-snapshot\n")
+    run_command("sudo systemctl restart cron")
+    print_status(f"Snapshot de índices programado cada {hours} hora(s)", 0)
+
+def es_index_growth_menu():
+    """Snapshots periódicos de índices y análisis de crecimiento"""
+    print("1. Tomar un snapshot ahora")
+    print("2. Ver crecimiento por familia y proyección de disco")
+    print("3. Programar snapshots periódicos (cron)")
+    choice = input("Seleccione una opción [1-3]: ").strip()
+    if choice == '1':
+        es_index_snapshot(interactive=True)
+    elif choice == '2':
+        if not os.path.exists(ES_SNAPSHOT_DB):
+            print_status("Todavía no hay snapshots guardados", 1)
+            return
+        days = input("Días a analizar [7]: ").strip()
+        days = int(days) if days.isdigit() and int(days) > 0 else 7
+        db = open_es_snapshot_db()
+        try:
+            print_es_growth_report(es_growth_report(db, days), days)
+        finally:
+            db.close()
+    elif choice == '3':
+        if not os.path.exists(ES_CONFIG):
+            print("Los snapshots programados necesitan una conexión guardada.")
+            es_connection()
+            if not os.path.exists(ES_CONFIG):
+                print_status("No se guardó la conexión; no se programa el cron", 1)
+                return
+        hours = input("Cada cuántas horas [1]: ").strip()
+        install_es_snapshot_cron(int(hours) if hours.isdigit() and 0 < int(hours) <= 24 else 1)
+    else:
+        print("Opción inválida!")
+
+ES_FORCEMERGE_STATE = "/var/lib/menu_scripts/es-forcemerge-state.json"
+ES_FORCEMERGE_TIMEOUT = 6 * 3600
+ES_FORCEMERGE_POLL = 10  # Segundos entre consultas a la tarea de force-merge
+
+def es_forcemerge_candidates(es, min_age_days, min_segments):
+    """Índices abiertos más antiguos que min_age_days con más de min_segments segmentos por shard primario"""
+    cutoff_ms = (time.time() - min_age_days * 86400) * 1000
+    indices = es_cat(es, 'indices', ['index', 'creation.date', 'pri', 'status'])
+    stats = es_request(es, 'GET', '/_stats/segments', {'level': 'indices'})['indices']
+    nodes = {}
+    for shard in es_cat(es, 'shards', ['index', 'node']):
+        if shard.get('node'):
+            nodes.setdefault(shard['index'], set()).add(shard['node'])
+    candidates = []
+    for index in indices:
+        name, primaries = index['index'], max(es_int(index.get('pri')), 1)
+        if index.get('status') != 'open' or es_int(index.get('creation.date')) > cutoff_ms or name not in stats:
+            continue
+        segments = stats[name]['primaries']['segments']['count']
+        if segments / primaries > min_segments:
+            candidates.append({'index': name, 'segments': segments, 'primaries': primaries,
+                               'nodes': sorted(nodes.get(name, []))})
+    candidates.sort(key=lambda candidate: candidate['segments'] / candidate['primaries'], reverse=True)
+    return candidates
+
+def save_forcemerge_state(state, path=ES_FORCEMERGE_STATE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def wait_for_es_health(es, status='green', interval=30):
+    """Espera a que el clúster tenga al menos `status` y no esté reubicando shards"""
+    while True:
+        try:
+            health = es_request(es, 'GET', '/_cluster/health', {'wait_for_status': status, 'timeout': '60s'}, timeout=90)
+        except requests.HTTPError as e:
+            # Si wait_for_status vence, Elasticsearch responde 408 con el estado actual en el cuerpo
+            if e.response is None or e.response.status_code != 408:
+                raise
+            health = e.response.json()
+            health['timed_out'] = True
+        if not health.get('timed_out') and not health.get('relocating_shards'):
+            return health
+        print_status(f"Clúster en {health['status']} ({health.get('relocating_shards', 0)} shards reubicándose, "
+                     f"{health.get('unassigned_shards', 0)} sin asignar); esperando {interval}s", 1)
+        time.sleep(interval)
+
+def forcemerge_index(es, candidate, read_only, stop_event=None):
+    """Fusiona un índice a un segmento por shard; devuelve (segmentos después, segundos).
+
+    La fusión se lanza como tarea del clúster y se consulta periódicamente: si stop_event
+    se activa se deja de esperar (la tarea sigue en el clúster) y se devuelve None.
+    """
+    started = time.monotonic()
+    if read_only:
+        es_request(es, 'PUT', f"/{candidate['index']}/_settings", body={'index': {'blocks': {'write': True}}})
+    task = es_request(es, 'POST', f"/{candidate['index']}/_forcemerge",
+                      {'max_num_segments': 1, 'wait_for_completion': 'false'})['task']
+    while True:
+        status = es_request(es, 'GET', f"/_tasks/{task}")
+        if status.get('completed'):
+            break
+        if time.monotonic() - started > ES_FORCEMERGE_TIMEOUT:
+            raise requests.Timeout(f"force-merge de {candidate['index']} sin terminar tras {ES_FORCEMERGE_TIMEOUT}s")
+        if stop_event is not None and stop_event.wait(ES_FORCEMERGE_POLL):
+            return None
+        if stop_event is None:
+            time.sleep(ES_FORCEMERGE_POLL)
+    if status.get('error'):
+        raise requests.RequestException(f"force-merge de {candidate['index']}: {status['error'].get('reason', status['error'])}")
+    stats = es_request(es, 'GET', f"/{candidate['index']}/_stats/segments")
+    return stats['_all']['primaries']['segments']['count'], time.monotonic() - started
+
+def run_es_forcemerge(es, state, per_node=1, state_path=ES_FORCEMERGE_STATE):
+    """Ejecuta los force-merge pendientes sin superar `per_node` fusiones simultáneas por nodo.
+
+    El estado se guarda tras cada índice para poder reanudar tras una interrupción.
+    """
+    pending = [candidate for candidate in state['candidates'] if candidate['index'] not in state['done']]
+    total = len(state['candidates'])
+    busy = {}
+    running = {}
+    health_status = wait_for_es_health(es, 'yellow')['status']
+
+    def record(future, candidate):
+        for node in candidate['nodes']:
+            busy[node] -= 1
+        try:
+            result = future.result()
+        except requests.RequestException as e:
+            print_status(f"{candidate['index']}: {e}", 1, len(state['done']) + 1, total)
+            return
+        if result is None:
+            return  # Interrumpido: la fusión sigue en el clúster y el índice queda pendiente
+        after, seconds = result
+        state['done'][candidate['index']] = {'before': candidate['segments'], 'after': after,
+                                             'seconds': round(seconds, 1)}
+        save_forcemerge_state(state, state_path)
+        print_status(f"{candidate['index']}: {candidate['segments']} -> {after} segmentos en {seconds:.0f}s",
+                     0, len(state['done']), total)
+
+    stop_event = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(per_node * 8, 2))
+    try:
+        while pending or running:
+            for candidate in list(pending):
+                if any(busy.get(node, 0) >= per_node for node in candidate['nodes']):
+                    continue
+                for node in candidate['nodes']:
+                    busy[node] = busy.get(node, 0) + 1
+                pending.remove(candidate)
+                running[executor.submit(forcemerge_index, es, candidate, state['read_only'], stop_event)] = candidate
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                record(future, running.pop(future))
+            if pending:
+                wait_for_es_health(es, health_status)
+    finally:
+        # Ante un error o Ctrl+C no se espera a las fusiones en curso: siguen como tareas del
+        # clúster, los hilos dejan de consultarlas y se guardan las que ya habían terminado
+        stop_event.set()
+        executor.shutdown(wait=False)
+        for future in [future for future in running if future.done()]:
+            record(future, running.pop(future))
+    return state
+
+def print_forcemerge_summary(state):
+    done = state['done'].values()
+    before = sum(entry['before'] for entry in done)
+    after = sum(entry['after'] for entry in done)
+    print(f"\n{len(state['done'])}/{len(state['candidates'])} índices fusionados: {before} -> {after} segmentos "
+          f"primarios ({before - after} menos, {(before - after) * 100 / before if before else 0:.0f}%)")
+
+def es_forcemerge_scheduler():
+    """Force-merge limitado de índices antiguos, con reanudación"""
+    es = es_connection()
+    state = None
+    if os.path.exists(ES_FORCEMERGE_STATE):
+        with open(ES_FORCEMERGE_STATE, 'r') as f:
+            saved = json.load(f)
+        remaining = len(saved['candidates']) - len(saved['done'])
+        if remaining > 0 and input(f"Hay una ejecución interrumpida ({len(saved['done'])} hechos, {remaining} pendientes). "
+                                   "¿Reanudar? (si/no): ").strip().lower() == 'si':
+            state = saved
+    try:
+        if state is None:
+            min_age = input("Antigüedad mínima de los índices en días [7]: ").strip()
+            min_segments = input("Segmentos por shard a partir de los cuales fusionar [1]: ").strip()
+            candidates = es_forcemerge_candidates(es, int(min_age) if min_age.isdigit() else 7,
+                                                  int(min_segments) if min_segments.isdigit() else 1)
+            if not candidates:
+                print_status("Ningún índice necesita force-merge", 0)
+                return
+            for candidate in candidates[:20]:
+                print(f"  {candidate['index']}: {candidate['segments']} segmentos en {candidate['primaries']} primarios")
+            if len(candidates) > 20:
+                print(f"  ... y {len(candidates) - 20} más")
+            if input(f"¿Fusionar {len(candidates)} índices? (si/no): ").strip().lower() != 'si':
+                return
+            read_only = input("¿Marcar los índices como solo lectura antes de fusionar? (si/no): ").strip().lower() == 'si'
+            per_node = '2' if input("Fusiones simultáneas por nodo (1/2) [1]: ").strip() == '2' else '1'
+            state = {'candidates': candidates, 'done': {}, 'read_only': read_only, 'per_node': int(per_node),
+                     'started': datetime.now().isoformat(timespec='seconds')}
+            save_forcemerge_state(state)
+        run_es_forcemerge(es, state, state['per_node'])
+    except KeyboardInterrupt:
+        print("\nInterrumpido: las fusiones en curso siguen en el clúster; la ejecución se puede reanudar.")
+    except requests.RequestException as e:
+        print_status(f"Error al consultar Elasticsearch: {e}", 1)
+    if state:
+        print_forcemerge_summary(state)
+        if len(state['done']) == len(state['candidates']):
+            os.remove(ES_FORCEMERGE_STATE)
+
+ES_HOME = "/etc/elasticsearch"
+ES_SYSCTL_DROPIN = "/etc/sysctl.d/90-menu-elasticsearch.conf"
+ES_SERVICE_DROPIN = "/etc/systemd/system/elasticsearch.service.d/menu-limits.conf"
+ES_THP_UNIT = "/etc/systemd/system/menu-thp-madvise.service"
+THP_ENABLED = "/sys/kernel/mm/transparent_hugepage/enabled"
+ES_MAX_MAP_COUNT = 262144
+ES_MIN_NOFILE = 65535
+ES_MIN_NPROC = 4096
+# Por encima de ~32 GB la JVM desactiva los punteros comprimidos; 31 GB deja margen
+ES_COMPRESSED_OOPS_MB = 31 * 1024
+ES_JAVA = "/usr/share/elasticsearch/jdk/bin/java"
+ES_HEAP_RE = re.compile(r'^\s*(?:\d+(?:-\d*)?:)?-Xm([sx])(\d+)([kKmMgG]?)\s*$', re.M)
+
+def systemd_limit(service, limit):
+    """Límite configurado en systemd para el servicio (None si es infinito)"""
+    value = subprocess.getoutput(f"systemctl show -p {limit} --value {service} 2>/dev/null").strip()
+    if value == 'infinity':
+        return None
+    return int(value) if value.isdigit() else 0
+
+def read_es_heap_mb(home=ES_HOME):
+    """Devuelve (Xms, Xmx) en MB leyendo jvm.options y jvm.options.d (el último valor gana)"""
+    paths = [os.path.join(home, 'jvm.options')]
+    options_dir = os.path.join(home, 'jvm.options.d')
+    if os.path.isdir(options_dir):
+        paths += sorted(os.path.join(options_dir, name) for name in os.listdir(options_dir) if name.endswith('.options'))
+    heap = {}
+    units = {'k': 1 / 1024, 'm': 1, 'g': 1024, '': 1 / 1024 ** 2}
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except OSError:
+            continue
+        for kind, size, unit in ES_HEAP_RE.findall(content):
+            heap[kind] = int(int(size) * units[unit.lower()])
+    return heap.get('s'), heap.get('x')
+
+def compressed_oops_enabled(heap_mb, java=ES_JAVA):
+    """Pregunta a la JVM si usaría punteros comprimidos con ese heap (None si no hay java)"""
+    if not os.path.exists(java):
+        java = shutil.which('java')
+    if not java:
+        return None
+    output = subprocess.run([java, f"-Xmx{heap_mb}m", '-XX:+PrintFlagsFinal', '-version'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    match = re.search(r'\bUseCompressedOops\s+=\s+(\w+)', output)
+    return match.group(1) == 'true' if match else None
+
+def es_target_heap_mb(ram_mb):
+    """Mitad de la RAM, bajo el umbral de punteros comprimidos verificado con la JVM si está disponible"""
+    heap = min(ram_mb // 2, ES_COMPRESSED_OOPS_MB)
+    while heap > 1024 and compressed_oops_enabled(heap) is False:
+        heap -= 1024
+    return heap
+
+def set_yaml_setting(text, key, value):
+    """Fija `key: value` en un YAML plano, reemplazando la línea (o su versión comentada) si existe"""
+    line = f"{key}: {value}"
+    pattern = re.compile(rf'^#?\s*{re.escape(key)}\s*:.*$', re.M)
+    active = re.compile(rf'^{re.escape(key)}\s*:.*$', re.M)
+    if active.search(text):
+        return active.sub(line, text, count=1)
+    if pattern.search(text):
+        return pattern.sub(line, text, count=1)
+    return text.rstrip('\n') + f"\n{line}\n"
+
+def sysctl_dropin_values(key, sysctl_dir='/etc/sysctl.d'):
+    """Definiciones de una clave en los drop-ins, en el orden en que se aplican (gana la última)"""
+    names = sorted(os.listdir(sysctl_dir)) if os.path.isdir(sysctl_dir) else []
+    pattern = re.compile(rf'^\s*{re.escape(key)}\s*=\s*(\S+)', re.M)
+    values = []
+    for name in names:
+        if not name.endswith('.conf'):
+            continue
+        path = os.path.join(sysctl_dir, name)
+        try:
+            with open(path, 'r') as f:
+                values += [(path, value) for value in pattern.findall(f.read())]
+        except OSError:
+            continue
+    return values
+
+def apply_es_sysctl(sysctl_dir='/etc/sysctl.d'):
+    lines = [f"vm.max_map_count = {ES_MAX_MAP_COUNT}"]
+    # Un drop-in posterior (99-zram, 90-menu-tuning) pisaría vm.swappiness = 1: no se pelea con él
+    later = [(path, value) for path, value in sysctl_dropin_values('vm.swappiness', sysctl_dir)
+             if os.path.basename(path) > os.path.basename(ES_SYSCTL_DROPIN)]
+    if later:
+        path, value = later[-1]
+        print_status(f"vm.swappiness efectivo {value} (definido en {path}); no se fija en "
+                     f"{os.path.basename(ES_SYSCTL_DROPIN)}, bootstrap.memory_lock protege el heap", 0)
+    else:
+        lines.append("vm.swappiness = 1")
+    content = "# Generado por menu.py - prerequisitos de Elasticsearch\n" + '\n'.join(lines) + '\n'
+    if write_if_changed(ES_SYSCTL_DROPIN, content):
+        run_command(f'sudo sysctl -p {ES_SYSCTL_DROPIN}')
+    return False
+
+def apply_es_service_limits():
+    os.makedirs(os.path.dirname(ES_SERVICE_DROPIN), exist_ok=True)
+    # Se conservan los valores ya presentes y solo se suben los límites que están por debajo del mínimo
+    limits = {}
+    try:
+        with open(ES_SERVICE_DROPIN, 'r') as f:
+            limits.update(re.findall(r'^(Limit\w+)=(\S+)$', f.read(), re.M))
+    except OSError:
+        pass
+    limits['LimitMEMLOCK'] = 'infinity'
+    for limit, minimum in [('LimitNOFILE', ES_MIN_NOFILE), ('LimitNPROC', ES_MIN_NPROC)]:
+        value = systemd_limit('elasticsearch', limit)
+        if value is not None and value < minimum:
+            limits[limit] = minimum
+    content = "[Service]\n" + ''.join(f"{limit}={value}\n" for limit, value in limits.items())
+    if write_if_changed(ES_SERVICE_DROPIN, content):
+        run_command('sudo systemctl daemon-reload')
+        return True
+    return False
+
+def apply_es_memory_lock():
+    path = os.path.join(ES_HOME, 'elasticsearch.yml')
+    with open(path, 'r') as f:
+        content = f.read()
+    changed = write_if_changed(path, set_yaml_setting(content, 'bootstrap.memory_lock', 'true'))
+    return apply_es_service_limits() or changed
+
+def apply_thp_madvise():
+    unit = ("[Unit]\nDescription=Transparent Huge Pages en madvise (Elasticsearch)\n"
+            "DefaultDependencies=no\nAfter=sysinit.target local-fs.target\nBefore=elasticsearch.service\n\n"
+            "[Service]\nType=oneshot\nExecStart=/bin/sh -c 'echo madvise > /sys/kernel/mm/transparent_hugepage/enabled; "
+            "echo madvise > /sys/kernel/mm/transparent_hugepage/defrag'\n\n"
+            "[Install]\nWantedBy=basic.target\n")
+    if write_if_changed(ES_THP_UNIT, unit):
+        run_command('sudo systemctl daemon-reload')
+    run_command(f'sudo systemctl enable --now {os.path.basename(ES_THP_UNIT)}')
+    return False
+
+def apply_es_heap(heap_mb):
+    options_dir = os.path.join(ES_HOME, 'jvm.options.d')
+    content = f"# Generado por menu.py: mitad de la RAM, bajo el umbral de punteros comprimidos\n-Xms{heap_mb}m\n-Xmx{heap_mb}m\n"
+    if os.path.isdir(options_dir):
+        return write_if_changed(os.path.join(options_dir, 'menu-heap.options'), content)
+    # Versiones sin jvm.options.d: se reemplazan las líneas de jvm.options
+    path = os.path.join(ES_HOME, 'jvm.options')
+    with open(path, 'r') as f:
+        options = f.read()
+    options = ES_HEAP_RE.sub(lambda match: f"-Xm{match.group(1)}{heap_mb}m", options)
+    if f"-Xms{heap_mb}m" not in options:
+        options = options.rstrip('\n') + f"\n-Xms{heap_mb}m\n-Xmx{heap_mb}m\n"
+    return write_if_changed(path, options)
+
+def check_es_host(ram_mb=None):
+    """Comprueba los prerequisitos del host; devuelve (nombre, ok, actual, fix, aplicar)"""
+    meminfo = read_meminfo()
+    ram_mb = ram_mb or meminfo['MemTotal'] // 1024
+    checks = []
+
+    max_map_count = int(read_live_sysctl('vm.max_map_count') or 0)
+    checks.append(("vm.max_map_count", max_map_count >= ES_MAX_MAP_COUNT, str(max_map_count),
+                   f"vm.max_map_count = {ES_MAX_MAP_COUNT} en {ES_SYSCTL_DROPIN}", apply_es_sysctl))
+
+    try:
+        with open(os.path.join(ES_HOME, 'elasticsearch.yml'), 'r') as f:
+            memory_lock = re.search(r'^bootstrap\.memory_lock\s*:\s*true\s*$', f.read(), re.M) is not None
+    except OSError:
+        memory_lock = False
+    swap_kb = meminfo.get('SwapTotal', 0)
+    checks.append(("Swap / bootstrap.memory_lock", swap_kb == 0 or memory_lock,
+                   f"swap {swap_kb // 1024} MB, memory_lock {'true' if memory_lock else 'false'}",
+                   "bootstrap.memory_lock: true y LimitMEMLOCK=infinity", apply_es_memory_lock))
+
+    memlock = systemd_limit('elasticsearch', 'LimitMEMLOCK')
+    checks.append(("LimitMEMLOCK", memlock is None, 'infinity' if memlock is None else str(memlock),
+                   f"LimitMEMLOCK=infinity en {ES_SERVICE_DROPIN}", apply_es_service_limits))
+    for limit, minimum in [('LimitNOFILE', ES_MIN_NOFILE), ('LimitNPROC', ES_MIN_NPROC)]:
+        value = systemd_limit('elasticsearch', limit)
+        checks.append((limit, value is None or value >= minimum, 'infinity' if value is None else str(value),
+                       f"{limit}={minimum} en {ES_SERVICE_DROPIN}", apply_es_service_limits))
+
+    try:
+        with open(THP_ENABLED, 'r') as f:
+            thp = re.search(r'\[(\w+)\]', f.read()).group(1)
+    except (OSError, AttributeError):
+        thp = 'n/d'
+    checks.append(("Transparent Huge Pages", thp != 'always', thp,
+                   f"madvise al arrancar ({os.path.basename(ES_THP_UNIT)})", apply_thp_madvise))
+
+    xms, xmx = read_es_heap_mb()
+    target = es_target_heap_mb(ram_mb)
+    heap_ok = xms == xmx and xmx is not None and abs(xmx - target) <= target // 10 and xmx <= ES_COMPRESSED_OOPS_MB
+    current = f"Xms {xms} MB, Xmx {xmx} MB" if xmx else "sin fijar (automático)"
+    checks.append(("Heap de la JVM", heap_ok, current, f"-Xms{target}m -Xmx{target}m (RAM {ram_mb} MB)",
+                   lambda: apply_es_heap(target)))
+    return checks
+
+def es_host_prerequisites():
+    """Comprueba y corrige los prerequisitos del host para un nodo Elasticsearch"""
+    if not os.path.isdir(ES_HOME):
+        print_status(f"Elasticsearch no está instalado en este host ({ES_HOME})", 1)
+        return
+    checks = check_es_host()
+    failing = []
+    for name, ok, current, fix, apply in checks:
+        print_status(f"{name}: {current}" + ("" if ok else f" -> {fix}"), 0 if ok else 1)
+        if not ok:
+            failing.append((name, apply))
+    if not failing:
+        print_status("El host cumple todos los prerequisitos", 0)
+        return
+    if input(f"¿Aplicar las {len(failing)} correcciones? (si/no): ").strip().lower() != 'si':
+        return
+    restart = False
+    applied = set()
+    for name, apply in failing:
+        # Varias comprobaciones comparten la misma corrección (drop-in de límites)
+        if apply in applied:
+            continue
+        applied.add(apply)
+        try:
+            restart = apply() or restart
+            print_status(f"{name} corregido", 0)
+        except OSError as e:
+            print_status(f"No se pudo corregir {name}: {e}", 1)
+    if restart and input("Elasticsearch debe reiniciarse para aplicar los cambios. ¿Reiniciar ahora? (si/no): ").strip().lower() == 'si':
+        run_command('sudo systemctl restart elasticsearch')
 
 def manage_elasticsearch_indices():
     while True:
@@ -1027,15 +3972,27 @@ def manage_elasticsearch_indices():
         print("--------------------------------------------------")
         print("1. Listar índices de Elasticsearch")
         print("2. Cambiar número de réplicas de índices (uno o todos)")
-        print("3. Volver al menú principal")
+        print("3. Asesor de shards y réplicas")
+        print("4. Crecimiento de índices (snapshots y proyección de disco)")
+        print("5. Force-merge de índices antiguos (limitado y reanudable)")
+        print("6. Comprobar y corregir prerequisitos del host")
+        print("7. Volver al menú principal")
         print("--------------------------------------------------")
-        choice = input("Seleccione una opción [1-3]: ").strip()
+        choice = input("Seleccione una opción [1-7]: ").strip()
 
         if choice == '1':
             list_elasticsearch_indices()  # Función existente para listar índices (puedes actualizarla según tu necesidad)
         elif choice == '2':
             advanced_manage_elasticsearch_indices()  # Función avanzada para gestionar réplicas de índices
         elif choice == '3':
+            es_shard_advisor()
+        elif choice == '4':
+            es_index_growth_menu()
+        elif choice == '5':
+            es_forcemerge_scheduler()
+        elif choice == '6':
+            es_host_prerequisites()
+        elif choice == '7':
             break
         else:
             print("Opción inválida! Por favor seleccione una opción válida.")
@@ -1174,67 +4131,886 @@ def list_elasticsearch_indices():
     else:
         print("No se encontraron índices.")
 
+DOCKER_SOCKET = "/var/run/docker.sock"
+DOCKER_API_WORKERS = 16  # Conexiones paralelas al daemon para estadísticas y acciones masivas
+docker_connections = threading.local()
+
+class DockerSocketConnection(http.client.HTTPConnection):
+    """Conexión HTTP/1.1 al Docker Engine API sobre el socket unix"""
+    def __init__(self, socket_path=DOCKER_SOCKET, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def docker_connection(socket_path=DOCKER_SOCKET):
+    """Devuelve la conexión keep-alive del hilo actual para ese socket"""
+    connections = docker_connections.__dict__.setdefault('by_socket', {})
+    if socket_path not in connections:
+        connections[socket_path] = DockerSocketConnection(socket_path)
+    return connections[socket_path]
+
+def docker_api_error(method, path, status, data):
+    try:
+        message = json.loads(data.decode('utf-8')).get('message', '')
+    except (ValueError, AttributeError):
+        message = data.decode('utf-8', 'replace').strip()
+    return OSError(f"Docker API {method} {path}: {status} {message}".strip())
+
+def docker_api(method, path, params=None, body=None, socket_path=DOCKER_SOCKET):
+    """Petición al Docker Engine API reutilizando la conexión; devuelve el JSON decodificado o None"""
+    url = path + ('?' + urllib.parse.urlencode(params) if params else '')
+    payload = json.dumps(body).encode('utf-8') if body is not None else None
+    headers = {'Content-Type': 'application/json'} if payload is not None else {}
+    for attempt in range(2):
+        connection = docker_connection(socket_path)
+        try:
+            connection.request(method, url, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            break
+        except (http.client.HTTPException, ConnectionError) as e:
+            # El daemon pudo cerrar la conexión inactiva: se reintenta una vez con una nueva
+            connection.close()
+            if attempt:
+                raise OSError(f"Docker API {method} {path}: {e}")
+    if response.status >= 400:
+        raise docker_api_error(method, path, response.status, data)
+    if data and 'json' in response.getheader('Content-Type', ''):
+        return json.loads(data.decode('utf-8'))
+    return None
+
+@contextlib.contextmanager
+def docker_stream(path, params=None, socket_path=DOCKER_SOCKET, method='GET'):
+    """Abre una respuesta en streaming en una conexión propia (no reutilizable mientras dure)"""
+    connection = DockerSocketConnection(socket_path, timeout=None)
+    try:
+        connection.request(method, path + ('?' + urllib.parse.urlencode(params) if params else ''))
+        response = connection.getresponse()
+        if response.status >= 400:
+            raise docker_api_error(method, path, response.status, response.read())
+        yield response
+    finally:
+        connection.close()
+
+def iter_docker_log_frames(response, tty):
+    """Decodifica el flujo de logs: crudo con TTY, o tramas con cabecera de 8 bytes (stream, tamaño)"""
+    if tty:
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                return
+            yield 1, chunk
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            return
+        yield header[0], response.read(int.from_bytes(header[4:8], 'big'))
+
+def list_docker_containers(all_containers=True, socket_path=DOCKER_SOCKET):
+    """Lista los contenedores con una sola petición, ordenados por nombre"""
+    containers = docker_api('GET', '/containers/json', {'all': int(all_containers)}, socket_path=socket_path) or []
+    for container in containers:
+        container['Name'] = (container.get('Names') or [container['Id'][:12]])[0].lstrip('/')
+    return sorted(containers, key=lambda container: container['Name'])
+
+def docker_cpu_percent(stats, previous_cpu=None):
+    """CPU % entre la muestra actual y la anterior (o precpu_stats si no hay anterior)"""
+    cpu = stats.get('cpu_stats') or {}
+    previous = previous_cpu or stats.get('precpu_stats') or {}
+    if not previous.get('system_cpu_usage'):
+        return None
+    cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - previous.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - previous['system_cpu_usage']
+    if system_delta <= 0 or cpu_delta < 0:
+        return None
+    cpus = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+    return cpu_delta * cpus * 100.0 / system_delta
+
+def docker_memory_usage(stats):
+    """Memoria usada sin la caché inactiva (como `docker stats`) y límite, en bytes"""
+    memory = stats.get('memory_stats') or {}
+    details = memory.get('stats') or {}
+    cache = details.get('inactive_file', details.get('total_inactive_file', 0))
+    return max(memory.get('usage', 0) - cache, 0), memory.get('limit', 0)
+
+def collect_docker_stats(executor, containers, previous_cpu, socket_path=DOCKER_SOCKET):
+    """Pide las estadísticas one-shot de los contenedores en ejecución en paralelo"""
+    running = [container for container in containers if container['State'] == 'running']
+    futures = {container['Id']: executor.submit(docker_api, 'GET', f"/containers/{container['Id']}/stats",
+                                                {'stream': 'false', 'one-shot': 'true'}, None, socket_path)
+               for container in running}
+    stats = {}
+    for container_id, future in futures.items():
+        try:
+            sample = future.result()
+        except OSError:
+            continue  # El contenedor pudo detenerse entre el listado y la petición
+        if not sample:
+            continue
+        used, limit = docker_memory_usage(sample)
+        stats[container_id] = {'cpu': docker_cpu_percent(sample, previous_cpu.get(container_id)),
+                               'mem': used, 'limit': limit}
+        previous_cpu[container_id] = sample.get('cpu_stats')
+    return stats
+
+def render_docker_stats(containers, stats, max_rows):
+    """Tabla de contenedores ordenada por CPU"""
+    def sort_key(container):
+        cpu = stats.get(container['Id'], {}).get('cpu')
+        return (container['State'] != 'running', -(cpu or 0), container['Name'])
+    lines = [f"{'NOMBRE':<30}{'ESTADO':<10}{'CPU %':>8}{'MEMORIA':>12}{'MEM %':>8}  IMAGEN"]
+    for container in sorted(containers, key=sort_key)[:max_rows]:
+        sample = stats.get(container['Id'])
+        cpu = f"{sample['cpu']:.1f}" if sample and sample['cpu'] is not None else '-'
+        mem = format_bytes(sample['mem']) if sample else '-'
+        mem_pct = f"{sample['mem'] * 100.0 / sample['limit']:.1f}" if sample and sample['limit'] else '-'
+        lines.append(f"{container['Name'][:29]:<30}{container['State']:<10}{cpu:>8}{mem:>12}{mem_pct:>8}  "
+                     f"{container['Image'][:40]}")
+    if len(containers) > max_rows:
+        lines.append(f"... {len(containers) - max_rows} contenedores más")
+    return '\n'.join(lines)
+
+def docker_live_stats(interval=2.0, socket_path=DOCKER_SOCKET):
+    """Vista en vivo de contenedores con CPU y memoria hasta pulsar Ctrl+C"""
+    previous_cpu = {}
+    # El pool se mantiene entre refrescos para que cada hilo reutilice su conexión al daemon
+    with concurrent.futures.ThreadPoolExecutor(DOCKER_API_WORKERS) as executor:
+        try:
+            while True:
+                started = time.monotonic()
+                containers = list_docker_containers(True, socket_path)
+                stats = collect_docker_stats(executor, containers, previous_cpu, socket_path)
+                running = sum(1 for container in containers if container['State'] == 'running')
+                max_rows = max(shutil.get_terminal_size().lines - 5, 5)
+                sys.stdout.write('\033[H\033[J' + f"Contenedores: {len(containers)} ({running} en ejecución), "
+                                 f"refresco en {time.monotonic() - started:.2f}s, Ctrl+C para salir\n\n"
+                                 + render_docker_stats(containers, stats, max_rows) + '\n')
+                sys.stdout.flush()
+                time.sleep(max(interval - (time.monotonic() - started), 0.2))
+        except KeyboardInterrupt:
+            print()
+
+def parse_selection(text, count):
+    """Convierte '1,3,5-8' o 'todos' en índices (base 0); None si la selección es inválida"""
+    if text.lower() in ['todos', 'all', '*']:
+        return list(range(count))
+    indexes = []
+    for part in text.split(','):
+        bounds = part.strip().split('-')
+        if not all(bound.strip().isdigit() for bound in bounds) or len(bounds) > 2:
+            return None
+        first, last = int(bounds[0]), int(bounds[-1])
+        if not 1 <= first <= last <= count:
+            return None
+        indexes.extend(range(first - 1, last))
+    return sorted(set(indexes))
+
+def docker_bulk_action(action, containers, socket_path=DOCKER_SOCKET):
+    """Aplica start/stop/restart a varios contenedores en paralelo"""
+    with concurrent.futures.ThreadPoolExecutor(min(DOCKER_API_WORKERS, len(containers)) or 1) as executor:
+        futures = {executor.submit(docker_api, 'POST', f"/containers/{container['Id']}/{action}",
+                                   None, None, socket_path): container for container in containers}
+        failed = 0
+        for index, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            name = futures[future]['Name']
+            try:
+                future.result()
+                print_status(f"{action} {name}", 0, index, len(containers))
+            except OSError as e:
+                print_status(f"{action} {name}: {e}", 1, index, len(containers))
+                failed += 1
+    return failed == 0
+
+def select_docker_containers(prompt, socket_path=DOCKER_SOCKET):
+    containers = list_docker_containers(True, socket_path)
+    if not containers:
+        print("No hay contenedores.")
+        return []
+    for idx, container in enumerate(containers, start=1):
+        print(f"{idx}. {container['Name']} ({container['State']}, {container['Image']})")
+    indexes = parse_selection(input(prompt).strip(), len(containers))
+    if indexes is None:
+        print("Selección inválida.")
+        return []
+    return [containers[index] for index in indexes]
+
+def docker_bulk_action_menu():
+    """Inicia, detiene o reinicia varios contenedores a la vez"""
+    actions = {'1': 'start', '2': 'stop', '3': 'restart'}
+    print("1. Iniciar\n2. Detener\n3. Reiniciar")
+    action = actions.get(input("Seleccione una acción [1-3]: ").strip())
+    if not action:
+        print("Opción inválida.")
+        return
+    selected = select_docker_containers("Contenedores (ej. 1,3,5-8 o 'todos'): ")
+    if selected:
+        docker_bulk_action(action, selected)
+
+def docker_logs_menu(socket_path=DOCKER_SOCKET):
+    """Muestra las últimas líneas del log de un contenedor y opcionalmente lo sigue"""
+    selected = select_docker_containers("Contenedor por número: ", socket_path)
+    if len(selected) != 1:
+        if selected:
+            print("Seleccione un solo contenedor.")
+        return
+    container = selected[0]
+    tail = input("Número de líneas [100]: ").strip()
+    follow = input("¿Seguir el log en vivo? (si/no): ").strip().lower() == 'si'
+    tty = (docker_api('GET', f"/containers/{container['Id']}/json", socket_path=socket_path)
+           .get('Config', {}).get('Tty', False))
+    params = {'stdout': 1, 'stderr': 1, 'tail': tail if tail.isdigit() else 100, 'follow': int(follow)}
+    try:
+        with docker_stream(f"/containers/{container['Id']}/logs", params, socket_path) as response:
+            for stream_type, data in iter_docker_log_frames(response, tty):
+                output = sys.stderr if stream_type == 2 else sys.stdout
+                output.write(data.decode('utf-8', 'replace'))
+                output.flush()
+    except KeyboardInterrupt:
+        print()
+
+SELENIUM_NETWORK = "selenium-grid"
+SELENIUM_HUB = "selenium-hub"
+SELENIUM_VERSION = "latest"
+SELENIUM_BROWSERS = ['firefox', 'chrome']
+SELENIUM_LABEL = "menu_scripts.selenium-grid"
+SELENIUM_STATUS_URL = "http://127.0.0.1:4444/status"
+
+def docker_ensure_image(image, socket_path=DOCKER_SOCKET):
+    """Descarga la imagen si no existe localmente"""
+    try:
+        docker_api('GET', f"/images/{image}/json", socket_path=socket_path)
+        return
+    except OSError:
+        pass
+    name, _, tag = image.partition(':')
+    print(f"Descargando {image}...")
+    with docker_stream('/images/create', {'fromImage': name, 'tag': tag or 'latest'}, socket_path, 'POST') as response:
+        for line in response:
+            if line.strip() and 'error' in json.loads(line.decode('utf-8')):
+                raise OSError(f"Error al descargar {image}: {json.loads(line.decode('utf-8'))['error']}")
+
+def docker_ensure_network(name, socket_path=DOCKER_SOCKET):
+    """Crea la red bridge definida por el usuario si no existe"""
+    try:
+        return docker_api('GET', f"/networks/{name}", socket_path=socket_path)
+    except OSError:
+        docker_api('POST', '/networks/create', body={'Name': name, 'Driver': 'bridge', 'CheckDuplicate': True},
+                   socket_path=socket_path)
+        return docker_api('GET', f"/networks/{name}", socket_path=socket_path)
+
+def docker_run_container(name, config, socket_path=DOCKER_SOCKET):
+    """Crea e inicia un contenedor (equivalente a `docker run -d --name`)"""
+    created = docker_api('POST', '/containers/create', {'name': name}, config, socket_path)
+    docker_api('POST', f"/containers/{created['Id']}/start", socket_path=socket_path)
+    return created['Id']
+
+def docker_remove_container(container_id, stop_timeout=30, socket_path=DOCKER_SOCKET):
+    """Detiene con margen para un cierre ordenado y elimina el contenedor"""
+    try:
+        docker_api('POST', f"/containers/{container_id}/stop", {'t': stop_timeout}, socket_path=socket_path)
+    except OSError:
+        pass  # Ya estaba detenido
+    docker_api('DELETE', f"/containers/{container_id}", {'force': 1, 'v': 1}, socket_path=socket_path)
+
+def selenium_sessions_per_node(node_count, cpus=None, ram_mb=None):
+    """Sesiones por nodo: ~1 CPU y ~1 GB de RAM por navegador, repartidas entre los nodos"""
+    cpus = cpus or get_cpu_count()
+    ram_mb = ram_mb or read_meminfo().get('MemTotal', 0) // 1024
+    # Se reserva 1 GB para el hub y el sistema
+    capacity = max(min(cpus, (ram_mb - 1024) // 1024), 1)
+    return max(capacity // max(node_count, 1), 1)
+
+def selenium_hub_config():
+    return {
+        'Image': f"selenium/hub:{SELENIUM_VERSION}",
+        'Labels': {SELENIUM_LABEL: 'hub'},
+        'ExposedPorts': {'4442/tcp': {}, '4443/tcp': {}, '4444/tcp': {}},
+        'HostConfig': {'PortBindings': {'4444/tcp': [{'HostPort': '4444'}]},
+                       'RestartPolicy': {'Name': 'unless-stopped'}},
+        'NetworkingConfig': {'EndpointsConfig': {SELENIUM_NETWORK: {}}},
+    }
+
+def selenium_node_config(browser, max_sessions, vnc_secret):
+    env = {
+        'SE_EVENT_BUS_HOST': SELENIUM_HUB,
+        'SE_EVENT_BUS_PUBLISH_PORT': 4442,
+        'SE_EVENT_BUS_SUBSCRIBE_PORT': 4443,
+        'SE_NODE_MAX_SESSIONS': max_sessions,
+        'SE_NODE_OVERRIDE_MAX_SESSIONS': 'true',
+    }
+    if vnc_secret:
+        env['SE_VNC_PASSWORD'] = vnc_secret
+    return {
+        'Image': f"selenium/node-{browser}:{SELENIUM_VERSION}",
+        'Labels': {SELENIUM_LABEL: 'node', f"{SELENIUM_LABEL}.browser": browser},
+        'Env': [f"{key}={value}" for key, value in env.items()],
+        'HostConfig': {'ShmSize': 2 * 1024 ** 3, 'RestartPolicy': {'Name': 'unless-stopped'}},
+        'NetworkingConfig': {'EndpointsConfig': {SELENIUM_NETWORK: {}}},
+    }
+
+def selenium_grid_nodes(socket_path=DOCKER_SOCKET):
+    """Nodos existentes por navegador, ordenados por su número"""
+    filters = json.dumps({'label': [f"{SELENIUM_LABEL}=node"]})
+    containers = docker_api('GET', '/containers/json', {'all': 1, 'filters': filters}, socket_path=socket_path) or []
+    nodes = {browser: [] for browser in SELENIUM_BROWSERS}
+    for container in containers:
+        browser = container.get('Labels', {}).get(f"{SELENIUM_LABEL}.browser")
+        if browser in nodes:
+            container['Name'] = container['Names'][0].lstrip('/')
+            nodes[browser].append(container)
+    for browser in nodes:
+        nodes[browser].sort(key=lambda container: int(container['Name'].rsplit('-', 1)[-1]))
+    return nodes
+
+def selenium_grid_status(url=SELENIUM_STATUS_URL):
+    """Devuelve (grid listo, nodos UP) según /status del hub"""
+    value = requests.get(url, timeout=3).json().get('value', {})
+    up = sum(1 for node in value.get('nodes', []) if node.get('availability') == 'UP')
+    return bool(value.get('ready')), up
+
+def wait_for_selenium_grid(expected_nodes, timeout=300, url=SELENIUM_STATUS_URL):
+    """Espera a que el hub informe todos los nodos esperados como UP"""
+    deadline = time.monotonic() + timeout
+    up = 0
+    while time.monotonic() < deadline:
+        try:
+            ready, up = selenium_grid_status(url)
+            if up == expected_nodes and (ready or not expected_nodes):
+                return True
+        except (requests.RequestException, ValueError):
+            pass  # El hub todavía no acepta conexiones
+        print(f"Esperando al grid: {up}/{expected_nodes} nodos listos...", end='\r')
+        time.sleep(2)
+    print()
+    return False
+
+def scale_selenium_grid(counts, max_sessions, vnc_secret, socket_path=DOCKER_SOCKET):
+    """Lleva el grid a `counts` nodos por navegador, creando y retirando nodos en paralelo"""
+    docker_ensure_network(SELENIUM_NETWORK, socket_path)
+    images = [f"selenium/hub:{SELENIUM_VERSION}"] + \
+        [f"selenium/node-{browser}:{SELENIUM_VERSION}" for browser, count in counts.items() if count]
+    with concurrent.futures.ThreadPoolExecutor(DOCKER_API_WORKERS) as executor:
+        list(executor.map(lambda image: docker_ensure_image(image, socket_path), images))
+
+        try:
+            hub = docker_api('GET', f"/containers/{SELENIUM_HUB}/json", socket_path=socket_path)
+        except OSError:
+            hub = None
+        if hub is None:
+            docker_run_container(SELENIUM_HUB, selenium_hub_config(), socket_path)
+            print_status("Selenium Hub creado", 0)
+        elif SELENIUM_NETWORK not in hub['NetworkSettings']['Networks']:
+            # Hub desplegado con --link: se conecta a la red del grid
+            docker_api('POST', f"/networks/{SELENIUM_NETWORK}/connect", body={'Container': hub['Id']},
+                       socket_path=socket_path)
+        if hub is not None and not hub['State']['Running']:
+            docker_api('POST', f"/containers/{hub['Id']}/start", socket_path=socket_path)
+
+        nodes = selenium_grid_nodes(socket_path)
+        jobs = []
+        for browser, count in counts.items():
+            existing = nodes[browser]
+            used = {int(container['Name'].rsplit('-', 1)[-1]) for container in existing}
+            free = (index for index in itertools.count(1) if index not in used)
+            for _ in range(count - len(existing)):
+                name = f"selenium-node-{browser}-{next(free)}"
+                jobs.append((f"Creando {name}", executor.submit(
+                    docker_run_container, name, selenium_node_config(browser, max_sessions, vnc_secret), socket_path)))
+            for container in existing[count:][::-1]:
+                jobs.append((f"Retirando {container['Name']}", executor.submit(
+                    docker_remove_container, container['Id'], 30, socket_path)))
+        failed = 0
+        for index, (label, future) in enumerate(jobs, start=1):
+            try:
+                future.result()
+                print_status(label, 0, index, len(jobs))
+            except OSError as e:
+                print_status(f"{label}: {e}", 1, index, len(jobs))
+                failed += 1
+    return failed == 0
+
 def deploy_selenium():
-    # Verificar si Docker está instalado
-    if subprocess.call(["which", "docker"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+    """Despliega o escala un Selenium Grid con N nodos Firefox y Chrome"""
+    if not os.path.exists(DOCKER_SOCKET):
         print_status("Docker no está instalado. Por favor, instálalo primero.", 1)
         return
 
-    # Pedir al usuario el secreto para el visor VNC de Selenium
-    selenium_secret = getpass.getpass("Ingrese el secret para Selenium: ")
-
-    # Comando para ejecutar el contenedor Selenium Hub
-    hub_command = f'docker run -d --name selenium-hub -p 4444:4444 selenium/hub'
-    # Comando para ejecutar el contenedor Selenium Node Firefox con el secret para el visor VNC
-    node_command = f'docker run -d --name selenium-firefox --link selenium-hub:hub -e SE_EVENT_BUS_HOST=hub -e SE_EVENT_BUS_PUBLISH_PORT=4442 -e SE_EVENT_BUS_SUBSCRIBE_PORT=4443 -e SE_OPTS="-Dwebdriver.chrome.driver=/usr/local/bin/chromedriver -Dwebdriver.gecko.driver=/usr/local/bin/geckodriver -Dwebdriver.chrome.logfile=/tmp/chromedriver.log -Dwebdriver.gecko.logfile=/tmp/geckodriver.log -Dwebdriver.chrome.verboseLogging=true -Dwebdriver.gecko.verboseLogging=true -Dwebdriver.vnc.password={selenium_secret}" selenium/node-firefox'
+    nodes = selenium_grid_nodes()
+    current = {browser: len(containers) for browser, containers in nodes.items()}
+    if any(current.values()):
+        print("Grid actual: " + ', '.join(f"{count} nodos {browser}" for browser, count in current.items()))
+    counts = {}
+    for browser in SELENIUM_BROWSERS:
+        default = current[browser] or (1 if browser == 'firefox' and not any(current.values()) else 0)
+        value = input(f"Número de nodos {browser} [{default}]: ").strip()
+        counts[browser] = int(value) if value.isdigit() else default
+    total_nodes = sum(counts.values())
+    suggested = selenium_sessions_per_node(total_nodes)
+    value = input(f"Sesiones por nodo (SE_NODE_MAX_SESSIONS) [{suggested}]: ").strip()
+    max_sessions = int(value) if value.isdigit() and int(value) > 0 else suggested
+    vnc_secret = None
+    if any(counts[browser] > current[browser] for browser in SELENIUM_BROWSERS):
+        vnc_secret = getpass.getpass("Ingrese el secret para el visor VNC de Selenium (Enter para el de la imagen): ")
 
-    print_status("Desplegando Selenium Hub...", subprocess.call(hub_command, shell=True))
-    print_status("Desplegando Selenium Node Firefox...", subprocess.call(node_command, shell=True))
+    try:
+        legacy = docker_api('GET', '/containers/selenium-firefox/json')
+    except OSError:
+        legacy = None
+    if legacy and input("Existe el nodo antiguo 'selenium-firefox' (--link). ¿Eliminarlo? (si/no): ").strip().lower() == 'si':
+        docker_remove_container(legacy['Id'])
+
+    started = time.monotonic()
+    if not scale_selenium_grid(counts, max_sessions, vnc_secret):
+        print_status("Algunos nodos no se pudieron crear o retirar", 1)
+    if wait_for_selenium_grid(total_nodes):
+        print_status(f"Grid listo en {time.monotonic() - started:.0f}s: {total_nodes} nodos, "
+                     f"hasta {total_nodes * max_sessions} sesiones en http://<servidor>:4444", 0)
+    else:
+        print_status("El grid no informó todos los nodos como listos a tiempo; revise los logs del hub", 1)
+
+SSH_LOG_BASE_DIR = "/var/log/ssh_commands"
+SSH_LOG_MAX_BYTES = 50 * 1024 * 1024  # Rotación por tamaño del log diario
+SSH_LOG_NAME_RE = re.compile(r'^ssh_commands_(?P<user>.+)_(?P<day>\d{8})(?:\.(?P<part>\d+))?\.log(?P<gz>\.gz)?$')
+SSH_LOG_BLOCK_BEGIN = "# >>> monitoreo de comandos SSH >>>"
+SSH_LOG_BLOCK_END = "# <<< monitoreo de comandos SSH <<<"
+SSH_LOG_LEGACY_RE = re.compile(r'\n# Monitoreo de comandos SSH para \S+\nLOG_DIR=.*?\nPROMPT_COMMAND=.*?\n(?:echo "-+" \| sudo tee -a "\$\{LOG_FILE\}"\n)?', re.DOTALL)
+
+def build_ssh_logging_script(user, log_dir, backend='file'):
+    """Genera el bloque de .profile que registra comandos sin procesos por prompt.
+
+    Todo el trabajo por prompt usa builtins de bash: el log se abre una sola vez
+    en un descriptor (exec {fd}>>) y se reabre solo al cambiar de día o si el
+    archivo fue rotado. El backend 'syslog' mantiene un único proceso logger por
+    sesión conectado al descriptor.
+    """
+    if backend == 'syslog':
+        open_function = """    __ssh_log_open() {
+        exec {__SSH_LOG_FD}> >(exec logger -t ssh_commands -p local6.info)
+    }
+    __ssh_log_reopen() { :; }"""
+    else:
+        open_function = f"""    __ssh_log_open() {{
+        printf -v __SSH_LOG_DAY '%(%Y%m%d)T' -1
+        __SSH_LOG_FILE="{log_dir}/ssh_commands_{user}_${{__SSH_LOG_DAY}}.log"
+        [ -n "$__SSH_LOG_FD" ] && exec {{__SSH_LOG_FD}}>&-
+        exec {{__SSH_LOG_FD}}>>"$__SSH_LOG_FILE"
+    }}
+    __ssh_log_reopen() {{
+        local day
+        printf -v day '%(%Y%m%d)T' -1
+        if [ "$day" != "$__SSH_LOG_DAY" ] || [ ! -e "$__SSH_LOG_FILE" ]; then
+            __ssh_log_open
+        fi
+    }}"""
+
+    return f"""{SSH_LOG_BLOCK_BEGIN}
+# Monitoreo de comandos SSH para {user} (backend: {backend})
+if [ -n "$BASH_VERSION" ] && [ -z "$__SSH_LOG_FD" ]; then
+    # Necesario para que bash guarde la hora de cada comando en el historial
+    : "${{HISTTIMEFORMAT:=%F %T }}"
+    __SSH_LOG_LAST=
+{open_function}
+    __ssh_log_hook() {{
+        local HISTTIMEFORMAT="%Y-%m-%d %H:%M:%S {user} "
+        [ "$HISTCMD" = "$__SSH_LOG_LAST" ] && return
+        __SSH_LOG_LAST=$HISTCMD
+        __ssh_log_reopen
+        history 1 >&$__SSH_LOG_FD
+    }}
+    __ssh_log_open
+    printf '%(%Y-%m-%d %H:%M:%S)T {user} -- sesión iniciada (pid %s, %s)\\n' -1 "$$" "${{SSH_CLIENT%% *}}" >&$__SSH_LOG_FD
+    PROMPT_COMMAND="__ssh_log_hook${{PROMPT_COMMAND:+; $PROMPT_COMMAND}}"
+fi
+{SSH_LOG_BLOCK_END}
+"""
 
-def configure_ssh_logging_for_user(user):
-    log_dir = f"/var/log/ssh_commands/{user}"
-    log_file = f"{log_dir}/ssh_commands_{user}_$(date +%Y%m%d).log"
+def install_ssh_logging_profile(profile_path, log_script):
+    """Escribe el bloque de monitoreo en .profile reemplazando versiones anteriores"""
+    content = ""
+    if os.path.exists(profile_path):
+        with open(profile_path, 'r') as f:
+            content = f.read()
+
+    # Eliminar el bloque administrado anterior y el formato antiguo con sudo tee
+    block_re = re.compile(rf'\n?{re.escape(SSH_LOG_BLOCK_BEGIN)}\n.*?{re.escape(SSH_LOG_BLOCK_END)}\n', re.DOTALL)
+    content = block_re.sub('', content)
+    content = SSH_LOG_LEGACY_RE.sub('', content)
+
+    if content and not content.endswith('\n'):
+        content += '\n'
+    with open(profile_path, 'w') as f:
+        f.write(content + '\n' + log_script)
+
+def configure_ssh_logging_for_user(user, backend='file'):
+    log_dir = f"{SSH_LOG_BASE_DIR}/{user}"
     monitor_dir = f"/home/{user}/monitoring"
 
     if not os.path.isdir(log_dir):
         os.makedirs(log_dir, exist_ok=True)
         os.chmod(log_dir, 0o777)
-    
-    os.system(f'touch {log_file}')
-    os.chmod(log_file, 0o666)
 
     profile_path = f"/home/{user}/.profile"
-    log_script = f"""
-# Monitoreo de comandos SSH para {user}
-LOG_DIR={log_dir}
-LOG_FILE="{log_file}"
+    install_ssh_logging_profile(profile_path, build_ssh_logging_script(user, log_dir, backend))
 
-# Crear el archivo de registro si no existe
-touch "${{LOG_FILE}}"
+    os.makedirs(monitor_dir, exist_ok=True)
+    # El enlace antiguo apuntaba a un nombre de archivo con $(date) sin expandir
+    legacy_symlink = f"{monitor_dir}/ssh_commands.log"
+    if os.path.islink(legacy_symlink):
+        os.remove(legacy_symlink)
+    symlink_path = f"{monitor_dir}/ssh_commands"
+    if os.path.lexists(symlink_path):
+        os.remove(symlink_path)
+    os.symlink(log_dir, symlink_path)
 
-# Permisos de escritura para el archivo de registro
-chmod 666 "${{LOG_FILE}}"
+    print_status(f"Monitoreo SSH configurado para {user} (backend: {backend})", 0)
 
-# Agregar la hora del inicio de sesión y el usuario al archivo de registro
-echo "Sesión iniciada por el usuario $(whoami) en $(date)" | sudo tee -a "${{LOG_FILE}}"
-echo "------------------------------------------------------------" | sudo tee -a "${{LOG_FILE}}"
+SSH_LOG_BLOCK_SIZE = 256 * 1024  # Granularidad del índice de offsets por archivo
+SSH_LOG_TS_RE = re.compile(rb'^\s*(?:\d+\*?\s+)?(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) ')
 
-# Registrar los comandos ejecutados en el archivo de registro
-PROMPT_COMMAND='echo "$(date "+%Y-%m-%d %T") $(whoami) $(history 1)" | sudo tee -a "${{LOG_FILE}}"'
-echo "------------------------------------------------------------" | sudo tee -a "${{LOG_FILE}}"
-"""
+def ssh_log_index_path(path):
+    """Ruta del índice de un log: <base>/.index/<usuario>/<archivo>.idx"""
+    user_dir, name = os.path.split(path)
+    return os.path.join(os.path.dirname(user_dir), '.index', os.path.basename(user_dir), f"{name}.idx")
 
-    with open(profile_path, 'a') as f:
-        f.write(log_script)
+def save_ssh_log_index(path, index):
+    index_path = ssh_log_index_path(path)
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+    except OSError:
+        pass  # Sin permisos de escritura: el índice se recalcula en cada consulta
+
+def update_ssh_log_block(block, line):
+    """Actualiza el rango [mínimo, máximo] de timestamps de un bloque del índice"""
+    match = SSH_LOG_TS_RE.match(line)
+    if match:
+        ts = match.group(1).decode()
+        if block[1] is None or ts < block[1]:
+            block[1] = ts
+        if block[2] is None or ts > block[2]:
+            block[2] = ts
+
+def build_ssh_log_index(path, index=None):
+    """Indexa un log en bloques [offset, ts_mínimo, ts_máximo].
+
+    Para archivos planos el índice es incremental: se vuelve a leer solo desde
+    el último bloque. Un .gz sin miembros indexados se trata como un único bloque.
+    """
+    if path.endswith('.gz'):
+        block = [0, None, None]
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                update_ssh_log_block(block, line)
+        st = os.stat(path)
+        return {'size': st.st_size, 'inode': st.st_ino, 'members': False, 'blocks': [block]}
+
+    blocks = index['blocks'][:-1] if index and index['blocks'] else []
+    offset = index['blocks'][-1][0] if index and index['blocks'] else 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        block = [offset, None, None]
+        pos = offset
+        for line in f:
+            if pos - block[0] >= SSH_LOG_BLOCK_SIZE:
+                blocks.append(block)
+                block = [pos, None, None]
+            update_ssh_log_block(block, line)
+            pos += len(line)
+    if pos > block[0]:
+        blocks.append(block)
+    return {'size': pos, 'inode': os.stat(path).st_ino, 'blocks': blocks}
+
+def load_ssh_log_index(path):
+    """Carga el índice de un log, reconstruyéndolo o extendiéndolo si cambió"""
+    index = None
+    try:
+        with open(ssh_log_index_path(path), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        pass
 
-    os.makedirs(monitor_dir, exist_ok=True)
-    symlink_path = f"{monitor_dir}/ssh_commands.log"
-    if os.path.exists(symlink_path):
-        os.remove(symlink_path)
-    os.symlink(log_file, symlink_path)
-    os.chmod(symlink_path, 0o777)
-    
-    print_status(f"Monitoreo SSH configurado para {user}", 0)
+    st = os.stat(path)
+    if index and index.get('inode') != st.st_ino:
+        index = None  # El índice pertenece a otro archivo con el mismo nombre (rotado o reemplazado)
+    if index and index.get('size') == st.st_size:
+        return index
+    if path.endswith('.gz') or not index or index.get('size', 0) > st.st_size:
+        index = None  # Archivo truncado
+    index = build_ssh_log_index(path, index)
+    save_ssh_log_index(path, index)
+    return index
+
+def compress_ssh_log(path):
+    """Comprime un log como gzip multi-miembro e indexa cada miembro.
+
+    Cada miembro contiene ~SSH_LOG_BLOCK_SIZE bytes de líneas completas, así una
+    consulta puede saltar directamente al miembro que cubre su rango de tiempo.
+    """
+    gz_path = f"{path}.gz"
+    blocks = []
+    with open(path, 'rb') as src, open(gz_path, 'wb') as dst:
+        chunk = []
+        chunk_size = 0
+        block = [0, None, None]
+        for line in src:
+            chunk.append(line)
+            chunk_size += len(line)
+            update_ssh_log_block(block, line)
+            if chunk_size >= SSH_LOG_BLOCK_SIZE:
+                dst.write(gzip.compress(b''.join(chunk)))
+                blocks.append(block)
+                chunk, chunk_size = [], 0
+                block = [dst.tell(), None, None]
+        if chunk:
+            dst.write(gzip.compress(b''.join(chunk)))
+            blocks.append(block)
+    shutil.copystat(path, gz_path)
+
+    try:
+        os.remove(ssh_log_index_path(path))
+    except OSError:
+        pass
+    st = os.stat(gz_path)
+    save_ssh_log_index(gz_path, {'size': st.st_size, 'inode': st.st_ino, 'members': True, 'blocks': blocks})
+    os.remove(path)
+
+def read_ssh_log_blocks(path, index, start_ts, end_ts):
+    """Genera (contenido_en_rango, datos) solo para los bloques que intersectan la consulta.
+
+    contenido_en_rango indica que todo el bloque cae dentro del rango de tiempo,
+    por lo que no es necesario comprobar el timestamp de cada línea.
+    """
+    blocks = index['blocks']
+    selected = []
+    for i, (offset, block_min, block_max) in enumerate(blocks):
+        if block_min is not None and (block_max < start_ts or block_min > end_ts):
+            continue
+        contained = block_min is not None and start_ts <= block_min and block_max <= end_ts
+        end_offset = blocks[i + 1][0] if i + 1 < len(blocks) else index['size']
+        selected.append((contained, offset, end_offset))
+
+    if path.endswith('.gz') and not index.get('members'):
+        for contained, _, _ in selected:
+            with gzip.open(path, 'rb') as f:
+                while True:
+                    data = f.read(SSH_LOG_BLOCK_SIZE) + f.readline()
+                    if not data:
+                        break
+                    yield contained, data
+        return
+
+    with open(path, 'rb') as f:
+        for contained, offset, end_offset in selected:
+            f.seek(offset)
+            data = f.read(end_offset - offset)
+            if path.endswith('.gz'):
+                # Los miembros gzip son independientes: se descomprime solo el bloque
+                data = gzip.decompress(data)
+            yield contained, data
+
+def ssh_log_files_for_range(user_dir, start, end):
+    """Lista los logs de un usuario que pueden contener el rango de fechas dado"""
+    # Un comando escrito justo después de medianoche queda en el log del día siguiente
+    first_day = start.strftime('%Y%m%d')
+    last_day = (end + timedelta(days=1)).strftime('%Y%m%d')
+    files = []
+    for name in os.listdir(user_dir):
+        match = SSH_LOG_NAME_RE.match(name)
+        if match and first_day <= match.group('day') <= last_day:
+            part = int(match.group('part')) if match.group('part') else sys.maxsize
+            files.append((match.group('day'), part, os.path.join(user_dir, name)))
+    return [path for _, _, path in sorted(files)]
+
+def iter_matching_lines(data, regex):
+    """Genera las líneas de un bloque que contienen una coincidencia de la regex.
+
+    La búsqueda sobre el bloque solo localiza candidatas: cada línea se confirma
+    por separado para que patrones como \\s no coincidan atravesando saltos de línea.
+    """
+    if regex is None:
+        yield from data.splitlines()
+        return
+    pos = 0
+    while True:
+        match = regex.search(data, pos)
+        if not match:
+            return
+        line_start = data.rfind(b'\n', 0, match.start()) + 1
+        line_end = data.find(b'\n', match.start())
+        if line_end < 0:
+            line_end = len(data)
+        line = data[line_start:line_end]
+        if match.end() <= line_end or regex.search(line):
+            yield line
+        pos = line_end + 1
+        if pos > len(data):
+            return
+
+def query_ssh_command_logs(start, end, users=None, pattern=None, base_dir=SSH_LOG_BASE_DIR):
+    """Genera (usuario, línea) de los logs SSH en [start, end] que cumplen la regex"""
+    start_ts = start.strftime('%Y-%m-%d %H:%M:%S')
+    end_ts = end.strftime('%Y-%m-%d %H:%M:%S')
+    regex = re.compile(pattern.encode(), re.MULTILINE) if pattern else None
+    if not users:
+        users = sorted(name for name in os.listdir(base_dir)
+                       if not name.startswith('.') and os.path.isdir(os.path.join(base_dir, name)))
+
+    for user in users:
+        user_dir = os.path.join(base_dir, user)
+        if not os.path.isdir(user_dir):
+            continue
+        for path in ssh_log_files_for_range(user_dir, start, end):
+            ts = None
+            for contained, data in read_ssh_log_blocks(path, load_ssh_log_index(path), start_ts, end_ts):
+                if contained:
+                    # Bloque completo dentro del rango: la regex se aplica sobre todo el bloque
+                    for line in iter_matching_lines(data, regex):
+                        yield user, line.decode('utf-8', errors='replace')
+                    continue
+                for line in data.splitlines():
+                    match = SSH_LOG_TS_RE.match(line)
+                    if match:
+                        ts = match.group(1).decode()
+                    if ts is None or ts < start_ts or ts > end_ts:
+                        continue
+                    if regex and not regex.search(line):
+                        continue
+                    yield user, line.decode('utf-8', errors='replace')
+
+def parse_query_datetime(value, default):
+    """Convierte 'YYYY-MM-DD' o 'YYYY-MM-DD HH:MM[:SS]' en datetime"""
+    if not value:
+        return default
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    print(f"Fecha inválida '{value}', usando {default:%Y-%m-%d %H:%M}")
+    return default
+
+def query_ssh_logs_menu():
+    """Consulta interactiva de los logs de comandos SSH"""
+    now = datetime.now()
+    start = parse_query_datetime(input("Desde (YYYY-MM-DD [HH:MM]) [últimas 24h]: ").strip(), now - timedelta(days=1))
+    end_value = input("Hasta (YYYY-MM-DD [HH:MM]) [ahora]: ").strip()
+    end = parse_query_datetime(end_value, now)
+    if len(end_value) == 10:  # Solo fecha: incluir el día completo
+        end = end.replace(hour=23, minute=59, second=59)
+    users = [u.strip() for u in input("Usuarios separados por coma (Enter para todos): ").split(',') if u.strip()]
+    pattern = input("Expresión regular (Enter para todos los comandos): ").strip() or None
+
+    if not os.path.isdir(SSH_LOG_BASE_DIR):
+        print_status(f"No existe {SSH_LOG_BASE_DIR}", 1)
+        return
+    try:
+        started = time.monotonic()
+        matches = 0
+        for user, line in query_ssh_command_logs(start, end, users, pattern):
+            print(f"[{user}] {line}")
+            matches += 1
+    except re.error as e:
+        print_status(f"Expresión regular inválida: {e}", 1)
+        return
+    print_status(f"{matches} coincidencias en {time.monotonic() - started:.2f}s", 0)
+
+def rotate_ssh_command_logs(base_dir=SSH_LOG_BASE_DIR, max_bytes=SSH_LOG_MAX_BYTES):
+    """Rota por tamaño los logs del día y comprime los de días anteriores"""
+    today = datetime.now().strftime('%Y%m%d')
+    rotated = compressed = 0
+    if not os.path.isdir(base_dir):
+        return rotated, compressed
+
+    for user in sorted(os.listdir(base_dir)):
+        user_dir = os.path.join(base_dir, user)
+        if not os.path.isdir(user_dir):
+            continue
+        names = sorted(os.listdir(user_dir))
+        parts = {}
+        for name in names:
+            match = SSH_LOG_NAME_RE.match(name)
+            if match and match.group('part'):
+                day = match.group('day')
+                parts[day] = max(parts.get(day, 0), int(match.group('part')))
+
+        for name in names:
+            match = SSH_LOG_NAME_RE.match(name)
+            if not match or match.group('gz'):
+                continue
+            path = os.path.join(user_dir, name)
+            day = match.group('day')
+            if day == today and not match.group('part'):
+                if os.path.getsize(path) < max_bytes:
+                    continue
+                # Las sesiones abiertas reabren el archivo en el siguiente prompt;
+                # la parte rotada se comprime en la siguiente ejecución.
+                parts[day] = parts.get(day, 0) + 1
+                rotated_path = os.path.join(user_dir, f"ssh_commands_{match.group('user')}_{day}.{parts[day]}.log")
+                os.rename(path, rotated_path)
+                # El índice sigue al archivo: el log nuevo con el nombre base se indexa desde cero
+                try:
+                    os.replace(ssh_log_index_path(path), ssh_log_index_path(rotated_path))
+                except OSError:
+                    pass
+                rotated += 1
+            else:
+                compress_ssh_log(path)
+                compressed += 1
+
+    return rotated, compressed
+
+def install_ssh_log_rotation_cron():
+    """Programa la rotación y compresión de los logs de comandos SSH"""
+    script_path = os.path.abspath(__file__)
+    with open("/etc/cron.d/ssh_commands_rotate", "w") as cron_file:
+        cron_file.write(f"*/15 * * * * root /usr/bin/python3 {script_path} --rotate-ssh-logs\n")
+    run_command("sudo systemctl restart cron")
+    print_status("Rotación de logs SSH programada cada 15 minutos", 0)
+
+def benchmark_ssh_logging_prompt(iterations=500):
+    """Mide la latencia por prompt del PROMPT_COMMAND antiguo frente al nuevo"""
+    work_dir = tempfile.mkdtemp(prefix="ssh_log_bench_")
+    user = getpass.getuser()
+    sudo = "sudo -n " if is_root() and shutil.which("sudo") else ""
+    legacy_hook = (
+        f'LOG_FILE="{work_dir}/legacy.log"\n'
+        f'PROMPT_COMMAND=\'echo "$(date "+%Y-%m-%d %T") $(whoami) $(history 1)" | {sudo}tee -a "${{LOG_FILE}}" > /dev/null\'\n'
+    )
+    new_hook = build_ssh_logging_script(user, work_dir)
+
+    results = {}
+    try:
+        for name, setup in (("antiguo (date + tee)", legacy_hook), ("nuevo (builtins + fd)", new_hook)):
+            script = (
+                "set -o history\n"
+                f"{setup}"
+                "start=$EPOCHREALTIME\n"
+                f"for ((i = 0; i < {iterations}; i++)); do\n"
+                "    history -s \"echo comando $i\"\n"
+                "    eval \"$PROMPT_COMMAND\"\n"
+                "done\n"
+                "end=$EPOCHREALTIME\n"
+                "echo \"$start $end\"\n"
+            )
+            output = subprocess.run(["bash", "--noprofile", "--norc", "-c", script],
+                                    stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout.split()
+            start, end = float(output[-2]), float(output[-1])
+            results[name] = (end - start) / iterations * 1e6
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Latencia por prompt ({iterations} iteraciones):")
+    for name, micros in results.items():
+        print(f"  {name:<24} {micros:10.1f} µs")
+    legacy, new = results.values()
+    if new > 0:
+        print(f"  Mejora: {legacy / new:.1f}x")
+    return results
 
 def configure_ssh_logging():
     if not is_root():
@@ -1246,16 +5022,31 @@ def configure_ssh_logging():
         print("Usuarios del sistema:")
         for idx, user in enumerate(users, start=1):
             print(f"{idx}. {user}")
-        print(f"{len(users) + 1}. Volver al menú principal")
+        print(f"{len(users) + 1}. Rotar y comprimir logs ahora (y programar en cron)")
+        print(f"{len(users) + 2}. Benchmark de latencia del prompt (antiguo vs nuevo)")
+        print(f"{len(users) + 3}. Consultar logs de comandos (rango, usuarios, regex)")
+        print(f"{len(users) + 4}. Volver al menú principal")
         
         user_choice = input("Seleccione un usuario por número: ").strip()
         if user_choice.isdigit():
             user_choice = int(user_choice)
-            if user_choice == len(users) + 1:
+            if user_choice == len(users) + 4:
                 break
+            elif user_choice == len(users) + 3:
+                query_ssh_logs_menu()
+            elif user_choice == len(users) + 1:
+                rotated, compressed = rotate_ssh_command_logs()
+                print_status(f"Logs SSH: {rotated} rotados, {compressed} comprimidos", 0)
+                install_ssh_log_rotation_cron()
+            elif user_choice == len(users) + 2:
+                benchmark_ssh_logging_prompt()
             elif 1 <= user_choice <= len(users):
                 user = users[user_choice - 1]
-                configure_ssh_logging_for_user(user)
+                backend = input("Backend de registro (file/syslog) [file]: ").strip().lower() or 'file'
+                if backend not in ['file', 'syslog']:
+                    print("Backend inválido, usando 'file'.")
+                    backend = 'file'
+                configure_ssh_logging_for_user(user, backend)
             else:
                 print("Selección inválida.")
         else:
@@ -1340,6 +5131,329 @@ def select_version(package_name):
         print(f"No hay versiones disponibles para {package_name}.")
     return None
 
+MYSQL_TUNING_PROFILES = {
+    'oltp': "OLTP: muchas transacciones cortas y concurrentes",
+    'mixed': "Mixto: OLTP con reportes y consultas analíticas",
+}
+MYSQL_TUNING_DROPIN = {
+    'mysql': "/etc/mysql/mysql.conf.d/zz-menu-tuning.cnf",
+    'mariadb': "/etc/mysql/mariadb.conf.d/99-menu-tuning.cnf",
+}
+MYSQL_IO_CAPACITY = {'hdd': 200, 'ssd': 2000, 'nvme': 10000}
+
+def detect_mysql_server():
+    """Devuelve ('mysql' | 'mariadb', versión como tupla) según `mysqld --version`, o None"""
+    # MariaDB 11 ya no instala el enlace mysqld, solo mariadbd
+    for binary in ['mysqld', 'mariadbd']:
+        output = subprocess.getoutput(f"{binary} --version 2>/dev/null")
+        match = re.search(r'Ver\s+(\d+)\.(\d+)\.(\d+)', output)
+        if match:
+            break
+    else:
+        return None
+    return ('mariadb' if 'mariadb' in output.lower() else 'mysql'), tuple(int(part) for part in match.groups())
+
+def compute_mysql_tuning(profile, flavor, version, hw, dedicated=True):
+    """Calcula las variables del servidor para el perfil, el motor y el hardware"""
+    db_memory_mb = int(hw['ram_mb'] * (0.8 if dedicated else 0.5))
+    sizing = size_mysql_memory(db_memory_mb, hw['cpus'] * (25 if profile == 'oltp' else 10),
+                               0.75 if profile == 'oltp' else 0.6)
+    buffer_pool_mb, max_connections = sizing['innodb_buffer_pool_size_mb'], sizing['max_connections']
+    redo_mb = min(max(buffer_pool_mb // (4 if profile == 'oltp' else 8), 256), 4096 if profile == 'oltp' else 2048)
+    table_open_cache = min(max(max_connections * 8, 2000), 8000)
+    io_capacity = MYSQL_IO_CAPACITY[hw['storage']]
+    settings = {
+        'innodb_buffer_pool_size': f"{buffer_pool_mb}M",
+        'max_connections': max_connections,
+        'table_open_cache': table_open_cache,
+        'table_definition_cache': max(table_open_cache // 2, 2000),
+        'open_files_limit': table_open_cache * 2 + max_connections + 100,
+        'thread_cache_size': max(16, min(max_connections // 4, 256)),
+        'innodb_flush_method': 'O_DIRECT',
+        'innodb_io_capacity': io_capacity,
+        'innodb_io_capacity_max': io_capacity * 2,
+        'innodb_flush_neighbors': 1 if hw['storage'] == 'hdd' else 0,
+        'innodb_log_buffer_size': '64M' if profile == 'oltp' else '32M',
+        'tmp_table_size': '32M' if profile == 'oltp' else '64M',
+        'max_heap_table_size': '32M' if profile == 'oltp' else '64M',
+    }
+    if flavor == 'mysql' and version >= (8, 0, 30):
+        settings['innodb_redo_log_capacity'] = f"{redo_mb}M"
+    elif flavor == 'mysql':
+        # Antes de 8.0.30 el redo son dos archivos de innodb_log_file_size
+        settings['innodb_log_file_size'] = f"{redo_mb // 2}M"
+    else:
+        settings['innodb_log_file_size'] = f"{redo_mb}M"
+    return settings
+
+def render_mysql_tuning(settings, profile, hw):
+    lines = [f"# Generado por menu.py: perfil {profile}, {hw['ram_mb']} MB RAM, {hw['cpus']} CPUs, {hw['storage']}",
+             "[mysqld]"]
+    lines += [f"{key} = {value}" for key, value in settings.items()]
+    return '\n'.join(lines) + '\n'
+
+def mysql_size_to_bytes(value):
+    """Convierte '512M', '4G' o un número en bytes"""
+    match = re.match(r'^(\d+)([KMG]?)$', str(value).strip().upper())
+    return int(match.group(1)) * 1024 ** ' KMG'.index(match.group(2) or ' ') if match else None
+
+def mysql_query(sql, password=None):
+    """Ejecuta una consulta con el cliente mysql; devuelve la salida tabulada o None si falla"""
+    env = dict(os.environ, MYSQL_PWD=password) if password else None
+    user = ['-u', 'root'] if password else []
+    result = subprocess.run(['mysql', *user, '-N', '-B', '-e', sql], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, universal_newlines=True, env=env)
+    return result.stdout if result.returncode == 0 else None
+
+def verify_mysql_tuning(settings, password=None):
+    """Compara los valores esperados con SHOW GLOBAL VARIABLES; devuelve True si todos coinciden"""
+    names = ', '.join(f"'{key}'" for key in settings)
+    output = mysql_query(f"SHOW GLOBAL VARIABLES WHERE Variable_name IN ({names})", password)
+    if output is None:
+        password = getpass.getpass("Contraseña de root de MySQL para verificar: ")
+        output = mysql_query(f"SHOW GLOBAL VARIABLES WHERE Variable_name IN ({names})", password)
+    if output is None:
+        print_status("No se pudieron leer las variables con SHOW VARIABLES", 1)
+        return False
+    live = dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+    matches = 0
+    print(f"{'Variable':<28}{'Esperado':>16}{'Activo':>16}")
+    for key, expected in settings.items():
+        actual = live.get(key)
+        expected_bytes = mysql_size_to_bytes(expected)
+        ok = actual is not None and (str(expected).upper() == actual.upper() or
+                                     (expected_bytes is not None and expected_bytes == mysql_size_to_bytes(actual)))
+        # open_files_limit puede quedar por encima si el sistema lo permite
+        if key == 'open_files_limit' and actual and actual.isdigit() and int(actual) >= int(expected):
+            ok = True
+        matches += ok
+        print(f"{'' if ok else '*'}{key:<27}{str(expected):>16}{str(actual):>16}")
+    print_status(f"{matches}/{len(settings)} variables con el valor esperado (* = distinto)", 0 if matches == len(settings) else 1)
+    return matches == len(settings)
+
+def tune_mysql_server(password=None):
+    """Escribe el drop-in de ajuste en conf.d, reinicia solo si cambió y verifica con SHOW VARIABLES"""
+    server = detect_mysql_server()
+    if not server:
+        print_status("No se encontró mysqld (MySQL o MariaDB)", 1)
+        return
+    flavor, version = server
+    profiles = list(MYSQL_TUNING_PROFILES)
+    for idx, profile in enumerate(profiles, start=1):
+        print(f"{idx}. {MYSQL_TUNING_PROFILES[profile]}")
+    choice = input(f"Seleccione un perfil [1-{len(profiles)}]: ").strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(profiles):
+        print("Opción inválida.")
+        return
+    profile = profiles[int(choice) - 1]
+    dedicated = input("¿El servidor está dedicado a la base de datos? (si/no): ").strip().lower() == 'si'
+    hw = detect_hardware()
+    settings = compute_mysql_tuning(profile, flavor, version, hw, dedicated)
+    content = render_mysql_tuning(settings, profile, hw)
+    dropin = MYSQL_TUNING_DROPIN[flavor]
+    service = 'mariadb' if flavor == 'mariadb' else 'mysql'
+    print(f"{flavor} {'.'.join(map(str, version))}: {dropin}")
+    show_config_diff(dropin, content)
+
+    limits_path = f"/etc/systemd/system/{service}.service.d/menu-limits.conf"
+    previous = {}
+    for path in [dropin, limits_path]:
+        try:
+            with open(path, 'r') as f:
+                previous[path] = f.read()
+        except OSError:
+            previous[path] = None
+    if not write_if_changed(dropin, content):
+        print_status("El ajuste ya estaba aplicado; no se reinicia el servidor", 0)
+        verify_mysql_tuning(settings, password)
+        return
+    # El servicio de systemd limita los descriptores; se amplía para open_files_limit
+    os.makedirs(os.path.dirname(limits_path), exist_ok=True)
+    write_if_changed(limits_path, f"[Service]\nLimitNOFILE={max(settings['open_files_limit'], 10000)}\n")
+    run_command('sudo systemctl daemon-reload')
+    if not run_command(f'sudo systemctl restart {service}'):
+        print_status(f"{service} no arrancó con el nuevo ajuste; se restaura la configuración anterior", 1)
+        for path, text in previous.items():
+            if text is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                write_if_changed(path, text)
+        run_command('sudo systemctl daemon-reload')
+        run_command(f'sudo systemctl restart {service}')
+        return
+    print_status(f"{service} reiniciado con el perfil {profile}", 0)
+    verify_mysql_tuning(settings, password)
+
+MYSQL_SLOW_LOG = "/var/log/mysql/mysql-slow.log"
+MYSQL_SLOWLOG_DROPIN = {
+    'mysql': "/etc/mysql/mysql.conf.d/zz-menu-slowlog.cnf",
+    'mariadb': "/etc/mysql/mariadb.conf.d/99-menu-slowlog.cnf",
+}
+SLOWLOG_MAX_FINGERPRINTS = 20000  # Por encima de este límite las consultas nuevas se agrupan en "otras"
+QUANTILE_SKETCH_ACCURACY = 0.01  # Error relativo máximo de los percentiles estimados
+QUANTILE_SKETCH_GAMMA = (1 + QUANTILE_SKETCH_ACCURACY) / (1 - QUANTILE_SKETCH_ACCURACY)
+QUANTILE_SKETCH_INV_LOG_GAMMA = 1 / math.log(QUANTILE_SKETCH_GAMMA)
+SLOWLOG_QUERY_TIME_RE = re.compile(r'Query_time:\s*([\d.]+)\s+Lock_time:\s*([\d.]+)\s+Rows_sent:\s*(\d+)\s+Rows_examined:\s*(\d+)')
+SLOWLOG_SKIP_RE = re.compile(r'^(?:SET timestamp=\d+;|use [^;]+;|/\S+, Version: |Tcp port: |Time\s+Id\s+Command)', re.IGNORECASE)
+FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\""), '?'),
+    (re.compile(r'/\*.*?\*/|-- [^\n]*', re.DOTALL), ' '),
+    (re.compile(r'\b0x[0-9a-f]+\b|\b\d+(?:\.\d+)?(?:e[-+]?\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r' ?(<=>|[<>!]=|<>|[=<>]) ?'), r' \1 '),
+    (re.compile(r' ?, ?'), ', '),
+    (re.compile(r'\bin\s*\((?:\s*\?\s*,?)+\)'), 'in (?+)'),
+    (re.compile(r'\bvalues\s*(?:\([^()]*\)\s*,?\s*)+'), 'values (?+) '),
+]
+
+def sketch_add(sketch, value):
+    """Cuenta un valor en un sketch de cubetas logarítmicas (memoria acotada, error relativo fijo)"""
+    key = math.ceil(math.log(value) * QUANTILE_SKETCH_INV_LOG_GAMMA) if value > 1e-9 else None
+    sketch[key] = sketch.get(key, 0) + 1
+
+def sketch_quantile(sketch, quantile):
+    """Estima un percentil recorriendo las cubetas en orden"""
+    total = sum(sketch.values())
+    rank = quantile * (total - 1)
+    seen = sketch.get(None, 0)
+    if seen > rank:
+        return 0.0
+    for key in sorted(key for key in sketch if key is not None):
+        seen += sketch[key]
+        if seen > rank:
+            return 2 * QUANTILE_SKETCH_GAMMA ** key / (QUANTILE_SKETCH_GAMMA + 1)
+    return 0.0
+
+def fingerprint_query(sql):
+    """Normaliza una consulta: literales a '?', listas IN/VALUES colapsadas, espacios y mayúsculas"""
+    fingerprint = sql.strip().lower()
+    for regex, replacement in FINGERPRINT_RULES:
+        fingerprint = regex.sub(replacement, fingerprint)
+    return fingerprint.strip().rstrip(';').strip()
+
+def open_log(path):
+    """Abre un log de texto, descomprimiendo si está rotado con gzip"""
+    return gzip.open(path, 'rt', errors='replace') if path.endswith('.gz') else open(path, 'r', errors='replace')
+
+def rotated_log_paths(path):
+    """Rotaciones de un log (path.1, path.2.gz, ...) de la más antigua a la más reciente"""
+    directory, base = os.path.split(path)
+    if not os.path.isdir(directory or '.'):
+        return []
+    rotated = [name for name in os.listdir(directory or '.') if re.match(re.escape(base) + r'\.\d+(\.gz)?$', name)]
+    rotated.sort(key=lambda name: int(re.search(r'\.(\d+)(?:\.gz)?$', name).group(1)), reverse=True)
+    return [os.path.join(directory, name) for name in rotated]
+
+def prompt_log_paths(default_path, description):
+    """Pide la ruta de un log y ofrece incluir sus rotaciones; devuelve la lista en orden cronológico"""
+    path = input(f"Ruta del {description} [{default_path}]: ").strip() or default_path
+    paths = [path] if os.path.exists(path) else []
+    rotated = rotated_log_paths(path)
+    if rotated and input(f"¿Incluir {len(rotated)} archivos rotados? (si/no): ").strip().lower() == 'si':
+        paths = rotated + paths
+    if not paths:
+        print_status(f"No existe {path}", 1)
+    return paths
+
+def iter_slow_log_entries(lines):
+    """Recorre el slow log en streaming y produce (query_time, rows_examined, sql)"""
+    metrics, sql = None, []
+    for line in lines:
+        if line.startswith('#'):
+            match = SLOWLOG_QUERY_TIME_RE.search(line)
+            if match:
+                metrics = match
+            elif line.startswith(('# Time:', '# User@Host:')) and sql:
+                if metrics:
+                    yield float(metrics.group(1)), int(metrics.group(4)), '\n'.join(sql)
+                metrics, sql = None, []
+            continue
+        if metrics is not None and not SLOWLOG_SKIP_RE.match(line):
+            sql.append(line.strip())
+    if metrics and sql:
+        yield float(metrics.group(1)), int(metrics.group(4)), '\n'.join(sql)
+
+def analyze_slow_log(paths, max_fingerprints=SLOWLOG_MAX_FINGERPRINTS):
+    """Agrega el slow log por huella con memoria acotada; devuelve (estadísticas, entradas, líneas)"""
+    stats = {}
+    entries = 0
+    line_count = [0]
+
+    def counted(f):
+        for line in f:
+            line_count[0] += 1
+            yield line
+
+    for path in paths:
+        with open_log(path) as f:
+            for query_time, rows_examined, sql in iter_slow_log_entries(counted(f)):
+                entries += 1
+                fingerprint = fingerprint_query(sql)
+                entry = stats.get(fingerprint)
+                if entry is None:
+                    if len(stats) >= max_fingerprints:
+                        fingerprint = '(otras consultas)'
+                        entry = stats.get(fingerprint)
+                    if entry is None:
+                        entry = stats[fingerprint] = {'count': 0, 'total': 0.0, 'max': 0.0, 'rows_examined': 0,
+                                                      'max_rows_examined': 0, 'sketch': {},
+                                                      'example': ' '.join(sql.split())[:300]}
+                entry['count'] += 1
+                entry['total'] += query_time
+                entry['max'] = max(entry['max'], query_time)
+                entry['rows_examined'] += rows_examined
+                entry['max_rows_examined'] = max(entry['max_rows_examined'], rows_examined)
+                sketch_add(entry['sketch'], query_time)
+    return stats, entries, line_count[0]
+
+def print_slow_log_report(stats, top=15):
+    ranked = sorted(stats.items(), key=lambda item: item[1]['total'], reverse=True)[:top]
+    print(f"{'#':>3} {'Cuenta':>8} {'Total s':>10} {'Media s':>9} {'p95 s':>9} {'Máx s':>9} "
+          f"{'Filas exam. media':>18} {'máx':>10}")
+    for rank, (fingerprint, entry) in enumerate(ranked, start=1):
+        print(f"{rank:>3} {entry['count']:>8} {entry['total']:>10.2f} {entry['total'] / entry['count']:>9.3f} "
+              f"{sketch_quantile(entry['sketch'], 0.95):>9.3f} {entry['max']:>9.3f} "
+              f"{entry['rows_examined'] // entry['count']:>18} {entry['max_rows_examined']:>10}")
+        print(f"    {fingerprint[:150]}")
+        print(f"    ej: {entry['example'][:150]}")
+
+def enable_mysql_slow_log(password=None):
+    """Activa el slow query log en caliente y lo persiste en un drop-in"""
+    server = detect_mysql_server()
+    if not server:
+        print_status("No se encontró mysqld (MySQL o MariaDB)", 1)
+        return
+    threshold = input("Umbral en segundos (long_query_time) [1]: ").strip() or '1'
+    if not re.match(r'^\d+(\.\d+)?$', threshold):
+        print("Umbral inválido.")
+        return
+    no_index = input("¿Registrar también consultas sin índices? (si/no): ").strip().lower() == 'si'
+    settings = {'slow_query_log': 1, 'slow_query_log_file': MYSQL_SLOW_LOG, 'long_query_time': threshold,
+                'log_queries_not_using_indexes': int(no_index)}
+    statement = ' '.join(f"SET GLOBAL {key} = {value if key != 'slow_query_log_file' else repr(value)};"
+                         for key, value in settings.items())
+    if mysql_query(statement, password) is None:
+        password = getpass.getpass("Contraseña de root de MySQL: ")
+        if mysql_query(statement, password) is None:
+            print_status("No se pudo activar el slow query log", 1)
+            return
+    write_if_changed(MYSQL_SLOWLOG_DROPIN[server[0]],
+                     "# Generado por menu.py\n[mysqld]\n" + ''.join(f"{key} = {value}\n" for key, value in settings.items()))
+    print_status(f"Slow query log activo en {MYSQL_SLOW_LOG} (umbral {threshold}s, aplica a conexiones nuevas)", 0)
+
+def analyze_slow_log_menu():
+    """Analiza el slow log actual y, si se desea, sus rotaciones (.1, .2.gz...)"""
+    paths = prompt_log_paths(MYSQL_SLOW_LOG, "slow log")
+    if not paths:
+        return
+    started = time.monotonic()
+    stats, entries, lines = analyze_slow_log(paths)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"{entries} consultas, {len(stats)} huellas distintas, {lines} líneas en {elapsed:.1f}s "
+          f"({lines / elapsed:,.0f} líneas/s)")
+    print_slow_log_report(stats)
+
 def install_mysql():
     while True:
         os.system('clear')
@@ -1358,6 +5472,8 @@ def install_mysql():
                     mysql_root_password = getpass.getpass("Ingrese la contraseña para el usuario root de MySQL: ")
                     if run_command(f'sudo mysql -e "ALTER USER \'root\'@\'localhost\' IDENTIFIED WITH mysql_native_password BY \'{mysql_root_password}\';"') and run_command('sudo mysql -e "FLUSH PRIVILEGES;"') and run_command('sudo mysql -e "DELETE FROM mysql.user WHERE User=\'\';"') and run_command('sudo mysql -e "DROP DATABASE IF EXISTS test;"') and run_command('sudo mysql -e "DELETE FROM mysql.db WHERE Db=\'test\' OR Db=\'test\\_%\';"') and run_command('sudo mysql -e "FLUSH PRIVILEGES;"'):
                         print_status("MySQL configurado y datos de prueba eliminados", 0)
+                        if input("¿Ajustar el rendimiento del servidor según el hardware? (si/no): ").strip().lower() == 'si':
+                            tune_mysql_server(mysql_root_password)
                     else:
                         print_status("Error al configurar MySQL", 1)
                 else:
@@ -1420,9 +5536,12 @@ def mysql_submenu():
         print("2. Crear usuarios MySQL")
         print("3. Permitir conexión remota en MySQL")
         print("4. Asignar permisos a usuarios MySQL")
-        print("5. Volver al menú principal")
+        print("5. Ajustar rendimiento del servidor (perfil OLTP o mixto)")
+        print("6. Activar slow query log")
+        print("7. Analizar slow query log")
+        print("8. Volver al menú principal")
         print("--------------------------------------------------")
-        mysql_choice = input("Seleccione una opción [1-5]: ").strip()
+        mysql_choice = input("Seleccione una opción [1-8]: ").strip()
         if mysql_choice == '1':
             install_mysql()
         elif mysql_choice == '2':
@@ -1432,6 +5551,12 @@ def mysql_submenu():
         elif mysql_choice == '4':
             grant_mysql_permissions()
         elif mysql_choice == '5':
+            tune_mysql_server()
+        elif mysql_choice == '6':
+            enable_mysql_slow_log()
+        elif mysql_choice == '7':
+            analyze_slow_log_menu()
+        elif mysql_choice == '8':
             break
         else:
             print("Opción inválida! Por favor seleccione una opción válida.")
@@ -1444,9 +5569,12 @@ def install_mariadb():
         print("        Submenú de Instalación MariaDB")
         print("--------------------------------------------------")
         print("1. Instalar MariaDB y eliminar datos de prueba")
-        print("2. Volver al menú anterior")
+        print("2. Ajustar rendimiento del servidor (perfil OLTP o mixto)")
+        print("3. Activar slow query log")
+        print("4. Analizar slow query log")
+        print("5. Volver al menú anterior")
         print("--------------------------------------------------")
-        mariadb_choice = input("Seleccione una opción [1-2]: ").strip()
+        mariadb_choice = input("Seleccione una opción [1-5]: ").strip()
         if mariadb_choice == '1':
             version = select_version("mariadb-server")
             if version:
@@ -1455,11 +5583,19 @@ def install_mariadb():
                     mariadb_root_password = getpass.getpass("Ingrese la contraseña para el usuario root de MariaDB: ")
                     if run_command(f'sudo mysql -e "ALTER USER \'root\'@\'localhost\' IDENTIFIED BY \'{mariadb_root_password}\';"') and run_command('sudo mysql -e "FLUSH PRIVILEGES;"') and run_command('sudo mysql -e "DELETE FROM mysql.user WHERE User=\'\';"') and run_command('sudo mysql -e "DROP DATABASE IF EXISTS test;"') and run_command('sudo mysql -e "DELETE FROM mysql.db WHERE Db=\'test\' OR Db=\'test\\_%\';"') and run_command('sudo mysql -e "FLUSH PRIVILEGES;"'):
                         print_status("MariaDB configurado y datos de prueba eliminados", 0)
+                        if input("¿Ajustar el rendimiento del servidor según el hardware? (si/no): ").strip().lower() == 'si':
+                            tune_mysql_server(mariadb_root_password)
                     else:
                         print_status("Error al configurar MariaDB", 1)
                 else:
                     print_status("Error al instalar MariaDB", 1)
         elif mariadb_choice == '2':
+            tune_mysql_server()
+        elif mariadb_choice == '3':
+            enable_mysql_slow_log()
+        elif mariadb_choice == '4':
+            analyze_slow_log_menu()
+        elif mariadb_choice == '5':
             break
         else:
             print("Opción inválida! Por favor seleccione una opción válida.")
@@ -1469,6 +5605,299 @@ def install_docker():
     """Función legacy - redirige a la nueva función mejorada"""
     install_docker_improved()
 
+NGINX_CONF = "/etc/nginx/nginx.conf"
+NGINX_MAX_WORKER_CONNECTIONS = 16384  # Cada conexión reserva estructuras en memoria por worker
+NGINX_GZIP_TYPES = ['text/plain', 'text/css', 'text/xml', 'text/javascript', 'application/json',
+                    'application/javascript', 'application/xml', 'application/rss+xml', 'application/atom+xml',
+                    'image/svg+xml', 'font/ttf', 'font/otf', 'application/vnd.ms-fontobject']
+
+def nginx_nofile_limit():
+    """Límite de descriptores del servicio nginx (systemd) o, en su defecto, el de este proceso"""
+    value = subprocess.getoutput("systemctl show -p LimitNOFILE --value nginx 2>/dev/null").strip()
+    if value.isdigit():
+        return int(value)
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[1]
+
+def compute_nginx_tuning(cpus, nofile):
+    """Workers por núcleo y conexiones que caben en el límite de descriptores"""
+    rlimit = min(nofile, 1048576)
+    # Como proxy cada cliente usa dos descriptores (cliente y upstream)
+    connections = max(min(rlimit // 2, NGINX_MAX_WORKER_CONNECTIONS) // 1024 * 1024, 1024)
+    return {
+        'worker_processes': cpus,
+        'worker_rlimit_nofile': rlimit,
+        'worker_connections': connections,
+        'open_file_cache_max': min(connections * 2, 100000),
+        'upstream_keepalive': max(min(connections // 256, 64), 16),
+    }
+
+def parse_nginx_upstreams(text):
+    """Convierte 'app=127.0.0.1:8080,127.0.0.1:8081; api=unix:/run/api.sock' en {nombre: [servidores]}"""
+    upstreams = {}
+    for entry in text.split(';'):
+        name, _, servers = entry.partition('=')
+        servers = [server.strip() for server in servers.split(',') if server.strip()]
+        if name.strip() and servers:
+            upstreams[name.strip()] = servers
+    return upstreams
+
+def render_nginx_conf(tuning, upstreams=None, user='www-data'):
+    """Genera un nginx.conf ajustado con la estructura de Debian/Ubuntu"""
+    upstream_blocks = ''
+    for name, servers in (upstreams or {}).items():
+        server_lines = ''.join(f"        server {server};\n" for server in servers)
+        upstream_blocks += f"""
+    upstream {name} {{
+{server_lines}        keepalive {tuning['upstream_keepalive']};
+        keepalive_requests 1000;
+        keepalive_timeout 60s;
+    }}
+"""
+    gzip_types = '\n'.join(f"        {mime_type}" for mime_type in NGINX_GZIP_TYPES)
+    return f"""# Generado por menu.py el {datetime.now():%Y-%m-%d %H:%M}
+# {tuning['worker_processes']} CPUs, límite de descriptores {tuning['worker_rlimit_nofile']}
+user {user};
+worker_processes {tuning['worker_processes']};
+worker_rlimit_nofile {tuning['worker_rlimit_nofile']};
+pid /run/nginx.pid;
+include /etc/nginx/modules-enabled/*.conf;
+
+events {{
+    worker_connections {tuning['worker_connections']};
+    multi_accept on;
+    use epoll;
+}}
+
+http {{
+    include /etc/nginx/mime.types;
+    default_type application/octet-stream;
+    server_tokens off;
+
+    # Incluye tiempos de respuesta para el análisis de latencia del access log
+    log_format timed '$remote_addr - $remote_user [$time_local] "$request" '
+                     '$status $body_bytes_sent "$http_referer" "$http_user_agent" '
+                     'rt=$request_time urt="$upstream_response_time"';
+    access_log /var/log/nginx/access.log timed buffer=64k flush=5s;
+    error_log /var/log/nginx/error.log warn;
+
+    sendfile on;
+    tcp_nopush on;
+    tcp_nodelay on;
+    keepalive_timeout 65s;
+    keepalive_requests 1000;
+    reset_timedout_connection on;
+    types_hash_max_size 2048;
+    server_names_hash_bucket_size 128;
+
+    open_file_cache max={tuning['open_file_cache_max']} inactive=60s;
+    open_file_cache_valid 120s;
+    open_file_cache_min_uses 2;
+    open_file_cache_errors on;
+
+    client_body_buffer_size 128k;
+    client_max_body_size 64m;
+    large_client_header_buffers 4 16k;
+
+    gzip on;
+    gzip_static on;
+    gzip_vary on;
+    gzip_proxied any;
+    gzip_comp_level 5;
+    gzip_min_length 1024;
+    gzip_types
+{gzip_types};
+
+    # Proxy: HTTP/1.1 sin "Connection: close" para reutilizar las conexiones keepalive de los upstreams
+    proxy_http_version 1.1;
+    proxy_set_header Connection "";
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_buffer_size 16k;
+    proxy_buffers 8 16k;
+    proxy_busy_buffers_size 32k;
+    proxy_connect_timeout 5s;
+    proxy_read_timeout 60s;
+{upstream_blocks}
+    include /etc/nginx/conf.d/*.conf;
+    include /etc/nginx/sites-enabled/*;
+}}
+"""
+
+def show_config_diff(current_path, new_content):
+    """Imprime el diff unificado entre el archivo actual y el contenido propuesto"""
+    try:
+        with open(current_path, 'r') as f:
+            current = f.read().splitlines(keepends=True)
+    except OSError:
+        current = []
+    diff = list(difflib.unified_diff(current, new_content.splitlines(keepends=True),
+                                     current_path, f"{current_path} (propuesto)"))
+    print(''.join(diff) if diff else "Sin cambios respecto al archivo actual.")
+    return bool(diff)
+
+def apply_nginx_conf(content, conf_path=NGINX_CONF):
+    """Valida con `nginx -t` antes de reemplazar el archivo y recarga nginx"""
+    conf_dir = os.path.dirname(conf_path)
+    candidate = None
+    try:
+        # El archivo temporal va al mismo directorio para que los include relativos se resuelvan igual
+        fd, candidate = tempfile.mkstemp(prefix='.nginx.conf.', dir=conf_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(candidate, 0o644)
+        result = subprocess.run(['nginx', '-t', '-c', candidate], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        if result.returncode != 0:
+            print(result.stdout)
+            print_status("La configuración generada no pasó 'nginx -t'; no se modificó nada", 1)
+            return False
+        if os.path.exists(conf_path):
+            shutil.copy2(conf_path, f"{conf_path}.bak-{datetime.now():%Y%m%d%H%M%S}")
+        os.replace(candidate, conf_path)
+        candidate = None
+    except OSError as e:
+        print_status(f"No se pudo aplicar {conf_path}: {e}", 1)
+        return False
+    finally:
+        if candidate and os.path.exists(candidate):
+            os.remove(candidate)
+    if run_command('sudo systemctl reload nginx'):
+        print_status(f"{conf_path} actualizado y nginx recargado (copia de seguridad .bak)", 0)
+        return True
+    print_status("nginx.conf actualizado pero falló la recarga de nginx", 1)
+    return False
+
+def configure_nginx_performance(conf_path=NGINX_CONF):
+    """Genera un nginx.conf ajustado al hardware; muestra el diff y aplica solo si se confirma"""
+    if not shutil.which('nginx'):
+        print_status("nginx no está instalado", 1)
+        return
+    if not os.path.isdir(os.path.dirname(conf_path)):
+        print_status(f"No existe el directorio de configuración {os.path.dirname(conf_path)}", 1)
+        return
+    tuning = compute_nginx_tuning(get_cpu_count(), nginx_nofile_limit())
+    print(f"worker_processes {tuning['worker_processes']}, worker_connections {tuning['worker_connections']}, "
+          f"worker_rlimit_nofile {tuning['worker_rlimit_nofile']}")
+    upstreams = parse_nginx_upstreams(input(
+        "Upstreams con keepalive (ej. app=127.0.0.1:8080,127.0.0.1:8081; api=unix:/run/api.sock) [ninguno]: ").strip())
+    content = render_nginx_conf(tuning, upstreams)
+    if not show_config_diff(conf_path, content):
+        return
+    if input("¿Aplicar la configuración? (no = solo vista previa) (si/no): ").strip().lower() != 'si':
+        print("Vista previa: no se modificó ningún archivo.")
+        return
+    if apply_nginx_conf(content, conf_path) and upstreams:
+        print("Use 'proxy_pass http://<upstream>;' en los server de sites-enabled: " + ', '.join(upstreams))
+
+NGINX_ACCESS_LOG = "/var/log/nginx/access.log"
+ACCESS_LOG_MAX_ROUTES = 5000  # Por encima de este límite las rutas nuevas se agrupan en "otras"
+NGINX_ACCESS_RE = re.compile(r'^\S+ \S+ \S+ \[[^\]]*\] "(?P<method>[A-Z]+) (?P<path>[^ "?]*)[^"]*" '
+                             r'(?P<status>\d{3}) (?P<bytes>\d+|-)')
+# Formato "timed" de render_nginx_conf (rt=/urt= al final) o "$request_time $upstream_response_time" al final
+NGINX_TIMED_RE = re.compile(r'rt=([\d.]+|-)(?: urt="([^"]*)")?\s*$')
+NGINX_TRAILING_TIME_RE = re.compile(r'\d+\.\d{3}$')
+ROUTE_ID_RE = re.compile(r'/(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,})(?=/|$)'
+                         r'|(?<=[.-])[0-9a-f]{8,}(?=[./]|$)', re.IGNORECASE)
+
+def normalize_route(path):
+    """Agrupa rutas sustituyendo ids numéricos, UUID y hashes (también app.<hash>.js) por ':id'"""
+    return ROUTE_ID_RE.sub(lambda match: '/:id' if match.group().startswith('/') else ':id', path) or '/'
+
+def upstream_time_total(value):
+    """Suma los tiempos de $upstream_response_time ('0.010, 0.020 : 0.005'); None si no hubo upstream"""
+    if not value or value == '-':
+        return None
+    if ',' not in value and ':' not in value:
+        return float(value)
+    times = [float(part) for part in re.split(r'[,:\s]+', value) if part and part != '-']
+    return sum(times) if times else None
+
+def new_route_stats():
+    return {'count': 0, 'total': 0.0, 'max': 0.0, 'bytes': 0, 'sketch': {}, 'upstream_sketch': {}, 'statuses': {}}
+
+def analyze_access_log(paths, max_routes=ACCESS_LOG_MAX_ROUTES):
+    """Agrega latencia, códigos y bytes por ruta en streaming; devuelve (rutas, resumen)"""
+    routes = {}
+    summary = {'lines': 0, 'parsed': 0, 'untimed': 0}
+    for path in paths:
+        with open_log(path) as f:
+            for line in f:
+                summary['lines'] += 1
+                match = NGINX_ACCESS_RE.match(line)
+                if not match:
+                    continue
+                summary['parsed'] += 1
+                method, request_path, status, size = match.groups()
+                # rt= va al final de la línea: el referer y el User-Agent los controla el cliente
+                timed = line.rfind(' rt=', match.end())
+                if timed >= 0:
+                    timed = NGINX_TIMED_RE.match(line, timed + 1)
+                    if not timed or timed.group(1) == '-':
+                        summary['untimed'] += 1
+                        continue
+                    request_time, upstream = timed.groups()
+                else:
+                    fields = line.rsplit(None, 2)
+                    if NGINX_TRAILING_TIME_RE.match(fields[-2]):
+                        request_time, upstream = fields[-2], fields[-1]
+                    elif NGINX_TRAILING_TIME_RE.match(fields[-1]):
+                        request_time, upstream = fields[-1], None
+                    else:
+                        summary['untimed'] += 1
+                        continue
+                route = f"{method} {normalize_route(request_path)}"
+                stats = routes.get(route)
+                if stats is None:
+                    if len(routes) >= max_routes:
+                        route = '(otras rutas)'
+                        stats = routes.get(route)
+                    if stats is None:
+                        stats = routes[route] = new_route_stats()
+                request_time = float(request_time)
+                stats['count'] += 1
+                stats['total'] += request_time
+                stats['max'] = max(stats['max'], request_time)
+                sketch_add(stats['sketch'], request_time)
+                upstream = upstream_time_total(upstream)
+                if upstream is not None:
+                    sketch_add(stats['upstream_sketch'], upstream)
+                stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+                if size != '-':
+                    stats['bytes'] += int(size)
+    return routes, summary
+
+def print_access_log_report(routes, top=20):
+    ranked = sorted(routes.items(), key=lambda item: item[1]['total'], reverse=True)[:top]
+    print(f"{'Ruta':<40}{'Peticiones':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Máx ms':>9}"
+          f"{'Upstr p95':>10}{'4xx %':>7}{'5xx %':>7}{'Bytes':>11}")
+    for route, stats in ranked:
+        count = stats['count']
+        errors = {family: sum(n for status, n in stats['statuses'].items() if status[0] == family) * 100.0 / count
+                  for family in ['4', '5']}
+        upstream = f"{sketch_quantile(stats['upstream_sketch'], 0.95) * 1000:.0f}" if stats['upstream_sketch'] else '-'
+        print(f"{route[:39]:<40}{count:>11}{sketch_quantile(stats['sketch'], 0.5) * 1000:>9.0f}"
+              f"{sketch_quantile(stats['sketch'], 0.95) * 1000:>9.0f}{sketch_quantile(stats['sketch'], 0.99) * 1000:>9.0f}"
+              f"{stats['max'] * 1000:>9.0f}{upstream:>10}{errors['4']:>7.1f}{errors['5']:>7.1f}"
+              f"{format_bytes(stats['bytes']):>11}")
+
+def analyze_access_log_menu():
+    """Analiza la latencia por ruta del access log de Nginx y sus rotaciones"""
+    paths = prompt_log_paths(NGINX_ACCESS_LOG, "access log")
+    if not paths:
+        return
+    started = time.monotonic()
+    routes, summary = analyze_access_log(paths)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"{summary['lines']} líneas ({summary['parsed']} peticiones, {len(routes)} rutas) en {elapsed:.1f}s "
+          f"({summary['lines'] / elapsed:,.0f} líneas/s)")
+    if summary['untimed']:
+        print(f"Aviso: {summary['untimed']} peticiones sin $request_time; genere nginx.conf con el formato 'timed' "
+              "desde el submenú de Nginx para registrarlo.")
+    if routes:
+        print_access_log_report(routes)
+
 def install_nginx():
     while True:
         os.system('clear')
@@ -1476,22 +5905,226 @@ def install_nginx():
         print("        Submenú de Instalación Nginx")
         print("--------------------------------------------------")
         print("1. Instalar Nginx")
-        print("2. Volver al menú anterior")
+        print("2. Generar nginx.conf optimizado (con vista previa de cambios)")
+        print("3. Analizar latencia por ruta del access log")
+        print("4. Volver al menú anterior")
         print("--------------------------------------------------")
-        nginx_choice = input("Seleccione una opción [1-2]: ").strip()
+        nginx_choice = input("Seleccione una opción [1-4]: ").strip()
         if nginx_choice == '1':
             version = select_version("nginx")
             if version:
                 if run_command(f'sudo apt-get update') and run_command(f'sudo apt-get install -y nginx={version}') and run_command('sudo systemctl start nginx') and run_command('sudo systemctl enable nginx'):
                     print_status("Nginx instalado", 0)
+                    if input("¿Generar un nginx.conf optimizado para este servidor? (si/no): ").strip().lower() == 'si':
+                        configure_nginx_performance()
                 else:
                     print_status("Error al instalar Nginx", 1)
         elif nginx_choice == '2':
+            configure_nginx_performance()
+        elif nginx_choice == '3':
+            analyze_access_log_menu()
+        elif nginx_choice == '4':
             break
         else:
             print("Opción inválida! Por favor seleccione una opción válida.")
         input("Presione [Enter] para continuar...")
 
+PHP_FPM_WORKER_ESTIMATE_MB = 64  # Estimación si no hay workers en ejecución que medir
+PHP_FPM_OPCACHE_DROPIN = "99-menu-opcache.ini"
+
+def php_fpm_versions():
+    """Versiones de PHP con FPM instalado (/etc/php/<versión>/fpm)"""
+    versions = [name for name in os.listdir('/etc/php') if os.path.isdir(f'/etc/php/{name}/fpm')] \
+        if os.path.isdir('/etc/php') else []
+    return sorted(versions, key=lambda version: [int(part) for part in version.split('.') if part.isdigit()])
+
+def read_process_status(pid, proc_dir='/proc'):
+    """Campos de /proc/<pid>/status; los valores en kB se devuelven como enteros"""
+    status = {}
+    with open(f'{proc_dir}/{pid}/status', 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            fields = value.split()
+            status[key] = int(fields[0]) if len(fields) == 2 and fields[1] == 'kB' else value.strip()
+    with open(f'{proc_dir}/{pid}/cmdline', 'rb') as f:
+        # php-fpm reescribe su título: "php-fpm: master process (...)" / "php-fpm: pool www"
+        status['cmdline'] = f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+    return status
+
+def measure_php_fpm_workers(version, pool=None, proc_dir='/proc'):
+    """RSS en MB de los workers del pool de la versión indicada (excluye maestro y otras versiones)"""
+    processes = {}
+    for pid in os.listdir(proc_dir):
+        if pid.isdigit():
+            try:
+                status = read_process_status(pid, proc_dir)
+            except OSError:
+                continue
+            if status.get('Name', '').startswith('php-fpm'):
+                processes[pid] = status
+    masters = {pid for pid, status in processes.items()
+               if status['cmdline'].startswith('php-fpm: master process') and f'/etc/php/{version}/' in status['cmdline']}
+    titles = [f"php-fpm: pool {pool}"] if pool else None
+    return [status.get('VmRSS', 0) / 1024 for status in processes.values()
+            if status.get('PPid') in masters and status['cmdline'].startswith('php-fpm: pool ')
+            and (titles is None or status['cmdline'] in titles)]
+
+def php_fpm_pool_name(text):
+    """Nombre de la primera sección [pool] de un archivo de pool.d"""
+    match = re.search(r'^\s*\[([^\]]+)\]', text, re.M)
+    return match.group(1).strip() if match else None
+
+def count_php_files(root='/var/www', limit=200000):
+    count = 0
+    for _, _, files in os.walk(root):
+        count += sum(1 for name in files if name.endswith('.php'))
+        if count >= limit:
+            break
+    return count
+
+def compute_php_fpm_pool(total_mb, reserved_mb, worker_mb, php_files=0):
+    """Calcula pm, max_children, spare servers y opcache; devuelve (pool, opcache, pasos del cálculo)"""
+    opcache_mb = 128 if total_mb < 4096 else 256
+    interned_mb = 16 if total_mb < 4096 else 32
+    max_files = min(max(int(php_files * 1.5), 10000), 100000)
+    available_mb = total_mb - reserved_mb - opcache_mb
+    max_children = max(int(available_mb // worker_mb), 2)
+    steps = [
+        f"RAM total {total_mb} MB - reservada {reserved_mb} MB - opcache {opcache_mb} MB = {available_mb} MB para workers",
+        f"{available_mb} MB / {worker_mb:.1f} MB por worker = pm.max_children {max_children}",
+    ]
+    if total_mb < 2048:
+        pool = {'pm': 'ondemand', 'pm.max_children': max_children, 'pm.process_idle_timeout': '10s'}
+        steps.append("Menos de 2 GB de RAM: pm = ondemand (sin workers ociosos ocupando memoria)")
+    else:
+        min_spare = max(max_children // 10, 2)
+        max_spare = max(max_children * 3 // 10, min_spare + 2)
+        pool = {'pm': 'dynamic', 'pm.max_children': max_children,
+                'pm.start_servers': min(max((min_spare + max_spare) // 2, min_spare), max_children),
+                'pm.min_spare_servers': min(min_spare, max_children),
+                'pm.max_spare_servers': min(max_spare, max_children)}
+        steps.append(f"pm = dynamic; spare servers 10%-30% de max_children: {pool['pm.min_spare_servers']}-"
+                     f"{pool['pm.max_spare_servers']}, arranque {pool['pm.start_servers']}")
+    pool['pm.max_requests'] = 500
+    steps.append("pm.max_requests 500: recicla workers para contener fugas de memoria")
+    opcache = {'opcache.enable': 1, 'opcache.memory_consumption': opcache_mb,
+               'opcache.interned_strings_buffer': interned_mb, 'opcache.max_accelerated_files': max_files,
+               'opcache.revalidate_freq': 60}
+    steps.append(f"opcache {opcache_mb} MB, interned strings {interned_mb} MB, "
+                 f"max_accelerated_files {max_files} ({php_files} archivos .php en /var/www)")
+    return pool, opcache, steps
+
+def set_ini_values(text, values):
+    """Fija claves 'clave = valor' reutilizando la línea existente (activa o comentada con ';')"""
+    lines = text.splitlines()
+    pending = dict(values)
+    for idx, line in enumerate(lines):
+        match = re.match(r'^\s*;?\s*([\w.]+)\s*=', line)
+        if match and match.group(1) in pending:
+            key = match.group(1)
+            if line.lstrip().startswith(';') and any(re.match(rf'^\s*{re.escape(key)}\s*=', other) for other in lines):
+                continue  # Ya hay una línea activa para esta clave
+            lines[idx] = f"{key} = {pending.pop(key)}"
+    lines += [f"{key} = {value}" for key, value in pending.items()]
+    return '\n'.join(lines) + '\n'
+
+def write_if_changed(path, content):
+    """Escribe el archivo solo si el contenido cambia; devuelve True si lo modificó"""
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+def restore_php_fpm_files(previous):
+    """Vuelve a dejar cada archivo como estaba (None: no existía y se elimina)"""
+    for path, content in previous.items():
+        try:
+            if content is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                write_if_changed(path, content)
+        except OSError as e:
+            print_status(f"No se pudo restaurar {path}: {e}", 1)
+
+def configure_php_fpm_pool():
+    """Dimensiona el pool de PHP-FPM con la memoria medida de los workers"""
+    versions = php_fpm_versions()
+    if not versions:
+        print_status("PHP-FPM no está instalado", 1)
+        return
+    version = versions[-1]
+    if len(versions) > 1:
+        chosen = input(f"Versión de PHP-FPM {versions} [{version}]: ").strip()
+        version = chosen if chosen in versions else version
+    pool_dir = f"/etc/php/{version}/fpm/pool.d"
+    pool_files = sorted(name for name in os.listdir(pool_dir) if name.endswith('.conf')) \
+        if os.path.isdir(pool_dir) else []
+    if not pool_files:
+        print_status(f"No hay pools en {pool_dir}", 1)
+        return
+    pool_file = 'www.conf' if 'www.conf' in pool_files else pool_files[0]
+    if len(pool_files) > 1:
+        chosen = input(f"Archivo de pool {pool_files} [{pool_file}]: ").strip()
+        pool_file = chosen if chosen in pool_files else pool_file
+    pool_path = os.path.join(pool_dir, pool_file)
+    try:
+        with open(pool_path, 'r') as f:
+            pool_text = f.read()
+    except OSError as e:
+        print_status(f"No se pudo leer {pool_path}: {e}", 1)
+        return
+    pool_name = php_fpm_pool_name(pool_text)
+
+    workers = measure_php_fpm_workers(version, pool_name)
+    if len(workers) >= 2:
+        worker_mb = statistics.mean(workers)
+        print(f"Medidos {len(workers)} workers del pool {pool_name} (PHP {version}): RSS medio {worker_mb:.1f} MB, máximo {max(workers):.1f} MB "
+              "(incluye páginas compartidas, cálculo conservador)")
+    else:
+        value = input(f"No hay workers que medir. MB estimados por worker [{PHP_FPM_WORKER_ESTIMATE_MB}]: ").strip()
+        worker_mb = float(value) if value.isdigit() and int(value) > 0 else PHP_FPM_WORKER_ESTIMATE_MB
+    total_mb = read_meminfo().get('MemTotal', 0) // 1024
+    default_reserved = max(512, total_mb // 4)
+    value = input(f"MB reservados para el sistema y otros servicios (MySQL, Redis...) [{default_reserved}]: ").strip()
+    reserved_mb = int(value) if value.isdigit() else default_reserved
+
+    pool, opcache, steps = compute_php_fpm_pool(total_mb, reserved_mb, worker_mb, count_php_files())
+    print("Cálculo:")
+    for step in steps:
+        print(f"  - {step}")
+
+    opcache_ini = "; Generado por menu.py\n" + ''.join(f"{key} = {value}\n" for key, value in opcache.items())
+    opcache_path = f"/etc/php/{version}/fpm/conf.d/{PHP_FPM_OPCACHE_DROPIN}"
+    previous = {pool_path: pool_text}
+    try:
+        with open(opcache_path, 'r') as f:
+            previous[opcache_path] = f.read()
+    except OSError:
+        previous[opcache_path] = None
+    try:
+        pool_changed = write_if_changed(pool_path, set_ini_values(pool_text, pool))
+        opcache_changed = write_if_changed(opcache_path, opcache_ini)
+    except OSError as e:
+        print_status(f"Error al escribir la configuración de PHP-FPM {version}: {e}", 1)
+        restore_php_fpm_files(previous)
+        return
+    if not (pool_changed or opcache_changed):
+        print_status("El pool ya tenía estos valores; no se reinicia PHP-FPM", 0)
+        return
+    if run_command(f'sudo php-fpm{version} -t') and run_command(f'sudo systemctl reload php{version}-fpm'):
+        print_status(f"Pool actualizado en {pool_path} y PHP-FPM {version} recargado", 0)
+        return
+    # Una configuración inválida no se deja en disco: rompería el próximo reinicio
+    print_status(f"PHP-FPM {version} no validó o no recargó el nuevo pool; se restaura la configuración anterior", 1)
+    restore_php_fpm_files(previous)
+    run_command(f'sudo systemctl reload php{version}-fpm')
+
 def install_php():
     while True:
         os.system('clear')
@@ -1499,17 +6132,22 @@ def install_php():
         print("        Submenú de Instalación PHP")
         print("--------------------------------------------------")
         print("1. Instalar PHP")
-        print("2. Volver al menú anterior")
+        print("2. Dimensionar pool de PHP-FPM y opcache")
+        print("3. Volver al menú anterior")
         print("--------------------------------------------------")
-        php_choice = input("Seleccione una opción [1-2]: ").strip()
+        php_choice = input("Seleccione una opción [1-3]: ").strip()
         if php_choice == '1':
             version = select_version("php")
             if version:
                 if run_command(f'sudo apt-get update') and run_command(f'sudo apt-get install -y php={version} php-cli php-fpm php-json php-common php-mysql php-zip php-gd php-mbstring php-curl php-xml php-bcmath php-json'):
                     print_status("PHP y módulos instalados", 0)
+                    if input("¿Dimensionar el pool de PHP-FPM para este servidor? (si/no): ").strip().lower() == 'si':
+                        configure_php_fpm_pool()
                 else:
                     print_status("Error al instalar PHP", 1)
         elif php_choice == '2':
+            configure_php_fpm_pool()
+        elif php_choice == '3':
             break
         else:
             print("Opción inválida! Por favor seleccione una opción válida.")
@@ -1540,13 +6178,172 @@ def install_git():
     else:
         print_status("Error al instalar Git", 1)
 
+MEMORY_DAEMON_CONFIG = "/etc/menu_scripts/memory-maintenance.json"
+MEMORY_DAEMON_LOG = "/var/log/menu_memory_maintenance.log"
+MEMORY_DAEMON_DEFAULTS = {
+    'interval': 10,              # segundos entre muestras
+    'memory_some_avg10': 10.0,   # % de tiempo con tareas esperando memoria
+    'memory_full_avg10': 2.0,    # % de tiempo con todas las tareas bloqueadas
+    'io_full_avg10': 20.0,       # con I/O saturado no se liberan dentries/inodos
+    'min_available_pct': 10.0,   # MemAvailable mínimo antes de actuar
+    'slab_reclaimable_pct': 10.0,
+    'fragmentation': 0.8,        # fracción de memoria libre en bloques < 64 KB
+    'cooldown': 300              # segundos mínimos entre intervenciones
+}
+
+def read_memory_fragmentation():
+    """Fracción de páginas libres en bloques de orden < 4 (menos de 64 KB contiguos)"""
+    total = high_order = 0
+    try:
+        with open('/proc/buddyinfo', 'r') as f:
+            for line in f:
+                counts = [int(value) for value in line.split()[4:]]
+                for order, count in enumerate(counts):
+                    total += count << order
+                    if order >= 4:
+                        high_order += count << order
+    except OSError:
+        return 0.0
+    return 1 - high_order / total if total else 0.0
+
+def read_memory_state():
+    meminfo = read_meminfo()
+    memory = read_pressure('memory')
+    io_pressure = read_pressure('io')
+    return {
+        'mem_some_avg10': memory.get('some', {}).get('avg10', 0.0),
+        'mem_full_avg10': memory.get('full', {}).get('avg10', 0.0),
+        'io_full_avg10': io_pressure.get('full', {}).get('avg10', 0.0),
+        'MemAvailable': meminfo.get('MemAvailable', 0),
+        'SReclaimable': meminfo.get('SReclaimable', 0),
+        'available_pct': 100.0 * meminfo.get('MemAvailable', 0) / meminfo['MemTotal'],
+        'slab_pct': 100.0 * meminfo.get('SReclaimable', 0) / meminfo['MemTotal'],
+        'fragmentation': read_memory_fragmentation()
+    }
+
+def choose_memory_action(state, config):
+    """Decide la intervención; nunca descarta la caché de páginas"""
+    under_pressure = (state['mem_some_avg10'] >= config['memory_some_avg10']
+                      or state['mem_full_avg10'] >= config['memory_full_avg10'])
+    if not under_pressure:
+        return None, None
+    if state['fragmentation'] >= config['fragmentation']:
+        return 'compact', f"presión con fragmentación {state['fragmentation']:.2f}"
+    if (state['available_pct'] < config['min_available_pct'] and state['slab_pct'] >= config['slab_reclaimable_pct']
+            and state['io_full_avg10'] < config['io_full_avg10']):
+        return 'drop_slab', f"MemAvailable {state['available_pct']:.1f}% con slab recuperable {state['slab_pct']:.1f}%"
+    return None, None
+
+def run_memory_action(action):
+    if action == 'compact':
+        path, value = '/proc/sys/vm/compact_memory', '1'
+    else:
+        # 2 = solo dentries e inodos (slab); 1 o 3 vaciarían la caché de páginas
+        path, value = '/proc/sys/vm/drop_caches', '2'
+    with open(path, 'w') as f:
+        f.write(value)
+
+def format_memory_state(state):
+    return (f"MemAvailable={state['MemAvailable'] // 1024}MB SReclaimable={state['SReclaimable'] // 1024}MB "
+            f"frag={state['fragmentation']:.2f} psi_mem_some={state['mem_some_avg10']:.2f} "
+            f"psi_mem_full={state['mem_full_avg10']:.2f} psi_io_full={state['io_full_avg10']:.2f}")
+
+def log_memory_intervention(message, log_path=MEMORY_DAEMON_LOG):
+    line = f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}"
+    print(line)
+    with open(log_path, 'a') as f:
+        f.write(line + '\n')
+
+def load_memory_daemon_config(config_path=MEMORY_DAEMON_CONFIG):
+    config = dict(MEMORY_DAEMON_DEFAULTS)
+    try:
+        with open(config_path, 'r') as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return config
+
+def memory_maintenance_daemon(config_path=MEMORY_DAEMON_CONFIG, log_path=MEMORY_DAEMON_LOG):
+    """Vigila PSI y /proc/meminfo y actúa solo al superar los umbrales"""
+    config = load_memory_daemon_config(config_path)
+    if not read_pressure('memory'):
+        print("PSI no disponible (/proc/pressure); requiere kernel 4.20+ con psi habilitado")
+        return
+    last_action = 0.0
+    log_memory_intervention(f"inicio: umbrales {json.dumps(config, sort_keys=True)}", log_path)
+    while True:
+        state = read_memory_state()
+        action, reason = choose_memory_action(state, config)
+        if action and time.monotonic() - last_action >= config['cooldown']:
+            try:
+                run_memory_action(action)
+            except OSError as e:
+                log_memory_intervention(f"{action} falló: {e}", log_path)
+            else:
+                # Se espera un intervalo para que PSI refleje el efecto
+                time.sleep(min(config['interval'], 5))
+                log_memory_intervention(f"{action} ({reason}); antes: {format_memory_state(state)}; "
+                                        f"después: {format_memory_state(read_memory_state())}", log_path)
+            last_action = time.monotonic()
+        time.sleep(config['interval'])
+
+def install_memory_maintenance_daemon():
+    """Instala el demonio como servicio systemd y retira el cron de drop_caches"""
+    config = load_memory_daemon_config()
+    print("Umbrales (Enter para mantener el valor actual):")
+    for key, value in config.items():
+        new_value = input(f"  {key} [{value}]: ").strip()
+        if new_value:
+            try:
+                config[key] = type(MEMORY_DAEMON_DEFAULTS[key])(new_value)
+            except (ValueError, KeyError):
+                print(f"  Valor inválido para {key}, se mantiene {value}")
+    os.makedirs(os.path.dirname(MEMORY_DAEMON_CONFIG), exist_ok=True)
+    with open(MEMORY_DAEMON_CONFIG, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    service = f"""[Unit]
+Description=Mantenimiento de memoria basado en presión (PSI)
+After=multi-user.target
+
+[Service]
+ExecStart=/usr/bin/python3 {os.path.abspath(__file__)} --memory-daemon
+Restart=on-failure
+Nice=10
+
+[Install]
+WantedBy=multi-user.target
+"""
+    with open('/etc/systemd/system/menu-memory-maintenance.service', 'w') as f:
+        f.write(service)
+
+    cron_path = "/etc/cron.d/optimize_system"
+    if os.path.exists(cron_path):
+        with open(cron_path, 'r') as f:
+            if 'drop_caches' in f.read():
+                os.remove(cron_path)
+                print_status(f"Cron de drop_caches eliminado ({cron_path})", 0)
+
+    if run_command('sudo systemctl daemon-reload') and run_command('sudo systemctl enable --now menu-memory-maintenance'):
+        print_status(f"Demonio de memoria activo; intervenciones en {MEMORY_DAEMON_LOG}", 0)
+    else:
+        print_status("Error al activar el demonio de memoria", 1)
+
 def configure_cronjob():
+    print("Opciones de mantenimiento de memoria:")
+    print("1. Demonio basado en presión (PSI): compacta memoria o libera solo slab cuando hace falta (recomendado)")
+    print("2. Cronjob personalizado")
+    choice = input("Seleccione una opción [1-2]: ").strip()
+    if choice == '1':
+        install_memory_maintenance_daemon()
+        return
+    if choice != '2':
+        print("Opción inválida.")
+        return
+
     print("Configurando cronjob...")
-    print("Recomendaciones de comandos para optimizar el sistema:")
-    print("1. echo 3 > /proc/sys/vm/drop_caches")
-    print("2. sync; echo 3 > /proc/sys/vm/drop_caches")
-    print("3. sysctl -w vm.drop_caches=3")
-    print("4. /sbin/sysctl -w vm.drop_caches=3")
+    print("Nota: 'echo 3 > /proc/sys/vm/drop_caches' descarta la caché de páginas en caliente y provoca")
+    print("picos de latencia en bases de datos y servidores web; prefiera el demonio basado en presión.")
     command = input("Ingrese el comando a usar para el cronjob: ").strip()
     schedule = input("Ingrese el tiempo de ejecución del cronjob (ej. '0 3 * * *' para cada día a las 3am): ").strip()
     
@@ -1694,34 +6491,285 @@ def configure_dhcp():
         else:
             print("Selección inválida.")
 
+DISK_FILESYSTEMS = {
+    'ext4': "ext4 (uso general, journal ordenado)",
+    'xfs': "xfs (archivos grandes y escrituras concurrentes)",
+}
+DISK_MOUNT_OPTIONS = {
+    'ext4': "defaults,noatime",
+    'xfs': "defaults,noatime,logbufs=8,logbsize=256k",
+}
+DISK_BENCH_BLOCK = 1024 * 1024
+DISK_BENCH_RANDOM_BLOCK = 4096
+
+def partition_device(disk):
+    """Nombre de la primera partición (sdb -> sdb1, nvme0n1 -> nvme0n1p1, loop0 -> loop0p1)"""
+    return f"/dev/{disk}p1" if disk[-1].isdigit() else f"/dev/{disk}1"
+
+def read_disk_alignment(disk, sys_block='/sys/block'):
+    """Unidad y ancho de stripe en bytes según la cola del bloque (0 si el disco no los informa)"""
+    values = {}
+    for key in ['logical_block_size', 'minimum_io_size', 'optimal_io_size', 'rotational']:
+        try:
+            with open(f"{sys_block}/{disk}/queue/{key}", 'r') as f:
+                values[key] = int(f.read().strip())
+        except (OSError, ValueError):
+            values[key] = 0
+    stripe_unit = values['minimum_io_size'] if values['optimal_io_size'] > values['minimum_io_size'] > 4096 else 0
+    return {
+        'stripe_unit': stripe_unit,
+        'stripe_width': values['optimal_io_size'] if stripe_unit else 0,
+        'sector': values['logical_block_size'] or 512,
+        'rotational': values['rotational'] == 1,
+    }
+
+def mke2fs_supports_fast_commit():
+    """fast_commit (e2fsprogs >= 1.46) reduce la latencia de fsync del journal de ext4"""
+    match = re.search(r'mke2fs (\d+)\.(\d+)', subprocess.getoutput("mkfs.ext4 -V 2>&1"))
+    return bool(match) and (int(match.group(1)), int(match.group(2))) >= (1, 46)
+
+def mkfs_command(filesystem, device, alignment, fast_commit=False, label=None):
+    """Comando mkfs con alineación al stripe (RAID) y journal adecuado para un disco de datos"""
+    if filesystem == 'xfs':
+        command = ['mkfs.xfs', '-f']
+        if alignment['stripe_unit']:
+            command += ['-d', f"su={alignment['stripe_unit']},sw={alignment['stripe_width'] // alignment['stripe_unit']}",
+                        '-l', f"su={min(alignment['stripe_unit'], 256 * 1024)}"]
+        command += ['-L', label] if label else []
+        return command + [device]
+    # Disco de datos: sin bloques reservados para root e inicialización completa ahora, no en segundo plano
+    extended = ['lazy_itable_init=0', 'lazy_journal_init=0']
+    if alignment['stripe_unit']:
+        stride = alignment['stripe_unit'] // 4096
+        extended = [f"stride={stride}", f"stripe_width={alignment['stripe_width'] // 4096}"] + extended
+    command = ['mkfs.ext4', '-F', '-b', '4096', '-m', '0', '-E', ','.join(extended)]
+    command += ['-O', 'fast_commit'] if fast_commit else []
+    command += ['-L', label] if label else []
+    return command + [device]
+
+def device_uuid(device):
+    return subprocess.getoutput(f"blkid -s UUID -o value {device}").strip()
+
+def format_disk(device, filesystem, mount_point, alignment, fstab_path='/etc/fstab'):
+    """Formatea y monta el dispositivo; con fstab_path agrega la entrada por UUID"""
+    fast_commit = filesystem == 'ext4' and mke2fs_supports_fast_commit()
+    subprocess.run(mkfs_command(filesystem, device, alignment, fast_commit), check=True)
+    os.makedirs(mount_point, exist_ok=True)
+    subprocess.run(["mount", "-o", DISK_MOUNT_OPTIONS[filesystem], device, mount_point], check=True)
+    if fstab_path:
+        uuid = device_uuid(device)
+        if not uuid:
+            raise OSError(f"No se pudo leer el UUID de {device}")
+        ensure_fstab_entry(f"UUID={uuid}", f"UUID={uuid} {mount_point} {filesystem} {DISK_MOUNT_OPTIONS[filesystem]} 0 2",
+                           fstab_path)
+
+def disk_bench_buffer(size, fill=True):
+    """Buffer alineado a página (requisito de O_DIRECT)"""
+    buffer = mmap.mmap(-1, size)
+    if fill:
+        buffer.write(os.urandom(size))
+    return buffer
+
+def open_direct(path, flags):
+    """Abre con O_DIRECT; si el sistema de archivos no lo admite (tmpfs) abre sin él"""
+    try:
+        return os.open(path, flags | os.O_DIRECT, 0o600), True
+    except OSError:
+        return os.open(path, flags, 0o600), False
+
+def benchmark_disk(directory, size_mb=256, duration=5.0, threads=4):
+    """Rendimiento secuencial, IOPS aleatorias de 4k y latencia de fsync con E/S directa"""
+    path = os.path.join(directory, f".menu-io-bench-{os.getpid()}")
+    blocks = size_mb * 1024 * 1024 // DISK_BENCH_BLOCK
+    results = {}
+    try:
+        fd, direct = open_direct(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        results['direct'] = direct
+        buffer = disk_bench_buffer(DISK_BENCH_BLOCK)
+        try:
+            started = time.monotonic()
+            for block in range(blocks):
+                os.pwrite(fd, buffer, block * DISK_BENCH_BLOCK)
+            os.fsync(fd)
+            results['seq_write_mbps'] = size_mb / (time.monotonic() - started)
+        finally:
+            os.close(fd)
+
+        fd, _ = open_direct(path, os.O_RDONLY)
+        try:
+            started = time.monotonic()
+            for block in range(blocks):
+                os.lseek(fd, block * DISK_BENCH_BLOCK, os.SEEK_SET)
+                os.readv(fd, [buffer])
+            results['seq_read_mbps'] = size_mb / (time.monotonic() - started)
+
+            # Varias lecturas concurrentes: os.readv libera el GIL mientras espera al disco
+            random_blocks = size_mb * 1024 * 1024 // DISK_BENCH_RANDOM_BLOCK
+            deadline = time.monotonic() + duration / 2
+
+            def random_reads():
+                local_fd, _ = open_direct(path, os.O_RDONLY)
+                local_buffer = disk_bench_buffer(DISK_BENCH_RANDOM_BLOCK, fill=False)
+                rng = random.Random()
+                count = 0
+                try:
+                    while time.monotonic() < deadline:
+                        os.lseek(local_fd, rng.randrange(random_blocks) * DISK_BENCH_RANDOM_BLOCK, os.SEEK_SET)
+                        os.readv(local_fd, [local_buffer])
+                        count += 1
+                finally:
+                    os.close(local_fd)
+                return count
+
+            started = time.monotonic()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                total = sum(executor.map(lambda _: random_reads(), range(threads)))
+            results['random_read_iops'] = total / (time.monotonic() - started)
+            results['random_threads'] = threads
+        finally:
+            os.close(fd)
+
+        # Latencia de commit: escritura de 4k + fdatasync, como un journal de base de datos
+        fd = os.open(path, os.O_WRONLY)
+        latencies = []
+        try:
+            payload = os.urandom(DISK_BENCH_RANDOM_BLOCK)
+            deadline = time.monotonic() + duration / 2
+            while time.monotonic() < deadline and len(latencies) < 10000:
+                started = time.monotonic()
+                os.pwrite(fd, payload, (len(latencies) % 256) * DISK_BENCH_RANDOM_BLOCK)
+                os.fdatasync(fd)
+                latencies.append((time.monotonic() - started) * 1000)
+        finally:
+            os.close(fd)
+        latencies.sort()
+        results['fsync_p50_ms'] = latencies[len(latencies) // 2]
+        results['fsync_p99_ms'] = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return results
+
+def print_disk_benchmark(results):
+    mode = "O_DIRECT" if results['direct'] else "sin O_DIRECT (no soportado; incluye caché)"
+    print(f"Benchmark de E/S ({mode}):")
+    print(f"  Escritura secuencial:   {results['seq_write_mbps']:10.1f} MB/s")
+    print(f"  Lectura secuencial:     {results['seq_read_mbps']:10.1f} MB/s")
+    print(f"  Lectura aleatoria 4k:   {results['random_read_iops']:10.0f} IOPS ({results['random_threads']} hilos)")
+    print(f"  fsync (4k + fdatasync): {results['fsync_p50_ms']:10.2f} ms p50, {results['fsync_p99_ms']:.2f} ms p99")
+
+def prompt_filesystem():
+    filesystems = list(DISK_FILESYSTEMS)
+    for idx, filesystem in enumerate(filesystems, start=1):
+        print(f"{idx}. {DISK_FILESYSTEMS[filesystem]}")
+    choice = input(f"Seleccione el sistema de archivos [1-{len(filesystems)}] (1): ").strip()
+    filesystem = filesystems[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(filesystems) else 'ext4'
+    if not shutil.which(f"mkfs.{filesystem}"):
+        print(f"mkfs.{filesystem} no está instalado; instalando...")
+        run_command(f"sudo apt-get install -y {'xfsprogs' if filesystem == 'xfs' else 'e2fsprogs'}")
+    return filesystem
+
+def benchmark_disk_loopback(size_mb=1024):
+    """Prueba el formateo, el montaje y el benchmark sobre un archivo loopback desechable"""
+    filesystem = prompt_filesystem()
+    directory = input("Directorio para el archivo loopback [/var/tmp]: ").strip() or "/var/tmp"
+    image = os.path.join(directory, "menu-disk-test.img")
+    mount_point = tempfile.mkdtemp(prefix="menu-disk-test-")
+    loop_device = None
+    try:
+        with open(image, 'wb') as f:
+            f.truncate(size_mb * 1024 * 1024)
+        loop_device = subprocess.check_output(["losetup", "-f", "--show", "--direct-io=on", image],
+                                              universal_newlines=True).strip()
+        disk = os.path.basename(loop_device)
+        format_disk(loop_device, filesystem, mount_point, read_disk_alignment(disk), fstab_path=None)
+        print_status(f"{filesystem} creado en {loop_device} y montado en {mount_point}", 0)
+        print_disk_benchmark(benchmark_disk(mount_point, size_mb=min(256, size_mb // 4)))
+    except (OSError, subprocess.CalledProcessError) as e:
+        print_status(f"Error en la prueba loopback: {e}", 1)
+    finally:
+        subprocess.run(["umount", mount_point], stderr=subprocess.DEVNULL)
+        if os.path.ismount(mount_point):
+            # Sigue montado (algún proceso lo usa): no se borra nada que esté debajo
+            print_status(f"No se pudo desmontar {mount_point}; quedan {loop_device} y {image} para revisión", 1)
+        else:
+            if loop_device:
+                subprocess.run(["losetup", "-d", loop_device])
+            os.rmdir(mount_point)
+            if os.path.exists(image):
+                os.remove(image)
+
+def mount_point_error(path):
+    """Motivo por el que path no sirve como punto de montaje de un disco nuevo (None si es válido)"""
+    if not path or not os.path.isabs(path):
+        return "El punto de montaje debe ser una ruta absoluta (ej. /mnt/datos)."
+    path = os.path.normpath(path)
+    if os.path.ismount(path):
+        return f"{path} ya es un punto de montaje."
+    if os.path.exists(path) and not os.path.isdir(path):
+        return f"{path} existe y no es un directorio."
+    if os.path.isdir(path) and os.listdir(path):
+        return f"{path} no está vacío; montar encima ocultaría su contenido."
+    return None
+
 def configure_new_disk():
+    # parted, mkfs, mount, blkid y losetup necesitan root; sin él se detendría a medio formatear
+    if not is_root():
+        print_status("Se requieren privilegios de root para configurar discos (ejecute con sudo)", 1)
+        return
     print("Configurando nuevo disco...")
     while True:
-        disks = subprocess.getoutput("lsblk -dn -o NAME,SIZE").splitlines()
+        disks = subprocess.getoutput("lsblk -dn -e 7 -o NAME,SIZE,ROTA,MODEL").splitlines()
         print("Discos disponibles:")
         for idx, disk in enumerate(disks, start=1):
             print(f"{idx}. {disk}")
-        print(f"{len(disks) + 1}. Volver al menú anterior")
+        print(f"{len(disks) + 1}. Probar formateo y benchmark en un archivo loopback")
+        print(f"{len(disks) + 2}. Volver al menú anterior")
 
         choice = input("Seleccione un disco por número: ").strip()
         if choice.isdigit() and 1 <= int(choice) <= len(disks):
             disk = disks[int(choice) - 1].split()[0]
-            mount_point = input("Ingrese el punto de montaje (ej. /mnt/nuevo_disco): ").strip()
-
-            # Crear partición, formatear y montar el disco
-            subprocess.run(["sudo", "parted", f"/dev/{disk}", "mklabel", "gpt"], check=True)
-            subprocess.run(["sudo", "parted", f"/dev/{disk}", "mkpart", "primary", "ext4", "0%", "100%"], check=True)
-            subprocess.run(["sudo", "mkfs.ext4", f"/dev/{disk}1"], check=True)
-            subprocess.run(["sudo", "mkdir", "-p", mount_point], check=True)
-            subprocess.run(["sudo", "mount", f"/dev/{disk}1", mount_point], check=True)
-
-            # Agregar a /etc/fstab
-            with open("/etc/fstab", "a") as fstab:
-                fstab.write(f"/dev/{disk}1 {mount_point} ext4 defaults 0 0\n")
+            if subprocess.getoutput(f"lsblk -n -o MOUNTPOINT /dev/{disk}").strip():
+                print_status(f"/dev/{disk} tiene particiones montadas; no se modifica", 1)
+                continue
+            if input(f"Se borrarán todos los datos de /dev/{disk}. ¿Continuar? (si/no): ").strip().lower() != 'si':
+                continue
+            filesystem = prompt_filesystem()
+            while True:
+                mount_point = input("Ingrese el punto de montaje (ej. /mnt/nuevo_disco): ").strip()
+                error = mount_point_error(mount_point)
+                if not error:
+                    break
+                print(error)
+            alignment = read_disk_alignment(disk)
+            if alignment['stripe_unit']:
+                print(f"Alineación RAID: unidad {alignment['stripe_unit'] // 1024} KB, "
+                      f"ancho {alignment['stripe_width'] // 1024} KB")
+
+            # Partición alineada a 1 MiB y formateo con alineación al stripe
+            try:
+                subprocess.run(["parted", "-s", "-a", "optimal", f"/dev/{disk}", "mklabel", "gpt"], check=True)
+                subprocess.run(["parted", "-s", "-a", "optimal", f"/dev/{disk}", "mkpart", "primary",
+                                filesystem, "1MiB", "100%"], check=True)
+                subprocess.run(["udevadm", "settle"])
+                device = partition_device(disk)
+                format_disk(device, filesystem, mount_point, alignment)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print_status(f"Error al configurar /dev/{disk}: {e}", 1)
+                break
 
-            print_status(f"Disco /dev/{disk} configurado y montado en {mount_point}", 0)
+            print_status(f"Disco /dev/{disk} configurado ({filesystem}, {DISK_MOUNT_OPTIONS[filesystem]}) "
+                         f"y montado en {mount_point}", 0)
+            if input("¿Ejecutar un benchmark rápido de E/S? (si/no): ").strip().lower() == 'si':
+                try:
+                    print_disk_benchmark(benchmark_disk(mount_point))
+                except OSError as e:
+                    print_status(f"Error en el benchmark de {mount_point}: {e}", 1)
             break
         elif choice == str(len(disks) + 1):
+            benchmark_disk_loopback()
+            break
+        elif choice == str(len(disks) + 2):
             break
         else:
             print("Selección inválida.")
@@ -1758,15 +6806,27 @@ def docker_submenu():
         print("        Submenú de Contenedores Docker")
         print("--------------------------------------------------")
         print("1. Desplegar Selenium")
-        print("2. Volver al menú principal")
+        print("2. Contenedores con estadísticas en vivo")
+        print("3. Iniciar, detener o reiniciar contenedores")
+        print("4. Ver logs de un contenedor")
+        print("5. Volver al menú principal")
         print("--------------------------------------------------")
-        docker_choice = input("Seleccione una opción [1-2]: ").strip()
-        if docker_choice == '1':
-            deploy_selenium()
-        elif docker_choice == '2':
-            break
-        else:
-            print("Opción inválida! Por favor seleccione una opción válida.")
+        docker_choice = input("Seleccione una opción [1-5]: ").strip()
+        try:
+            if docker_choice == '1':
+                deploy_selenium()
+            elif docker_choice == '2':
+                docker_live_stats()
+            elif docker_choice == '3':
+                docker_bulk_action_menu()
+            elif docker_choice == '4':
+                docker_logs_menu()
+            elif docker_choice == '5':
+                break
+            else:
+                print("Opción inválida! Por favor seleccione una opción válida.")
+        except OSError as e:
+            print_status(f"No se pudo contactar con Docker ({DOCKER_SOCKET}): {e}", 1)
         input("Presione [Enter] para continuar...")
 
 def configure_samba():
@@ -1904,7 +6964,7 @@ def main_menu():
         print("16. Expandir disco")
         print("17. Configurar memoria swap")
         print("18. Optimizar sistema")
-        print("19. Automatizar optimización del sistema con cronjob")
+        print("19. Mantenimiento de memoria (demonio PSI o cronjob)")
         print("20. Configurar nuevo disco")
         
         print("\n=== DOCKER Y CONTENEDORES ===")
@@ -1919,12 +6979,12 @@ def main_menu():
         print("25. Configurar NFS")
         
         print("\n=== MONITOREO Y HERRAMIENTAS ===")
-        print("26. Instalar herramientas de monitoreo")
+        print("26. Monitoreo del sistema (vista en vivo, herramientas)")
         print("27. Instalar servicios comunes")
         print("28. Gestionar índices de Elasticsearch")
         
         print("\n=== MANTENIMIENTO ===")
-        print("29. Crear backup del sistema")
+        print("29. Backups del sistema (crear, restaurar)")
         print("30. Actualizar script")
         
         print("\n=== SALIR ===")
@@ -1989,7 +7049,7 @@ def main_menu():
         elif choice == '28':
             manage_elasticsearch_indices()
         elif choice == '29':
-            backup_system()
+            backup_submenu()
         elif choice == '30':
             update_script()
         elif choice == '31':
@@ -1999,7 +7059,19 @@ def main_menu():
             print("Opción inválida! Por favor seleccione una opción válida.")
         input("Presione [Enter] para continuar...")
 
+# Acciones no interactivas para cron y servicios systemd
+CLI_ACTIONS = {
+    '--rotate-ssh-logs': rotate_ssh_command_logs,
+    '--memory-daemon': memory_maintenance_daemon,
+    '--metrics-exporter': metrics_exporter,
+    '--es-index-snapshot': es_index_snapshot,
+}
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_ACTIONS:
+        CLI_ACTIONS[sys.argv[1]]()
+        sys.exit(0)
+
     print("Buscando actualizaciones...")
     spinner = spinning_cursor()
     spinner_thread = threading.Thread(target=check_for_updates)
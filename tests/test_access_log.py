@@ -0,0 +1,49 @@
+import gzip
+
+import menu
+
+LINE = ('1.2.3.4 - - [10/Oct/2026:13:55:36 +0000] "GET {path} HTTP/1.1" 200 512 "-" "{agent}" {timing}\n')
+
+
+def write_log(tmp_path, lines, name='access.log'):
+    path = tmp_path / name
+    path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_timed_format_uses_trailing_fields(tmp_path):
+    path = write_log(tmp_path, [LINE.format(path='/api/users/42', agent='curl', timing='rt=0.120 urt="0.100"')])
+    routes, summary = menu.analyze_access_log([path])
+    stats = routes['GET /api/users/:id']
+    assert summary == {'lines': 1, 'parsed': 1, 'untimed': 0}
+    assert stats['count'] == 1
+    assert stats['total'] == 0.120
+    assert stats['upstream_sketch']
+
+
+def test_user_agent_cannot_inject_request_time(tmp_path):
+    path = write_log(tmp_path, [
+        LINE.format(path='/a', agent='evil rt=x', timing='rt=0.200 urt="-"'),
+        LINE.format(path='/b', agent='evil rt=9.9 urt=\\"1\\"', timing='rt=0.300 urt="0.250"'),
+        LINE.format(path='/c', agent='evil rt=9.9', timing='rt=- urt="-"'),
+    ])
+    routes, summary = menu.analyze_access_log([path])
+    assert routes['GET /a']['total'] == 0.200
+    assert routes['GET /b']['total'] == 0.300
+    assert 'GET /c' not in routes
+    assert summary['untimed'] == 1
+
+
+def test_trailing_request_time_format_and_gzip_rotation(tmp_path):
+    rotated = tmp_path / 'access.log.1.gz'
+    with gzip.open(str(rotated), 'wt') as f:
+        f.write(LINE.format(path='/y', agent='ua', timing='0.050 0.040'))
+    current = write_log(tmp_path, [LINE.format(path='/y', agent='ua', timing='0.150')])
+    routes, summary = menu.analyze_access_log([str(rotated), current])
+    assert routes['GET /y']['count'] == 2
+    assert summary['untimed'] == 0
+
+
+def test_normalize_route_groups_ids_and_hashes():
+    assert menu.normalize_route('/orders/123/items/550e8400-e29b-41d4-a716-446655440000') == '/orders/:id/items/:id'
+    assert menu.normalize_route('/static/app.3f9a0c1d2e.js') == '/static/app.:id.js'
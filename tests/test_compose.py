@@ -0,0 +1,41 @@
+import socket
+
+import menu
+
+
+def published_port(stack, http_port=None):
+    sizing = menu.size_compose_stack(stack, 8192, 4, 0.75, False)
+    compose, _, _ = menu.build_compose_stack(stack, sizing, http_port)
+    return compose['services'][stack]['ports']
+
+
+def test_wordpress_and_nextcloud_default_to_different_ports():
+    assert published_port('wordpress') == ['8080:80']
+    assert published_port('nextcloud') == ['8081:80']
+    assert published_port('nextcloud', 9000) == ['9000:80']
+
+
+def test_prompt_skips_ports_taken_by_host_or_other_stack(monkeypatch):
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        busy = listener.getsockname()[1]
+        assert menu.port_in_use(busy, '127.0.0.1')
+
+        monkeypatch.setattr(menu, 'port_in_use', lambda port: port == busy)
+        monkeypatch.setattr(menu, 'COMPOSE_HTTP_PORTS', {'wordpress': busy, 'nextcloud': busy})
+        answers = iter(['', str(busy), str(busy + 1), str(busy + 2)])
+        monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+        wordpress = menu.prompt_compose_port('wordpress', set())
+        nextcloud = menu.prompt_compose_port('nextcloud', {wordpress})
+    assert (wordpress, nextcloud) == (busy + 1, busy + 2)
+
+
+def test_host_budget_is_split_across_selected_stacks():
+    shares = menu.split_compose_share(['nginx', 'wordpress', 'nextcloud'], 0.75)
+    assert abs(sum(shares.values()) - 0.75) < 1e-9
+    assert shares['nginx'] < shares['wordpress'] < shares['nextcloud']
+    assert menu.split_compose_share(['wordpress'], 0.75) == {'wordpress': 0.75}
+
+    sizings = [menu.size_compose_stack(stack, 16384, 8, share) for stack, share in shares.items()]
+    assert sum(resources['memory_mb'] for sizing in sizings for resources in sizing.values()) <= 16384 * 0.75
@@ -0,0 +1,126 @@
+import os
+import random
+import stat
+
+import pytest
+
+import menu
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(menu, 'CDC_MIN_SIZE', 1024)
+    monkeypatch.setattr(menu, 'CDC_MAX_SIZE', 16 * 1024)
+    monkeypatch.setattr(menu, 'CDC_MASK', ((1 << 12) - 1) << 52)
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'conf').mkdir(parents=True)
+    data = random.Random(1).getrandbits(8 * 200 * 1024).to_bytes(200 * 1024, 'little')
+    (source / 'conf' / 'blob.bin').write_bytes(data)
+    (source / 'conf' / 'app.conf').write_text('listen 80;\n')
+    os.symlink('app.conf', str(source / 'conf' / 'current.conf'))
+    return source
+
+
+def snapshot(store, source):
+    return menu.create_dedup_snapshot(sources=[str(source)], store_dir=str(store))
+
+
+def test_chunks_round_trip_and_are_shared_between_snapshots(tmp_path, source, small_chunks):
+    store = tmp_path / 'store'
+    first = snapshot(store, source)
+    chunks = menu.load_dedup_manifest(str(store), first)['files'][f"{source}/conf/blob.bin"]['chunks']
+    assert len(chunks) > 1
+
+    data = (source / 'conf' / 'blob.bin').read_bytes()
+    (source / 'conf' / 'blob.bin').write_bytes(b'prefix' + data)
+    os.utime(str(source / 'conf' / 'blob.bin'), ns=(1, 1))
+    # Los ids son de resolución de segundos: se renombra el primero para no pisarlo
+    os.replace(str(store / 'snapshots' / f"{first}.json.gz"), str(store / 'snapshots' / '20000101-000000.json.gz'))
+    second = snapshot(store, source)
+    new_chunks = menu.load_dedup_manifest(str(store), second)['files'][f"{source}/conf/blob.bin"]['chunks']
+    assert len(set(chunks) & set(new_chunks)) >= len(chunks) - 2
+
+    target = tmp_path / 'restore'
+    count, restored, errors = menu.restore_dedup_snapshot(second, str(target), store_dir=str(store))
+    assert errors == 0 and count > 0
+    restored_dir = target / str(source).lstrip('/') / 'conf'
+    assert (restored_dir / 'blob.bin').read_bytes() == b'prefix' + data
+    assert (restored_dir / 'app.conf').read_text() == 'listen 80;\n'
+    assert os.readlink(str(restored_dir / 'current.conf')) == 'app.conf'
+
+
+def test_corrupted_chunk_is_reported_and_keeps_existing_file(tmp_path, source, small_chunks):
+    store = tmp_path / 'store'
+    snapshot_id = snapshot(store, source)
+    digest = menu.load_dedup_manifest(str(store), snapshot_id)['files'][f"{source}/conf/app.conf"]['chunks'][0]
+    chunk_path = store / 'chunks' / digest[:2] / digest
+    chunk_path.write_bytes(menu.zlib.compress(b'listen 8080;\n'))
+
+    target = tmp_path / 'restore'
+    existing = target / str(source).lstrip('/') / 'conf' / 'app.conf'
+    existing.parent.mkdir(parents=True)
+    existing.write_text('previous\n')
+    count, _, errors = menu.restore_dedup_snapshot(snapshot_id, str(target), f"{source}/conf/app.conf",
+                                                   store_dir=str(store))
+    assert (count, errors) == (0, 1)
+    assert existing.read_text() == 'previous\n'
+    assert not os.path.exists(f"{existing}.restore-tmp")
+
+
+def test_restore_replaces_directory_at_file_path(tmp_path, source, small_chunks):
+    store = tmp_path / 'store'
+    snapshot_id = snapshot(store, source)
+    target = tmp_path / 'restore'
+    in_the_way = target / str(source).lstrip('/') / 'conf' / 'app.conf'
+    (in_the_way / 'nested').mkdir(parents=True)
+
+    count, _, errors = menu.restore_dedup_snapshot(snapshot_id, str(target), f"{source}/conf", store_dir=str(store))
+    assert errors == 0 and count == 4
+    assert in_the_way.read_text() == 'listen 80;\n'
+    assert stat.S_ISLNK(os.lstat(str(in_the_way.parent / 'current.conf')).st_mode)
+
+
+@pytest.fixture
+def mysqldump(tmp_path, monkeypatch):
+    """mysqldump falso: 50000 bytes; la base "broken" se corta a la mitad y falla"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'mysqldump'
+    script.write_text('#!/bin/sh\nfor last; do :; done\n'
+                      'if [ "$last" = broken ]; then head -c 20000 /dev/zero | tr "\\0" "y"; exit 2; fi\n'
+                      'head -c 50000 /dev/zero | tr "\\0" "x"\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(menu, 'list_mysql_databases', lambda: ['shop', 'broken'])
+
+
+def test_unchanged_mysqldump_is_detected_without_new_chunks(tmp_path, small_chunks, mysqldump):
+    store = tmp_path / 'store'
+    store.mkdir()
+    entry, result = menu.dedup_store_mysql_dump(str(store), 'shop')
+    assert result['ok'] and not result['unchanged'] and entry['size'] == 50000
+    assert os.listdir(str(store)) == ['chunks']
+    again, result = menu.dedup_store_mysql_dump(str(store), 'shop', entry)
+    assert result['unchanged'] and result['bytes_new'] == 0
+    assert again['chunks'] == entry['chunks'] and again['sha256'] == entry['sha256']
+
+
+def test_failed_dump_keeps_previous_entry(tmp_path, small_chunks, mysqldump):
+    store = tmp_path / 'store'
+    store.mkdir()
+    source = tmp_path / 'empty'
+    source.mkdir()
+    first = menu.create_dedup_snapshot(sources=[str(source)], store_dir=str(store), mysql_workers=1)
+    files = menu.load_dedup_manifest(str(store), first)['files']
+    assert '/mysql/shop.sql' in files and '/mysql/broken.sql' not in files
+
+    previous = dict(files['/mysql/shop.sql'], sha256='old', chunks=['0' * 64])
+    os.replace(str(store / 'snapshots' / f"{first}.json.gz"), str(store / 'snapshots' / '20000101-000000.json.gz'))
+    with menu.gzip.open(str(store / 'snapshots' / '20000101-000000.json.gz'), 'wt') as f:
+        menu.json.dump({'files': {'/mysql/broken.sql': previous}}, f)
+    second = menu.create_dedup_snapshot(sources=[str(source)], store_dir=str(store), mysql_workers=1)
+    assert menu.load_dedup_manifest(str(store), second)['files']['/mysql/broken.sql'] == previous
@@ -0,0 +1,57 @@
+import os
+
+import menu
+
+NO_RAID = {'stripe_unit': 0, 'stripe_width': 0, 'sector': 512, 'rotational': False}
+RAID = {'stripe_unit': 64 * 1024, 'stripe_width': 256 * 1024, 'sector': 512, 'rotational': True}
+
+
+def write_queue(sys_block, disk, **values):
+    queue = sys_block / disk / 'queue'
+    queue.mkdir(parents=True)
+    for key, value in values.items():
+        (queue / key).write_text(f"{value}\n")
+
+
+def test_alignment_reports_raid_stripe(tmp_path):
+    write_queue(tmp_path, 'md0', logical_block_size=512, minimum_io_size=65536, optimal_io_size=262144, rotational=1)
+    assert menu.read_disk_alignment('md0', str(tmp_path)) == RAID
+
+
+def test_alignment_ignores_plain_disks_and_missing_values(tmp_path):
+    write_queue(tmp_path, 'nvme0n1', logical_block_size=4096, minimum_io_size=4096, optimal_io_size=0, rotational=0)
+    assert menu.read_disk_alignment('nvme0n1', str(tmp_path)) == dict(NO_RAID, sector=4096)
+    assert menu.read_disk_alignment('sdz', str(tmp_path)) == NO_RAID
+
+
+def test_mkfs_ext4_with_stripe_and_fast_commit():
+    command = menu.mkfs_command('ext4', '/dev/md0p1', RAID, fast_commit=True, label='data')
+    assert command == ['mkfs.ext4', '-F', '-b', '4096', '-m', '0',
+                       '-E', 'stride=16,stripe_width=64,lazy_itable_init=0,lazy_journal_init=0',
+                       '-O', 'fast_commit', '-L', 'data', '/dev/md0p1']
+
+
+def test_mkfs_xfs_alignment():
+    assert menu.mkfs_command('xfs', '/dev/md0p1', RAID) == ['mkfs.xfs', '-f', '-d', 'su=65536,sw=4',
+                                                           '-l', 'su=65536', '/dev/md0p1']
+    assert menu.mkfs_command('xfs', '/dev/sdb1', NO_RAID) == ['mkfs.xfs', '-f', '/dev/sdb1']
+
+
+def test_benchmark_disk_on_temp_dir(tmp_path):
+    results = menu.benchmark_disk(str(tmp_path), size_mb=4, duration=0.2, threads=2)
+    assert results['seq_write_mbps'] > 0 and results['seq_read_mbps'] > 0
+    assert results['random_read_iops'] > 0 and results['random_threads'] == 2
+    assert 0 < results['fsync_p50_ms'] <= results['fsync_p99_ms']
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_mount_point_must_be_empty_absolute_and_unmounted(tmp_path):
+    assert menu.mount_point_error('')
+    assert menu.mount_point_error('mnt/datos')
+    assert menu.mount_point_error('/')
+    (tmp_path / 'file').write_text('x')
+    assert menu.mount_point_error(str(tmp_path / 'file'))
+    assert menu.mount_point_error(str(tmp_path))
+    assert menu.mount_point_error(str(tmp_path / 'new' / 'data')) is None
+    (tmp_path / 'empty').mkdir()
+    assert menu.mount_point_error(str(tmp_path / 'empty')) is None
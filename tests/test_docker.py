@@ -0,0 +1,132 @@
+import concurrent.futures
+import http.server
+import json
+import os
+import re
+import socketserver
+import struct
+import threading
+import urllib.parse
+
+import pytest
+
+import menu
+
+
+class DockerStub:
+    def __init__(self):
+        self.containers = {
+            'c2': {'Id': 'c2', 'Names': ['/web'], 'State': 'running', 'Image': 'nginx'},
+            'c1': {'Id': 'c1', 'Names': ['/db'], 'State': 'exited', 'Image': 'mysql'},
+        }
+        self.connections = 0
+        self.actions = []
+        self.lock = threading.Lock()
+
+
+def make_handler(stub):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body=b'', content_type='application/json'):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == '/containers/json':
+                return self.reply(200, list(stub.containers.values()))
+            match = re.match(r'/containers/(\w+)/(stats|logs)$', url.path)
+            if not match or match.group(1) not in stub.containers:
+                return self.reply(404, {'message': 'No such container'})
+            if match.group(2) == 'stats':
+                return self.reply(200, {
+                    'cpu_stats': {'cpu_usage': {'total_usage': 400}, 'system_cpu_usage': 2000, 'online_cpus': 2},
+                    'precpu_stats': {'cpu_usage': {'total_usage': 200}, 'system_cpu_usage': 1000},
+                    'memory_stats': {'usage': 300, 'limit': 1000, 'stats': {'inactive_file': 100}},
+                })
+            frames = b''.join(struct.pack('>BxxxL', stream, len(data)) + data
+                              for stream, data in [(1, b'hola\n'), (2, b'error\n'), (1, b'adios\n')])
+            return self.reply(200, frames, 'application/vnd.docker.raw-stream')
+
+        def do_POST(self):
+            match = re.match(r'/containers/(\w+)/(start|stop|restart)$', self.path)
+            if not match or match.group(1) not in stub.containers:
+                return self.reply(404, {'message': 'No such container'})
+            with stub.lock:
+                stub.actions.append((match.group(1), match.group(2)))
+            self.reply(204)
+
+    return Handler
+
+
+class UnixStubServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        with self.stub.lock:
+            self.stub.connections += 1
+        return request, ('local', 0)
+
+
+@pytest.fixture
+def docker(tmp_path):
+    stub = DockerStub()
+    socket_path = str(tmp_path / 'docker.sock')
+    server = UnixStubServer(socket_path, make_handler(stub))
+    server.stub = stub
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub.socket_path = socket_path
+    yield stub
+    server.shutdown()
+    server.server_close()
+    for connection in menu.docker_connections.__dict__.get('by_socket', {}).values():
+        connection.close()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+
+def test_list_containers_reuses_keep_alive_connection(docker):
+    for _ in range(5):
+        containers = menu.list_docker_containers(True, docker.socket_path)
+    assert [container['Name'] for container in containers] == ['db', 'web']
+    assert docker.connections == 1
+
+
+def test_api_error_raises_oserror_with_daemon_message(docker):
+    with pytest.raises(OSError, match='404 No such container'):
+        menu.docker_api('POST', '/containers/missing/start', socket_path=docker.socket_path)
+
+
+def test_collect_stats_only_for_running_containers(docker):
+    containers = menu.list_docker_containers(True, docker.socket_path)
+    previous = {}
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        stats = menu.collect_docker_stats(executor, containers, previous, docker.socket_path)
+    assert list(stats) == ['c2']
+    assert stats['c2'] == {'cpu': 40.0, 'mem': 200, 'limit': 1000}
+    assert previous['c2']['system_cpu_usage'] == 2000
+
+
+def test_bulk_action_and_selection(docker, capsys):
+    containers = menu.list_docker_containers(True, docker.socket_path)
+    selected = [containers[index] for index in menu.parse_selection('1-2', len(containers))]
+    assert menu.docker_bulk_action('restart', selected, docker.socket_path)
+    assert sorted(docker.actions) == [('c1', 'restart'), ('c2', 'restart')]
+    assert menu.parse_selection('3', 2) is None
+    assert menu.parse_selection('1,2,1', 2) == [0, 1]
+
+
+def test_log_stream_demultiplexes_frames(docker):
+    with menu.docker_stream('/containers/c2/logs', {'stdout': 1, 'stderr': 1}, docker.socket_path) as response:
+        frames = list(menu.iter_docker_log_frames(response, tty=False))
+    assert frames == [(1, b'hola\n'), (2, b'error\n'), (1, b'adios\n')]
@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import menu
+
+
+def response(status_code, body):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = json.dumps(body).encode()
+    result.url = 'http://es.test'
+    return result
+
+
+class StubSession:
+    """Sesión de requests que responde desde un diccionario de rutas"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def request(self, method, url, params=None, json=None, timeout=None):
+        path = url[len('http://es.test'):]
+        self.calls.append((method, path, params))
+        handler = self.routes[(method, path.split('/_')[0] if path.startswith('/logs') else path)]
+        return handler(method, path, params) if callable(handler) else handler
+
+
+def stub_es(routes):
+    return {'url': 'http://es.test', 'session': StubSession(routes)}
+
+
+def test_wait_for_health_treats_408_as_not_ready(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(menu.time, 'sleep', sleeps.append)
+    replies = [
+        response(408, {'status': 'red', 'timed_out': True, 'relocating_shards': 0, 'unassigned_shards': 4}),
+        response(200, {'status': 'yellow', 'timed_out': False, 'relocating_shards': 2}),
+        response(200, {'status': 'green', 'timed_out': False, 'relocating_shards': 0}),
+    ]
+    es = stub_es({('GET', '/_cluster/health'): lambda *args: replies.pop(0)})
+    assert menu.wait_for_es_health(es, 'green', interval=5)['status'] == 'green'
+    assert sleeps == [5, 5]
+
+
+def test_wait_for_health_raises_other_http_errors():
+    es = stub_es({('GET', '/_cluster/health'): response(401, {'error': 'unauthorized'})})
+    try:
+        menu.wait_for_es_health(es)
+    except requests.HTTPError as e:
+        assert e.response.status_code == 401
+    else:
+        raise AssertionError("se esperaba HTTPError")
+
+
+def test_forcemerge_survives_slow_recovery_and_saves_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(menu.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(menu, 'ES_FORCEMERGE_POLL', 0)
+    health = [response(200, {'status': 'green', 'timed_out': False})]
+    health += [response(408, {'status': 'yellow', 'timed_out': True}), response(200, {'status': 'green'})] * 3
+    segments = {'logs-1': 12, 'logs-2': 8, 'logs-3': 6}
+
+    def index_route(method, path, params):
+        name = path.split('/')[1]
+        if method == 'POST':
+            assert params['wait_for_completion'] == 'false'
+            return response(200, {'task': f"n1:{name}"})
+        return response(200, {'_all': {'primaries': {'segments': {'count': segments[name]}}}})
+
+    polls = {}
+
+    def task_route(method, path, params):
+        name = path.split(':')[1]
+        polls[name] = polls.get(name, 0) + 1
+        if polls[name] < 2:
+            return response(200, {'completed': False})
+        segments[name] = 1
+        return response(200, {'completed': True, 'response': {}})
+
+    routes = {('GET', '/_cluster/health'): lambda *args: health.pop(0)}
+    for name in segments:
+        routes[('POST', f"/{name}")] = index_route
+        routes[('GET', f"/{name}")] = index_route
+        routes[('GET', f"/_tasks/n1:{name}")] = task_route
+    es = stub_es(routes)
+    state = {'candidates': [{'index': name, 'segments': count, 'primaries': 1, 'nodes': ['n1']}
+                            for name, count in segments.items()],
+             'done': {'logs-1': {'before': 12, 'after': 1, 'seconds': 1}}, 'read_only': False, 'per_node': 1}
+    state_path = tmp_path / 'state.json'
+
+    menu.run_es_forcemerge(es, state, 1, str(state_path))
+
+    assert set(state['done']) == {'logs-1', 'logs-2', 'logs-3'}
+    assert json.loads(state_path.read_text())['done']['logs-3'] == {'before': 6, 'after': 1, 'seconds': 0.0}
+    merged = [path for method, path, _ in es['session'].calls if method == 'POST']
+    assert merged == ['/logs-2/_forcemerge', '/logs-3/_forcemerge']
+
+
+def test_forcemerge_interrupt_returns_without_waiting_for_merges(monkeypatch, tmp_path):
+    started = threading.Event()
+
+    def task_route(*args):
+        started.set()
+        return response(200, {'completed': False})
+
+    def interrupt(futures, return_when):
+        started.wait(5)
+        raise KeyboardInterrupt
+
+    es = stub_es({('GET', '/_cluster/health'): response(200, {'status': 'green', 'timed_out': False}),
+                  ('POST', '/logs-1'): response(200, {'task': 'n1:1'}),
+                  ('GET', '/_tasks/n1:1'): task_route})
+    monkeypatch.setattr(menu.concurrent.futures, 'wait', interrupt)
+    state = {'candidates': [{'index': 'logs-1', 'segments': 9, 'primaries': 1, 'nodes': ['n1']}],
+             'done': {}, 'read_only': False, 'per_node': 1}
+    began = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        menu.run_es_forcemerge(es, state, 1, str(tmp_path / 'state.json'))
+    assert time.monotonic() - began < menu.ES_FORCEMERGE_POLL / 2
+    assert state['done'] == {}
+
+
+def cluster_state(roles, replicas=1):
+    nodes = [{'name': f"n{idx}", 'node.role': role, 'heap.max': str(8 * 1024 ** 3), 'heap.percent': '50',
+              'cpu': '10', 'disk.used_percent': '40'} for idx, role in enumerate(roles)]
+    indices = [{'index': 'orders', 'pri': '1', 'rep': str(replicas), 'pri.store.size': str(5 * 1024 ** 3),
+                'status': 'open'}]
+    shards = [{'index': 'orders', 'prirep': 'p', 'state': 'STARTED', 'node': 'n0'},
+              {'index': 'orders', 'prirep': 'r', 'state': 'STARTED', 'node': 'n1'}]
+    return {'nodes': nodes, 'indices': indices, 'shards': shards, 'allocation': []}
+
+
+def test_tiered_data_roles_count_as_data_nodes():
+    report = menu.analyze_es_cluster(cluster_state(['hims', 'hs', 'w', 'mr']))
+    assert report['summary']['data_nodes'] == 3
+    assert report['replicas'] == []
+
+
+def test_replicas_beyond_data_nodes_are_flagged():
+    report = menu.analyze_es_cluster(cluster_state(['cdfhilmrstw', 'cdfhilmrstw'], replicas=2))
+    assert [(item['from'], item['to']) for item in report['replicas']] == [(2, 1)]
+
+
+def test_index_family_strips_date_and_rollover_suffixes():
+    assert menu.index_family('logs-app-2026.05.01') == 'logs-app-*'
+    assert menu.index_family('audit-000123') == 'audit-*'
+    assert menu.index_family('orders') == 'orders'
+
+
+def test_es_sysctl_leaves_swappiness_to_later_dropins(tmp_path, monkeypatch):
+    monkeypatch.setattr(menu, 'ES_SYSCTL_DROPIN', str(tmp_path / '90-menu-elasticsearch.conf'))
+    monkeypatch.setattr(menu, 'run_command', lambda command: True)
+    (tmp_path / '10-defaults.conf').write_text('vm.swappiness = 60\n')
+    menu.apply_es_sysctl(str(tmp_path))
+    assert 'vm.swappiness = 1' in (tmp_path / '90-menu-elasticsearch.conf').read_text()
+
+    (tmp_path / '99-zram.conf').write_text('vm.swappiness = 150\n')
+    menu.apply_es_sysctl(str(tmp_path))
+    assert 'swappiness' not in (tmp_path / '90-menu-elasticsearch.conf').read_text()
+    assert menu.sysctl_dropin_values('vm.swappiness', str(tmp_path))[-1] == (str(tmp_path / '99-zram.conf'), '150')
+
+
+def test_service_limits_only_raise_limits_below_minimum(tmp_path, monkeypatch):
+    dropin = tmp_path / 'elasticsearch.service.d' / 'menu-limits.conf'
+    monkeypatch.setattr(menu, 'ES_SERVICE_DROPIN', str(dropin))
+    monkeypatch.setattr(menu, 'run_command', lambda command: True)
+    live = {'LimitNOFILE': 1048576, 'LimitNPROC': 1024}
+    monkeypatch.setattr(menu, 'systemd_limit', lambda service, limit: live[limit])
+    menu.apply_es_service_limits()
+    assert dropin.read_text() == f"[Service]\nLimitMEMLOCK=infinity\nLimitNPROC={menu.ES_MIN_NPROC}\n"
+
+    dropin.write_text("[Service]\nLimitNOFILE=2097152\n")
+    live['LimitNOFILE'] = 2097152
+    menu.apply_es_service_limits()
+    assert 'LimitNOFILE=2097152\n' in dropin.read_text()
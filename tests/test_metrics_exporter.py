@@ -0,0 +1,39 @@
+import threading
+
+import menu
+
+
+def run_sampler(monkeypatch, results):
+    """Ejecuta el muestreador con una muestra por resultado (texto o excepción) y devuelve los cuerpos"""
+    results = iter(results)
+    bodies = []
+    stop_event = threading.Event()
+
+    def build():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    class Cache(dict):
+        def __setitem__(self, key, value):
+            super().__setitem__(key, value)
+            bodies.append(value['plain'].decode())
+            if len(bodies) == 3:
+                stop_event.set()
+
+    monkeypatch.setattr(menu, 'build_prometheus_metrics', build)
+    menu.run_metrics_exporter_sampler(Cache(), stop_event, 0)
+    return bodies
+
+
+def test_sampler_survives_any_exception_and_reports_it(monkeypatch):
+    bodies = run_sampler(monkeypatch, ["menu_up 1\n", KeyError('cpu'), "menu_up 2\n"])
+    assert 'menu_up 1' in bodies[0] and 'menu_exporter_last_sample_ok 1' in bodies[0]
+    assert 'menu_up 1' in bodies[1] and 'menu_exporter_last_sample_ok 0' in bodies[1]
+    assert 'menu_exporter_sample_errors_total 1' in bodies[1]
+    assert 'menu_up 2' in bodies[2] and 'menu_exporter_sample_errors_total 1' in bodies[2]
+
+
+def test_exporter_binds_to_localhost_by_default(tmp_path):
+    assert menu.load_metrics_exporter_config(str(tmp_path / 'missing.json'))['address'] == '127.0.0.1'
@@ -0,0 +1,43 @@
+import gzip
+import os
+
+import pytest
+
+import menu
+
+
+@pytest.fixture
+def mysqldump(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'mysqldump'
+    # Vuelca sus argumentos; la base "broken" escribe parte del dump y falla
+    script.write_text('#!/bin/sh\n'
+                      'echo "-- $*"\n'
+                      'for last; do :; done\n'
+                      'if [ "$last" = broken ]; then echo "partial"; echo "error: lost connection" >&2; exit 2; fi\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+    output_dir = tmp_path / 'dumps'
+    output_dir.mkdir()
+    return output_dir
+
+
+def read_dump(output_dir, name):
+    with gzip.open(str(output_dir / name), 'rt') as f:
+        return f.read()
+
+
+def test_mysql_schema_is_dumped_with_table_locks(mysqldump):
+    assert menu.dump_mysql_database('shop', str(mysqldump))['ok']
+    assert menu.dump_mysql_database('mysql', str(mysqldump))['ok']
+    shop = read_dump(mysqldump, 'shop.sql.gz')
+    system = read_dump(mysqldump, 'mysql.sql.gz')
+    assert '--single-transaction' in shop and '--skip-lock-tables' in shop
+    assert '--lock-tables' in system and '--single-transaction' not in system
+
+
+def test_failed_dump_does_not_leave_a_sql_gz(mysqldump):
+    result = menu.dump_mysql_database('broken', str(mysqldump))
+    assert not result['ok'] and 'lost connection' in result['error'] and result['file'] == ''
+    assert os.listdir(str(mysqldump)) == []
@@ -0,0 +1,14 @@
+import menu
+
+
+def test_detects_mariadb_when_only_mariadbd_is_installed(tmp_path, monkeypatch):
+    mariadbd = tmp_path / 'mariadbd'
+    mariadbd.write_text('#!/bin/sh\necho "mariadbd  Ver 11.4.2-MariaDB-ubu2404 for debian-linux-gnu on x86_64"\n')
+    mariadbd.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert menu.detect_mysql_server() == ('mariadb', (11, 4, 2))
+
+
+def test_no_server_detected_without_binaries(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert menu.detect_mysql_server() is None
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import menu
+
+
+@pytest.fixture
+def nginx(tmp_path, monkeypatch):
+    """nginx falso: `nginx -t` falla si la configuración contiene la palabra 'invalid'"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'nginx'
+    script.write_text('#!/bin/sh\nif grep -q invalid "$3"; then echo "emerg: invalid"; exit 1; fi\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+    reloads = []
+    monkeypatch.setattr(menu, 'run_command', lambda command: reloads.append(command) or True)
+    conf_dir = tmp_path / 'nginx'
+    conf_dir.mkdir()
+    (conf_dir / 'nginx.conf').write_text('events {}\n')
+    return conf_dir, reloads
+
+
+def test_valid_conf_replaces_file_with_backup(nginx):
+    conf_dir, reloads = nginx
+    assert menu.apply_nginx_conf('worker_processes 4;\n', str(conf_dir / 'nginx.conf'))
+    assert (conf_dir / 'nginx.conf').read_text() == 'worker_processes 4;\n'
+    assert [name for name in os.listdir(str(conf_dir)) if name.startswith('nginx.conf.bak-')]
+    assert reloads == ['sudo systemctl reload nginx']
+
+
+def test_invalid_conf_leaves_no_temp_file(nginx):
+    conf_dir, reloads = nginx
+    assert not menu.apply_nginx_conf('invalid;\n', str(conf_dir / 'nginx.conf'))
+    assert os.listdir(str(conf_dir)) == ['nginx.conf'] and reloads == []
+
+
+def test_missing_conf_dir_is_reported_not_raised(nginx, tmp_path):
+    _, reloads = nginx
+    assert not menu.apply_nginx_conf('events {}\n', str(tmp_path / 'missing' / 'nginx.conf'))
+    assert reloads == []
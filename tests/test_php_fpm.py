@@ -0,0 +1,37 @@
+import menu
+
+
+def add_process(proc_dir, pid, ppid, name, cmdline, rss_kb):
+    process_dir = proc_dir / str(pid)
+    process_dir.mkdir()
+    (process_dir / 'status').write_text(f"Name:\t{name}\nPPid:\t{ppid}\nVmRSS:\t{rss_kb} kB\n")
+    (process_dir / 'cmdline').write_bytes(cmdline.encode() + b'\0' * 8)
+
+
+def test_measure_only_counts_workers_of_selected_version_and_pool(tmp_path):
+    add_process(tmp_path, 100, 1, 'php-fpm8.2', 'php-fpm: master process (/etc/php/8.2/fpm/php-fpm.conf)', 30000)
+    add_process(tmp_path, 101, 100, 'php-fpm8.2', 'php-fpm: pool www', 40960)
+    add_process(tmp_path, 102, 100, 'php-fpm8.2', 'php-fpm: pool www', 61440)
+    add_process(tmp_path, 103, 100, 'php-fpm8.2', 'php-fpm: pool api', 204800)
+    add_process(tmp_path, 200, 1, 'php-fpm7.4', 'php-fpm: master process (/etc/php/7.4/fpm/php-fpm.conf)', 30000)
+    add_process(tmp_path, 201, 200, 'php-fpm7.4', 'php-fpm: pool www', 512000)
+    (tmp_path / 'self').mkdir()
+
+    assert sorted(menu.measure_php_fpm_workers('8.2', 'www', str(tmp_path))) == [40.0, 60.0]
+    assert sorted(menu.measure_php_fpm_workers('8.2', None, str(tmp_path))) == [40.0, 60.0, 200.0]
+    assert menu.measure_php_fpm_workers('7.4', 'www', str(tmp_path)) == [500.0]
+
+
+def test_pool_name_is_read_from_section_header():
+    assert menu.php_fpm_pool_name("; comentario\n[api]\nuser = www-data\n") == 'api'
+    assert menu.php_fpm_pool_name("user = www-data\n") is None
+
+
+def test_restore_puts_back_previous_files_and_removes_new_ones(tmp_path):
+    pool = tmp_path / 'www.conf'
+    opcache = tmp_path / '99-menu-opcache.ini'
+    pool.write_text('pm.max_children = 999\n')
+    opcache.write_text('opcache.enable = 1\n')
+    menu.restore_php_fpm_files({str(pool): '[www]\npm.max_children = 5\n', str(opcache): None})
+    assert pool.read_text() == '[www]\npm.max_children = 5\n'
+    assert not opcache.exists()
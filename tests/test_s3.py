@@ -0,0 +1,187 @@
+import hashlib
+import http.server
+import re
+import socketserver
+import threading
+import urllib.parse
+import uuid
+
+import pytest
+import requests
+
+import menu
+
+PAGE_SIZE = 2  # ListParts pagina de 1000 en 1000; el stub usa páginas pequeñas
+
+
+class S3Stub:
+    """Almacén en memoria con el subconjunto de la API S3 que usa offload_to_s3"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.part_puts = []
+        self.aborted = []
+        self.fail_part_after = None
+        self.lock = threading.Lock()
+
+
+def make_handler(stub):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, code, body=b'', headers=None):
+            self.send_response(code)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def parse(self):
+            assert self.headers['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=test/')
+            url = urllib.parse.urlparse(self.path)
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            return urllib.parse.unquote(url.path), dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True)), data
+
+        def do_HEAD(self):
+            path, _, _ = self.parse()
+            if path in stub.objects:
+                self.reply(200, headers={'x-amz-meta-sha256': stub.objects[path][1]})
+            else:
+                self.reply(404)
+
+        def do_PUT(self):
+            path, query, data = self.parse()
+            if 'uploadId' in query:
+                with stub.lock:
+                    if stub.fail_part_after is not None and len(stub.part_puts) >= stub.fail_part_after:
+                        self.reply(500)
+                        return
+                    stub.part_puts.append(int(query['partNumber']))
+                etag = f'"{hashlib.md5(data).hexdigest()}"'
+                stub.uploads[query['uploadId']]['parts'][int(query['partNumber'])] = (data, etag)
+                self.reply(200, headers={'ETag': etag})
+                return
+            stub.objects[path] = (data, self.headers.get('x-amz-meta-sha256'))
+            self.reply(200, headers={'ETag': '"object"'})
+
+        def do_POST(self):
+            path, query, data = self.parse()
+            if 'uploads' in query:
+                upload_id = uuid.uuid4().hex
+                stub.uploads[upload_id] = {'meta': self.headers.get('x-amz-meta-sha256'), 'parts': {}}
+                self.reply(200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>"
+                                f"</InitiateMultipartUploadResult>".encode())
+                return
+            upload = stub.uploads.pop(query['uploadId'])
+            numbers = [int(number) for number in re.findall(rb'<PartNumber>(\d+)</PartNumber>', data)]
+            stub.objects[path] = (b''.join(upload['parts'][number][0] for number in numbers), upload['meta'])
+            self.reply(200, b'<CompleteMultipartUploadResult/>')
+
+        def do_DELETE(self):
+            _, query, _ = self.parse()
+            stub.aborted.append(query['uploadId'])
+            self.reply(204 if stub.uploads.pop(query['uploadId'], None) else 404)
+
+        def do_GET(self):
+            _, query, _ = self.parse()
+            upload = stub.uploads.get(query.get('uploadId'))
+            if not upload:
+                self.reply(404)
+                return
+            marker = int(query.get('part-number-marker', 0))
+            numbers = sorted(number for number in upload['parts'] if number > marker)
+            page, truncated = numbers[:PAGE_SIZE], len(numbers) > PAGE_SIZE
+            parts = ''.join(f"<Part><PartNumber>{number}</PartNumber><ETag>{upload['parts'][number][1]}</ETag></Part>"
+                            for number in page)
+            next_marker = f"<NextPartNumberMarker>{page[-1]}</NextPartNumberMarker>" if page else ''
+            self.reply(200, f'<ListPartsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{next_marker}{parts}"
+                            f"</ListPartsResult>".encode())
+
+    return Handler
+
+
+class StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    monkeypatch.setattr(menu, 'S3_STATE_DIR', str(tmp_path / 'state'))
+    monkeypatch.setattr(menu, 'S3_HASH_CACHE', str(tmp_path / 'hash-cache.json'))
+    stub = S3Stub()
+    server = StubServer(('127.0.0.1', 0), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {'endpoint': f"http://127.0.0.1:{server.server_address[1]}", 'region': 'us-east-1', 'bucket': 'backups',
+              'access_key': 'test', 'secret_key': 'secret', 'part_size': 1024, 'concurrency': 1,
+              'session': requests.Session(), 'stub': stub}
+    yield config
+    server.shutdown()
+    server.server_close()
+
+
+def make_tree(tmp_path):
+    root = tmp_path / 'snapshot'
+    (root / 'etc').mkdir(parents=True)
+    (root / 'etc' / 'hosts').write_bytes(b'127.0.0.1 localhost\n')
+    (root / 'dump.sql').write_bytes(bytes(range(256)) * 28)  # 7168 bytes: 7 partes de 1024
+    return root
+
+
+def test_offload_uploads_and_skips_unchanged(s3, tmp_path):
+    root = make_tree(tmp_path)
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    objects = s3['stub'].objects
+    assert stats['uploaded'] == 2 and stats['errors'] == 0
+    assert objects['/backups/host1/snapshot/dump.sql'][0] == (root / 'dump.sql').read_bytes()
+    assert objects['/backups/host1/snapshot/etc/hosts'][1] == menu.file_digest(str(root / 'etc' / 'hosts'))
+
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    assert stats['uploaded'] == 0 and stats['skipped'] == 2
+
+
+def test_multipart_resume_follows_list_parts_pagination(s3, tmp_path):
+    root = make_tree(tmp_path)
+    s3['stub'].fail_part_after = 5
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    assert stats['errors'] == 1
+
+    s3['stub'].fail_part_after = None
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    assert stats['errors'] == 0
+    assert stats['resumed_parts'] == 5  # tres páginas de ListParts
+    assert s3['stub'].part_puts[5:] == [6, 7]
+    assert s3['stub'].objects['/backups/host1/snapshot/dump.sql'][0] == (root / 'dump.sql').read_bytes()
+
+
+def test_file_vanishing_before_hash_is_skipped(s3, tmp_path, monkeypatch):
+    root = make_tree(tmp_path)
+    original = menu.cached_file_digest
+
+    def vanish(path, cache):
+        if path.endswith('hosts'):
+            (root / 'etc' / 'hosts').unlink()
+        return original(path, cache)
+
+    monkeypatch.setattr(menu, 'cached_file_digest', vanish)
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    assert stats['vanished'] == 1 and stats['uploaded'] == 1 and stats['errors'] == 0
+
+
+def test_stale_upload_is_aborted_before_starting_a_new_one(s3, tmp_path):
+    root = make_tree(tmp_path)
+    s3['stub'].fail_part_after = 3
+    assert menu.offload_to_s3(s3, str(root), 'host1')['errors'] == 1
+    stale = list(s3['stub'].uploads)
+
+    s3['stub'].fail_part_after = None
+    (root / 'dump.sql').write_bytes(bytes(range(256)) * 30)
+    stats = menu.offload_to_s3(s3, str(root), 'host1')
+    assert stats['errors'] == 0 and stats['resumed_parts'] == 0
+    assert s3['stub'].aborted == stale and not s3['stub'].uploads
@@ -0,0 +1,60 @@
+import gzip
+import random
+
+import menu
+
+SLOW_LOG = """/usr/sbin/mysqld, Version: 8.0.36 started with:
+# Time: 2026-10-19T10:00:00.000000Z
+# User@Host: app[app] @ localhost []  Id:    12
+# Query_time: 2.500000  Lock_time: 0.000100 Rows_sent: 1  Rows_examined: 50000
+SET timestamp=1760868000;
+SELECT * FROM orders
+  WHERE customer_id = 42 AND status IN ('paid', 'sent');
+# Time: 2026-10-19T10:00:01.000000Z
+# User@Host: app[app] @ localhost []  Id:    12
+# Query_time: 1.500000  Lock_time: 0.000100 Rows_sent: 1  Rows_examined: 10000
+SET timestamp=1760868001;
+select * from orders where customer_id=7 and status in('new');
+# User@Host: app[app] @ localhost []  Id:    13
+# Query_time: 3.000000  Lock_time: 0.000000 Rows_sent: 0  Rows_examined: 0
+use shop;
+INSERT INTO audit (a, b) VALUES (1, 'x'), (2, 'y');
+"""
+
+
+def test_fingerprint_collapses_literals_lists_and_comments():
+    assert menu.fingerprint_query("SELECT * FROM t WHERE id = 42 AND name = 'O\\'Brien' -- note\n;") == \
+        'select * from t where id = ? and name = ?'
+    assert menu.fingerprint_query('select a from t where id in (1, 2, 3)') == \
+        menu.fingerprint_query('SELECT a FROM t WHERE id IN(7)') == 'select a from t where id in (?+)'
+    assert menu.fingerprint_query("insert into t values (1,'a'),(2,'b')") == 'insert into t values (?+)'
+    assert menu.fingerprint_query("select '/* not a comment */' from t /* hint */") == 'select ? from t'
+    assert menu.fingerprint_query('select 0x1F, 1.5e3 from t') == 'select ?, ? from t'
+
+
+def test_analyze_slow_log_groups_by_fingerprint(tmp_path):
+    current = tmp_path / 'mysql-slow.log'
+    current.write_text(SLOW_LOG)
+    rotated = tmp_path / 'mysql-slow.log.1.gz'
+    with gzip.open(str(rotated), 'wt') as f:
+        f.write(SLOW_LOG)
+    stats, entries, lines = menu.analyze_slow_log([str(rotated), str(current)])
+    assert entries == 6
+    assert lines == 2 * SLOW_LOG.count('\n')
+    select = stats['select * from orders where customer_id = ? and status in (?+)']
+    assert select['count'] == 4
+    assert select['total'] == 8.0
+    assert select['max_rows_examined'] == 50000
+    assert stats['insert into audit (a, b) values (?+)']['count'] == 2
+
+
+def test_sketch_quantile_within_relative_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1.5) for _ in range(20000)]
+    sketch = {}
+    for value in values:
+        menu.sketch_add(sketch, value)
+    values.sort()
+    for quantile in [0.5, 0.95, 0.99]:
+        exact = values[int(quantile * (len(values) - 1))]
+        assert abs(menu.sketch_quantile(sketch, quantile) - exact) / exact <= 0.02
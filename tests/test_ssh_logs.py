@@ -0,0 +1,84 @@
+import os
+from datetime import datetime
+
+import menu
+
+DAY = datetime(2026, 10, 19)
+
+
+def write_log(base_dir, user, name, lines):
+    user_dir = base_dir / user
+    user_dir.mkdir(parents=True, exist_ok=True)
+    path = user_dir / name
+    with open(str(path), 'a') as f:
+        f.write(''.join(lines))
+    return str(path)
+
+
+def command_lines(count, minute_offset=0, command='ls -la /tmp'):
+    return [f"2026-10-19 {10 + (i + minute_offset) // 60:02d}:{(i + minute_offset) % 60:02d}:00 {command} {i}\n"
+            for i in range(count)]
+
+
+def query(base_dir, start='2026-10-19 00:00:00', end='2026-10-19 23:59:59', pattern=None):
+    start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
+    end = datetime.strptime(end, '%Y-%m-%d %H:%M:%S')
+    return [line for _, line in menu.query_ssh_command_logs(start, end, None, pattern, str(base_dir))]
+
+
+def test_query_filters_by_time_and_pattern_in_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(menu, 'SSH_LOG_BLOCK_SIZE', 512)
+    write_log(tmp_path, 'alice', 'ssh_commands_alice_20261019.log', command_lines(120))
+    lines = query(tmp_path, '2026-10-19 10:30:00', '2026-10-19 10:39:59')
+    assert [line.split()[-1] for line in lines] == [str(i) for i in range(30, 40)]
+    assert len(query(tmp_path, pattern=r'ls -la /tmp 11\d$')) == 10
+
+
+def test_whitespace_pattern_does_not_cross_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(menu, 'SSH_LOG_BLOCK_SIZE', 1 << 20)
+    write_log(tmp_path, 'bob', 'ssh_commands_bob_20261019.log',
+              ["2026-10-19 10:00:00 sudo\n", "2026-10-19 10:00:01 reboot\n", "2026-10-19 10:00:02 sudo reboot\n"])
+    # Bloque contenido en el rango y bloque parcial deben dar el mismo resultado
+    assert query(tmp_path, pattern=r'sudo\s+\S*\s*2026') == []
+    assert query(tmp_path, pattern=r'sudo\s+reboot') == ['2026-10-19 10:00:02 sudo reboot']
+    assert query(tmp_path, '2026-10-19 10:00:01', '2026-10-19 10:00:02', pattern=r'sudo\s+reboot') == \
+        ['2026-10-19 10:00:02 sudo reboot']
+
+
+def test_rotation_moves_index_with_the_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(menu, 'SSH_LOG_BLOCK_SIZE', 256)
+    today = datetime.now().strftime('%Y%m%d')
+    stamp = datetime.now().strftime('%Y-%m-%d')
+    name = f"ssh_commands_carol_{today}.log"
+    old = [f"{stamp} 08:00:{i:02d} old-command {i}\n" for i in range(40)]
+    path = write_log(tmp_path, 'carol', name, old)
+    old_index = menu.load_ssh_log_index(path)
+
+    assert menu.rotate_ssh_command_logs(str(tmp_path), max_bytes=100) == (1, 0)
+    rotated = os.path.join(os.path.dirname(path), f"ssh_commands_carol_{today}.1.log")
+    assert menu.load_ssh_log_index(rotated)['blocks'] == old_index['blocks']
+
+    # El log nuevo crece más allá del tamaño indexado antes de la siguiente consulta
+    new = [f"{stamp} 09:00:{i % 60:02d} new-command-with-longer-text {i}\n" for i in range(60)]
+    write_log(tmp_path, 'carol', name, new)
+    start = datetime.strptime(f"{stamp} 00:00:00", '%Y-%m-%d %H:%M:%S')
+    end = datetime.strptime(f"{stamp} 23:59:59", '%Y-%m-%d %H:%M:%S')
+    lines = [line for _, line in menu.query_ssh_command_logs(start, end, ['carol'], 'new-command', str(tmp_path))]
+    assert len(lines) == 60
+
+
+def test_stale_index_from_replaced_file_is_rebuilt(tmp_path):
+    path = write_log(tmp_path, 'dave', 'ssh_commands_dave_20261019.log', command_lines(5))
+    menu.load_ssh_log_index(path)
+    os.remove(path)
+    write_log(tmp_path, 'dave', 'ssh_commands_dave_20261019.log', command_lines(50, 0, 'replaced'))
+    assert len(query(tmp_path, pattern='replaced')) == 50
+
+
+def test_compressed_log_is_queryable_by_member(tmp_path, monkeypatch):
+    monkeypatch.setattr(menu, 'SSH_LOG_BLOCK_SIZE', 512)
+    path = write_log(tmp_path, 'erin', 'ssh_commands_erin_20261019.log', command_lines(120))
+    menu.compress_ssh_log(path)
+    assert not os.path.exists(path)
+    lines = query(tmp_path, '2026-10-19 11:00:00', '2026-10-19 11:09:59')
+    assert [line.split()[-1] for line in lines] == [str(i) for i in range(60, 70)]
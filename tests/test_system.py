@@ -0,0 +1,19 @@
+import menu
+
+
+def test_zram_swappiness_depends_on_kernel_version():
+    assert menu.zram_swappiness('5.4.0-150-generic') == 100
+    assert menu.zram_swappiness('5.8.0') == 150
+    assert menu.zram_swappiness('6.8.0-45-generic') == 150
+    assert menu.zram_swappiness('4.19.0-26-amd64') == 100
+
+
+def test_memory_pressure_report_compares_before_and_after(capsys):
+    before = {'pressure': {'some': {'avg10': 12.5}}, 'MemAvailable': 2048 * 1024, 'SwapTotal': 0, 'SwapFree': 0}
+    after = {'pressure': {'some': {'avg10': 1.25}}, 'MemAvailable': 1900 * 1024,
+             'SwapTotal': 4096 * 1024, 'SwapFree': 4000 * 1024}
+    menu.print_memory_pressure_report(before, after)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['Antes', 'Después']
+    assert 'SwapTotal (MB)' in lines[2] and lines[2].split()[-2:] == ['0', '4096']
+    assert [line.split()[-2:] for line in lines if 'some avg10' in line] == [['12.50', '1.25']]
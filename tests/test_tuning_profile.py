@@ -0,0 +1,33 @@
+import menu
+
+HARDWARE = {'ram_mb': 4096, 'cpus': 2, 'nic_speed_mbps': 1000, 'storage': 'ssd'}
+
+
+def test_elasticsearch_nproc_is_scoped_and_never_lowers_defaults():
+    _, limits = menu.compute_tuning_profile('elasticsearch', HARDWARE)
+    assert ('*', 'nproc', 65535) in limits
+    assert ('elasticsearch', 'nproc', 65535) in limits
+    _, limits = menu.compute_tuning_profile('elasticsearch', dict(HARDWARE, cpus=32))
+    assert ('elasticsearch', 'nproc', 4096 * 32) in limits
+
+
+def test_rollback_restores_legacy_blocks(tmp_path, monkeypatch):
+    sysctl_conf = tmp_path / 'sysctl.conf'
+    limits_conf = tmp_path / 'limits.conf'
+    sysctl_conf.write_text('kernel.panic = 10\n' + menu.LEGACY_SYSCTL_BLOCK)
+    limits_conf.write_text('# sin bloque antiguo\n')
+    monkeypatch.setattr(menu, 'LEGACY_TUNING_FILES', [(str(sysctl_conf), menu.LEGACY_SYSCTL_BLOCK),
+                                                      (str(limits_conf), menu.LEGACY_LIMITS_BLOCK)])
+    monkeypatch.setattr(menu, 'TUNING_SYSCTL_DROPIN', str(tmp_path / '90-menu-tuning.conf'))
+    monkeypatch.setattr(menu, 'TUNING_LIMITS_DROPIN', str(tmp_path / 'limits.d' / '90-menu-tuning.conf'))
+    monkeypatch.setattr(menu, 'TUNING_STATE_DIR', str(tmp_path / 'state'))
+    monkeypatch.setattr(menu, 'TUNING_ROLLBACK_FILE', str(tmp_path / 'state' / 'rollback.json'))
+    monkeypatch.setattr(menu, 'run_command', lambda command: True)
+    monkeypatch.setattr(menu, 'read_live_sysctl', lambda key: None)
+
+    menu.apply_tuning_profile('web', HARDWARE)
+    assert sysctl_conf.read_text() == 'kernel.panic = 10\n'
+    assert menu.rollback_tuning_profile()
+    assert sysctl_conf.read_text() == 'kernel.panic = 10\n' + menu.LEGACY_SYSCTL_BLOCK
+    assert limits_conf.read_text() == '# sin bloque antiguo\n'
+    assert not (tmp_path / '90-menu-tuning.conf').exists()